@@ -1,17 +1,36 @@
 from django.contrib import admin
-from .models import Planilla, Tarifa, Ingreso, Egreso, ControlBoleto
+from .models import (
+    Planilla, Tarifa, Ingreso, Egreso, ControlBoleto, ProcesamientoJob,
+    ResultadoAnalisisCache, ContadorCache, ResultadoCrudo, SubidaReanudable, ResumenDiario, LotePlanillas
+)
 
 
 @admin.register(Planilla)
 class PlanillaAdmin(admin.ModelAdmin):
-    list_display = ['id', 'status', 'fecha_creacion', 'nombre_archivo']
-    list_filter = ['status', 'fecha_creacion']
-    search_fields = ['nombre_archivo', 'error_procesamiento']
-    readonly_fields = ['fecha_creacion', 'fecha_actualizacion', 'tamaño_archivo']
+    list_display = [
+        'id', 'status', 'fecha_creacion', 'numero_planilla', 'fecha_planilla', 'numero_bus', 'nombre_archivo'
+    ]
+    list_filter = ['status', 'fecha_creacion', 'fecha_planilla']
+    search_fields = [
+        'nombre_archivo', 'error_procesamiento', 'numero_planilla', 'numero_bus',
+        'patente_bus', 'codigo_conductor'
+    ]
+    readonly_fields = [
+        'fecha_creacion', 'fecha_actualizacion', 'tamaño_archivo', 'tamaño_original',
+        'tamaño_procesado', 'hash_contenido', 'archivo_bundle'
+    ]
     
     fieldsets = (
         ('Información Principal', {
-            'fields': ('imagen', 'status', 'nombre_archivo', 'tamaño_archivo')
+            'fields': (
+                'imagen', 'status', 'nombre_archivo', 'tamaño_archivo', 'tamaño_original',
+                'tamaño_procesado', 'hash_contenido', 'archivo_bundle'
+            )
+        }),
+        ('Encabezado', {
+            'fields': (
+                'numero_planilla', 'fecha_planilla', 'numero_bus', 'patente_bus', 'codigo_conductor'
+            )
         }),
         ('Procesamiento', {
             'fields': ('datos_extraidos', 'error_procesamiento')
@@ -53,3 +72,60 @@ class ControlBoletoAdmin(admin.ModelAdmin):
     list_filter = ['planilla', 'fecha_creacion']
     search_fields = ['numero_inicial', 'numero_final']
     readonly_fields = ['total_boletos', 'boletos_faltantes', 'fecha_creacion']
+
+
+@admin.register(LotePlanillas)
+class LotePlanillasAdmin(admin.ModelAdmin):
+    list_display = ['id', 'nombre_archivo', 'paginas', 'status', 'fecha_creacion', 'fecha_actualizacion']
+    list_filter = ['status', 'fecha_creacion']
+    search_fields = ['nombre_archivo', 'error_procesamiento']
+    readonly_fields = ['paginas', 'fecha_creacion', 'fecha_actualizacion']
+
+
+@admin.register(ProcesamientoJob)
+class ProcesamientoJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'planilla', 'lote', 'estado', 'intentos', 'worker', 'fecha_creacion', 'fecha_fin']
+    list_filter = ['estado', 'fecha_creacion']
+    search_fields = ['worker', 'error']
+    readonly_fields = ['fecha_creacion', 'fecha_inicio', 'fecha_fin']
+
+
+@admin.register(ResultadoAnalisisCache)
+class ResultadoAnalisisCacheAdmin(admin.ModelAdmin):
+    list_display = ['hash_contenido', 'model_id', 'hits', 'fecha_creacion', 'ultimo_uso']
+    list_filter = ['model_id']
+    search_fields = ['hash_contenido']
+    readonly_fields = ['fecha_creacion', 'ultimo_uso', 'hits']
+
+
+@admin.register(ContadorCache)
+class ContadorCacheAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'valor']
+
+
+@admin.register(ResultadoCrudo)
+class ResultadoCrudoAdmin(admin.ModelAdmin):
+    list_display = ['planilla', 'model_id', 'tamaño_original', 'fecha_creacion']
+    list_filter = ['model_id']
+    # El contenido comprimido no se muestra
+    fields = ['planilla', 'model_id', 'tamaño_original', 'fecha_creacion']
+    readonly_fields = fields
+
+
+@admin.register(SubidaReanudable)
+class SubidaReanudableAdmin(admin.ModelAdmin):
+    list_display = ['id', 'nombre_archivo', 'tamaño_total', 'estado', 'planilla', 'fecha_actualizacion']
+    list_filter = ['estado', 'fecha_creacion']
+    search_fields = ['nombre_archivo', 'sha256']
+    readonly_fields = ['fecha_creacion', 'fecha_actualizacion']
+
+
+@admin.register(ResumenDiario)
+class ResumenDiarioAdmin(admin.ModelAdmin):
+    list_display = [
+        'fecha', 'numero_bus', 'codigo_conductor', 'ciudad_origen', 'ciudad_retorno',
+        'planillas', 'total_ingresos', 'total_egresos'
+    ]
+    list_filter = ['fecha']
+    search_fields = ['numero_bus', 'codigo_conductor', 'ciudad_origen', 'ciudad_retorno']
+    readonly_fields = ['fecha_actualizacion']
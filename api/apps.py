@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .metricas import instalar_medicion_sql
+
+        connection_created.connect(instalar_medicion_sql, dispatch_uid='api.metricas.sql')
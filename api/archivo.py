@@ -0,0 +1,192 @@
+"""
+Archivo en frío de las imágenes de planillas.
+
+Las imágenes de planillas completadas hace más de ARCHIVO_DIAS se mueven a
+bundles zip en MEDIA_ROOT/archivo/ y se borran del directorio caliente. La
+planilla guarda el bundle en archivo_bundle y conserva el nombre de la
+imagen, que es también el nombre del miembro dentro del zip, así se puede
+servir sin extraerla o restaurarla si hay que volver a procesarla.
+"""
+
+import logging
+import os
+import uuid
+import zipfile
+from datetime import timedelta
+from typing import BinaryIO, Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Planilla
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_ARCHIVO = 'archivo'
+
+
+def ruta_bundle(bundle: str) -> str:
+    return os.path.join(settings.MEDIA_ROOT, bundle)
+
+
+def abrir_imagen(planilla) -> Optional[BinaryIO]:
+    """
+    Abrir la imagen de la planilla desde el directorio caliente o, si fue
+    archivada, desde su bundle.
+
+    Returns:
+        Archivo binario abierto (el llamador lo cierra), o None si no hay imagen
+    """
+    if not planilla.imagen:
+        return None
+    ruta = planilla.imagen.path
+    if os.path.exists(ruta):
+        return open(ruta, 'rb')
+    if not planilla.archivo_bundle:
+        return None
+    try:
+        with zipfile.ZipFile(ruta_bundle(planilla.archivo_bundle)) as bundle:
+            # El miembro abierto mantiene su propia referencia al zip
+            return bundle.open(planilla.imagen.name)
+    except (FileNotFoundError, KeyError):
+        logger.error("Imagen %s no encontrada en el bundle %s", planilla.imagen.name, planilla.archivo_bundle)
+        return None
+
+
+def _candidatas(dias: int) -> Q:
+    limite = timezone.now() - timedelta(days=dias)
+    return Q(status='completed', fecha_actualizacion__lt=limite, archivo_bundle__isnull=True)
+
+
+def _nombres_archivables(dias: int) -> List[str]:
+    """
+    Imágenes cuyas planillas son todas archivables. Con almacenamiento por
+    contenido varias planillas pueden compartir un archivo: si alguna sigue
+    activa la imagen se queda en el directorio caliente.
+    """
+    filtro = _candidatas(dias)
+    nombres = set(
+        Planilla.objects.filter(filtro).exclude(imagen='').values_list('imagen', flat=True)
+    )
+    activos = set(
+        Planilla.objects
+        .filter(imagen__in=nombres, archivo_bundle__isnull=True)
+        .exclude(filtro)
+        .values_list('imagen', flat=True)
+    )
+    return sorted(nombres - activos)
+
+
+def _escribir_bundle(nombres: List[str]) -> Optional[str]:
+    """Escribir un bundle con las imágenes presentes en disco; retorna su nombre relativo"""
+    directorio = os.path.join(settings.MEDIA_ROOT, DIRECTORIO_ARCHIVO)
+    os.makedirs(directorio, exist_ok=True)
+    bundle = f"{DIRECTORIO_ARCHIVO}/{timezone.now().strftime('%Y%m%dT%H%M%S%f')}.zip"
+    destino = ruta_bundle(bundle)
+    temporal = f'{destino}.tmp'
+
+    escritos = 0
+    with zipfile.ZipFile(temporal, 'w', compression=zipfile.ZIP_DEFLATED) as archivo:
+        for nombre in nombres:
+            ruta = os.path.join(settings.MEDIA_ROOT, nombre)
+            if not os.path.exists(ruta):
+                logger.warning("Imagen %s no existe, no se archiva", nombre)
+                continue
+            archivo.write(ruta, arcname=nombre)
+            escritos += 1
+
+    if not escritos:
+        os.remove(temporal)
+        return None
+    os.replace(temporal, destino)
+    return bundle
+
+
+def archivar_planillas(dias: Optional[int] = None, max_por_bundle: Optional[int] = None) -> Dict[str, int]:
+    """
+    Mover a bundles zip las imágenes de planillas completadas hace más de
+    `dias` días.
+
+    El bundle se escribe completo antes de marcar las planillas; las
+    imágenes calientes se borran solo después de confirmar la transacción.
+
+    Returns:
+        Dict con 'bundles', 'imagenes' y 'planillas' archivadas
+    """
+    dias = settings.ARCHIVO_DIAS if dias is None else dias
+    max_por_bundle = max_por_bundle or settings.ARCHIVO_MAX_POR_BUNDLE
+    nombres = _nombres_archivables(dias)
+
+    totales = {'bundles': 0, 'imagenes': 0, 'planillas': 0}
+    for inicio in range(0, len(nombres), max_por_bundle):
+        lote = nombres[inicio:inicio + max_por_bundle]
+        bundle = _escribir_bundle(lote)
+        if bundle is None:
+            continue
+        with zipfile.ZipFile(ruta_bundle(bundle)) as archivo:
+            archivados = archivo.namelist()
+
+        with transaction.atomic():
+            # update() no toca fecha_actualizacion: archivar no es un cambio de la planilla
+            planillas = Planilla.objects.filter(imagen__in=archivados, archivo_bundle__isnull=True).update(
+                archivo_bundle=bundle
+            )
+        for nombre in archivados:
+            # Una subida idéntica o una restauración pudo volver a usar la imagen caliente
+            if Planilla.objects.filter(imagen=nombre, archivo_bundle__isnull=True).exists():
+                logger.info("Imagen %s en uso fuera del bundle, no se borra", nombre)
+                continue
+            try:
+                os.remove(os.path.join(settings.MEDIA_ROOT, nombre))
+            except FileNotFoundError:
+                pass
+
+        totales['bundles'] += 1
+        totales['imagenes'] += len(archivados)
+        totales['planillas'] += planillas
+        logger.info("Bundle %s: %s imágenes de %s planillas", bundle, len(archivados), planillas)
+    return totales
+
+
+def restaurar_imagen(planilla) -> None:
+    """
+    Devolver al directorio caliente la imagen archivada de una planilla
+    (para re-procesarla). Se restaura para todas las planillas que la
+    comparten y el bundle se borra cuando ya no lo referencia ninguna.
+    """
+    bundle = planilla.archivo_bundle
+    if not bundle:
+        return
+    nombre = planilla.imagen.name
+    destino = planilla.imagen.path
+    if not os.path.exists(destino):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        # Un nombre por restauración: dos hilos del mismo proceso no comparten el temporal
+        temporal = f'{destino}.{uuid.uuid4().hex}.tmp'
+        try:
+            with zipfile.ZipFile(ruta_bundle(bundle)) as archivo, archivo.open(nombre) as origen:
+                with open(temporal, 'wb') as copia:
+                    while True:
+                        bloque = origen.read(1024 * 1024)
+                        if not bloque:
+                            break
+                        copia.write(bloque)
+            os.replace(temporal, destino)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    Planilla.objects.filter(imagen=nombre, archivo_bundle=bundle).update(archivo_bundle=None)
+    planilla.archivo_bundle = None
+    if not Planilla.objects.filter(archivo_bundle=bundle).exists():
+        try:
+            os.remove(ruta_bundle(bundle))
+        except FileNotFoundError:
+            # Otra restauración en paralelo ya lo eliminó
+            pass
+        else:
+            logger.info("Bundle %s vacío, eliminado", bundle)
+    logger.info("Imagen de planilla %s restaurada desde %s", planilla.pk, bundle)
@@ -0,0 +1,160 @@
+"""
+Cache de resultados de Azure Form Recognizer deduplicado por contenido.
+
+La clave es (SHA-256 de la imagen, model_id): si un conductor vuelve a
+subir la misma planilla se reutilizan los datos extraídos sin volver a
+llamar a Azure. Las entradas expiran por antigüedad y, si se supera el
+máximo configurado, se eliminan las menos usadas recientemente.
+
+Los aciertos y fallos se cuentan en ContadorCache, así las estadísticas
+suman las consultas de la API y de los workers de la cola.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ContadorCache, ResultadoAnalisisCache
+
+logger = logging.getLogger(__name__)
+
+
+class CacheResultados:
+    """
+    Cache de resultados respaldado por la tabla ResultadoAnalisisCache,
+    con los contadores de aciertos y fallos en ContadorCache.
+    """
+
+    # Cada cuántas escrituras se aplica la política de expulsión
+    PURGAR_CADA = 50
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._escrituras = 0
+
+    @property
+    def max_entradas(self) -> int:
+        return settings.CACHE_RESULTADOS_MAX_ENTRADAS
+
+    @property
+    def max_dias(self) -> int:
+        return settings.CACHE_RESULTADOS_MAX_DIAS
+
+    @staticmethod
+    def _contar(hit: bool) -> None:
+        nombre = 'hits' if hit else 'misses'
+        if ContadorCache.objects.filter(nombre=nombre).update(valor=F('valor') + 1):
+            return
+        try:
+            with transaction.atomic():
+                ContadorCache.objects.create(nombre=nombre, valor=1)
+        except IntegrityError:
+            # Otro proceso creó el contador primero
+            ContadorCache.objects.filter(nombre=nombre).update(valor=F('valor') + 1)
+
+    def obtener(self, hash_contenido: Optional[str], model_id: str,
+                contar: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Buscar un resultado previo para la imagen y el modelo.
+
+        Args:
+            contar: Contar el fallo en las estadísticas. La API lo omite al
+                consultar antes de encolar: el worker vuelve a consultar y
+                cuenta ese mismo fallo
+
+        Returns:
+            Los datos extraídos en cache, o None si no hay un resultado vigente
+        """
+        if not hash_contenido:
+            return None
+
+        limite = timezone.now() - timedelta(days=self.max_dias)
+        entrada = (
+            ResultadoAnalisisCache.objects
+            .filter(hash_contenido=hash_contenido, model_id=model_id, fecha_creacion__gte=limite)
+            .only('id', 'datos_extraidos')
+            .first()
+        )
+        if entrada is None:
+            if contar:
+                self._contar(hit=False)
+            return None
+
+        ResultadoAnalisisCache.objects.filter(pk=entrada.pk).update(
+            hits=F('hits') + 1,
+            ultimo_uso=timezone.now()
+        )
+        self._contar(hit=True)
+        logger.info("Resultado en cache reutilizado para %s", hash_contenido[:12])
+        return entrada.datos_extraidos
+
+    def guardar(self, hash_contenido: Optional[str], model_id: str, datos: Dict[str, Any]) -> None:
+        """Guardar (o reemplazar) el resultado de un análisis exitoso"""
+        if not hash_contenido:
+            return
+
+        ResultadoAnalisisCache.objects.update_or_create(
+            hash_contenido=hash_contenido,
+            model_id=model_id,
+            defaults={
+                'datos_extraidos': datos,
+                'fecha_creacion': timezone.now(),
+                'ultimo_uso': timezone.now(),
+            }
+        )
+
+        with self._lock:
+            self._escrituras += 1
+            purgar = self._escrituras % self.PURGAR_CADA == 0
+        if purgar:
+            self.purgar()
+
+    def purgar(self) -> int:
+        """
+        Aplicar la política de expulsión: eliminar entradas más antiguas que
+        CACHE_RESULTADOS_MAX_DIAS y luego las menos usadas recientemente
+        hasta quedar en CACHE_RESULTADOS_MAX_ENTRADAS.
+
+        Returns:
+            Cantidad de entradas eliminadas
+        """
+        limite = timezone.now() - timedelta(days=self.max_dias)
+        eliminadas, _ = ResultadoAnalisisCache.objects.filter(fecha_creacion__lt=limite).delete()
+
+        sobrantes = ResultadoAnalisisCache.objects.count() - self.max_entradas
+        if sobrantes > 0:
+            ids = list(
+                ResultadoAnalisisCache.objects
+                .order_by('ultimo_uso')
+                .values_list('id', flat=True)[:sobrantes]
+            )
+            borradas, _ = ResultadoAnalisisCache.objects.filter(id__in=ids).delete()
+            eliminadas += borradas
+
+        if eliminadas:
+            logger.info("Cache de resultados: %s entradas expulsadas", eliminadas)
+        return eliminadas
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Contadores de aciertos/fallos de todos los procesos y tamaño de la cache"""
+        contadores = dict(ContadorCache.objects.values_list('nombre', 'valor'))
+        hits, misses = contadores.get('hits', 0), contadores.get('misses', 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else 0.0,
+            'entradas': ResultadoAnalisisCache.objects.count(),
+            'max_entradas': self.max_entradas,
+            'max_dias': self.max_dias,
+        }
+
+
+# Instancia global de la cache
+resultado_cache = CacheResultados()
@@ -0,0 +1,132 @@
+"""
+Exportación en streaming de planillas y sus líneas (CSV o NDJSON).
+
+Las planillas se leen por bloques con iterator(chunk_size) y sus tarifas,
+ingresos, egresos y controles de boletos se precargan por bloque (una
+consulta por relación y bloque), así la memoria no crece con el tamaño de
+la exportación y no hay N+1.
+"""
+
+import csv
+import json
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch, Q
+
+from .models import ControlBoleto, Egreso, Ingreso, Planilla, Tarifa
+
+FORMATOS = ('csv', 'ndjson')
+
+CAMPOS_PLANILLA = [
+    'id', 'status', 'fecha_creacion', 'numero_planilla', 'fecha_planilla', 'numero_bus',
+    'patente_bus', 'codigo_conductor', 'ciudad_origen', 'ciudad_retorno',
+]
+
+# Columnas de línea en el CSV; cada tipo llena las que le corresponden
+CAMPOS_LINEA = [
+    'tipo', 'concepto', 'precio', 'cantidad', 'subtotal', 'monto', 'observaciones',
+    'numero_inicial', 'numero_final', 'cantidad_vendidos', 'cantidad_devueltos',
+    'cantidad_anulados', 'total_boletos', 'boletos_faltantes',
+]
+
+# Relación -> (tipo en la exportación, modelo, campos exportados)
+RELACIONES = {
+    'tarifas': ('tarifa', Tarifa, ['concepto', 'precio', 'cantidad', 'subtotal']),
+    'ingresos': ('ingreso', Ingreso, ['concepto', 'monto', 'observaciones']),
+    'egresos': ('egreso', Egreso, ['concepto', 'monto', 'observaciones']),
+    'control_boletos': ('control_boleto', ControlBoleto, [
+        'numero_inicial', 'numero_final', 'cantidad_vendidos', 'cantidad_devueltos',
+        'cantidad_anulados', 'total_boletos', 'boletos_faltantes'
+    ]),
+}
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: retorna la línea en lugar de guardarla"""
+
+    def write(self, valor):
+        return valor
+
+
+def planillas_para_exportar(desde: Optional[date] = None, hasta: Optional[date] = None):
+    """
+    Planillas del rango de fechas (fecha de la planilla o, si no se leyó,
+    de creación) con sus líneas precargadas y sin la columna JSON.
+    """
+    filtro = Q()
+    if desde:
+        filtro &= Q(fecha_planilla__gte=desde) | Q(fecha_planilla__isnull=True, fecha_creacion__date__gte=desde)
+    if hasta:
+        filtro &= Q(fecha_planilla__lte=hasta) | Q(fecha_planilla__isnull=True, fecha_creacion__date__lte=hasta)
+
+    prefetch = [
+        Prefetch(relacion, queryset=modelo.objects.only('planilla_id', *campos).order_by('id'))
+        for relacion, (_, modelo, campos) in RELACIONES.items()
+    ]
+    return (
+        Planilla.objects
+        .filter(filtro)
+        .only(*CAMPOS_PLANILLA)
+        .order_by('fecha_creacion', 'id')
+        .prefetch_related(*prefetch)
+    )
+
+
+def _iterar(desde: Optional[date], hasta: Optional[date]) -> Iterator[Planilla]:
+    return planillas_para_exportar(desde, hasta).iterator(chunk_size=settings.EXPORTACION_CHUNK_SIZE)
+
+
+def _valor_csv(valor: Any) -> Any:
+    if valor is None:
+        return ''
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+
+def _lineas(planilla: Planilla) -> List[Dict[str, Any]]:
+    lineas = []
+    for relacion, (tipo, _, campos) in RELACIONES.items():
+        for item in getattr(planilla, relacion).all():
+            lineas.append({'tipo': tipo, **{c: getattr(item, c) for c in campos}})
+    return lineas
+
+
+def exportar_csv(desde: Optional[date] = None, hasta: Optional[date] = None) -> Iterator[str]:
+    """
+    Filas CSV: una por línea (tarifa, ingreso, egreso o control de boletos)
+    con las columnas de la planilla repetidas. Una planilla sin líneas
+    produce una sola fila con 'tipo' vacío.
+    """
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow([f'planilla_{c}' if c == 'id' else c for c in CAMPOS_PLANILLA] + CAMPOS_LINEA)
+    for planilla in _iterar(desde, hasta):
+        cabecera = [_valor_csv(getattr(planilla, c)) for c in CAMPOS_PLANILLA]
+        lineas = _lineas(planilla) or [{}]
+        for linea in lineas:
+            yield escritor.writerow(cabecera + [_valor_csv(linea.get(c)) for c in CAMPOS_LINEA])
+
+
+class _EncoderExportacion(DjangoJSONEncoder):
+    """Montos como número en lugar de string"""
+
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return super().default(o)
+
+
+def exportar_ndjson(desde: Optional[date] = None, hasta: Optional[date] = None) -> Iterator[str]:
+    """Un objeto JSON por línea y planilla, con sus líneas anidadas por tipo"""
+    for planilla in _iterar(desde, hasta):
+        objeto = {c: getattr(planilla, c) for c in CAMPOS_PLANILLA}
+        for relacion, (_, _, campos) in RELACIONES.items():
+            objeto[relacion] = [
+                {c: getattr(item, c) for c in campos}
+                for item in getattr(planilla, relacion).all()
+            ]
+        yield json.dumps(objeto, cls=_EncoderExportacion, ensure_ascii=False) + '\n'
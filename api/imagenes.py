@@ -0,0 +1,352 @@
+"""
+Pre-procesamiento de imágenes de planillas antes del OCR.
+
+Las fotos de los teléfonos llegan con 3-8 MB. Antes de enviarlas a Azure
+se orientan según EXIF, se reducen a un lado máximo / DPI objetivo, se
+pasan a escala de grises y se re-codifican optimizadas. El trabajo se
+ejecuta en un pool de procesos para no ocupar los hilos de las peticiones.
+
+Las funciones que corren en el pool no usan el ORM: los procesos hijos se
+crean con 'spawn' y no tienen Django configurado.
+
+Cada planilla se pre-procesa una sola vez aunque lo pidan la subida (en
+segundo plano) y el worker a la vez: quien lo empieza lo reclama con un
+UPDATE condicional que registra preprocesamiento_reclamado, y el resto
+espera a que aparezca tamaño_procesado (ver preprocesar_planilla). Un
+reclamo de más de PREPROCESAMIENTO_ESPERA segundos se da por perdido (el
+proceso que lo tomó murió) y otra corrida puede tomarlo.
+
+La imagen procesada se guarda como un archivo nuevo y las planillas que
+usaban el original pasan a ella; con almacenamiento por contenido el
+nombre de cada archivo sigue siendo el hash de su contenido. Una
+re-subida idéntica reutiliza la imagen ya procesada.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Campos que se releen para saber si la planilla ya se pre-procesó
+CAMPOS_PREPROCESAMIENTO = ['imagen', 'tamaño_original', 'tamaño_procesado', 'preprocesamiento_reclamado']
+
+
+def preprocesar_imagen(ruta: str, temporal: str, lado_maximo: int, dpi_objetivo: int,
+                       calidad: int) -> Dict[str, Any]:
+    """
+    Orientar, reducir, pasar a grises y re-codificar una imagen en disco.
+
+    El original no se modifica: el resultado se escribe en `temporal` y se
+    conserva solo si es más liviano (o si el original no era JPEG ni PNG).
+    Los PNG se mantienen como PNG; el resto se guarda como JPEG.
+    registrar_preprocesamiento lo mueve a su propio nombre en el storage.
+
+    Args:
+        ruta: Ruta absoluta de la imagen
+        temporal: Ruta donde escribir el resultado (exclusiva de esta corrida)
+        lado_maximo: Largo máximo del lado mayor en píxeles
+        dpi_objetivo: DPI máximo; imágenes con más DPI se reducen en proporción
+        calidad: Calidad JPEG (1-95)
+
+    Returns:
+        Dict con 'tamaño_original' y 'tamaño_procesado'; si se conserva el
+        resultado también 'temporal', 'extension' y 'sha256'
+    """
+    tamaño_original = os.path.getsize(ruta)
+
+    with Image.open(ruta) as original:
+        formato = original.format
+        dpi = original.info.get('dpi', (0, 0))[0] or 0
+        imagen = ImageOps.exif_transpose(original)
+
+        # Reducir por DPI y por lado máximo (thumbnail nunca agranda)
+        escala = min(1.0, dpi_objetivo / dpi) if dpi else 1.0
+        limite = min(lado_maximo, int(max(imagen.size) * escala))
+        imagen.thumbnail((limite, limite), Image.LANCZOS)
+        imagen = imagen.convert('L')
+
+        if formato == 'PNG':
+            extension = '.png'
+            opciones = {'format': 'PNG', 'optimize': True}
+        else:
+            extension = '.jpg'
+            opciones = {'format': 'JPEG', 'quality': calidad, 'optimize': True, 'progressive': True}
+        try:
+            imagen.save(temporal, dpi=(min(dpi or dpi_objetivo, dpi_objetivo),) * 2, **opciones)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    tamaño_procesado = os.path.getsize(temporal)
+    if tamaño_procesado >= tamaño_original and formato in ('JPEG', 'PNG'):
+        # No se ganó nada: conservar el original
+        os.remove(temporal)
+        return {'tamaño_original': tamaño_original, 'tamaño_procesado': tamaño_original}
+
+    sha256 = hashlib.sha256()
+    with open(temporal, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(bloque)
+    return {
+        'tamaño_original': tamaño_original,
+        'tamaño_procesado': tamaño_procesado,
+        'temporal': temporal,
+        'extension': extension,
+        'sha256': sha256.hexdigest(),
+    }
+
+
+def obtener_pool(reiniciar: bool = False) -> ProcessPoolExecutor:
+    """Obtener el pool de procesos de pre-procesamiento, creándolo al primer uso"""
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if reiniciar and _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PREPROCESAMIENTO_PROCESOS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def enviar_preprocesamiento(planilla) -> Future:
+    """
+    Enviar la imagen de una planilla al pool de procesos.
+
+    Returns:
+        Future que resuelve al dict de preprocesar_imagen
+    """
+    argumentos = (
+        planilla.imagen.path,
+        _campo_imagen().storage.ruta_temporal(),
+        settings.PREPROCESAMIENTO_LADO_MAXIMO,
+        settings.PREPROCESAMIENTO_DPI,
+        settings.PREPROCESAMIENTO_CALIDAD_JPEG
+    )
+    try:
+        return obtener_pool().submit(preprocesar_imagen, *argumentos)
+    except BrokenProcessPool:
+        # Un proceso hijo murió: recrear el pool y reintentar una vez
+        logger.warning("Pool de pre-procesamiento roto, recreándolo")
+        return obtener_pool(reiniciar=True).submit(preprocesar_imagen, *argumentos)
+
+
+def _campo_imagen():
+    from .models import Planilla
+
+    return Planilla._meta.get_field('imagen')
+
+
+def _descartar_si_libre(nombre: str) -> None:
+    """Borrar una imagen reemplazada si ya ninguna planilla la usa"""
+    from .models import Planilla
+
+    if not Planilla.objects.filter(imagen=nombre).exists():
+        _campo_imagen().storage.delete(nombre)
+
+
+def registrar_preprocesamiento(planilla, resultado: Dict[str, Any]) -> None:
+    """
+    Guardar el resultado del pre-procesamiento.
+
+    La imagen procesada se mueve a un nombre propio del storage (con
+    almacenamiento por contenido, el de su propio hash): un archivo nunca se
+    modifica en el lugar. Todas las planillas que compartían el original
+    pasan a la imagen procesada y el original se borra si ya nadie lo usa.
+    """
+    from django.db.models import Q
+
+    from .models import Planilla
+
+    campo = _campo_imagen()
+    nombre_anterior = planilla.imagen.name
+    nombre = nombre_anterior
+    if resultado.get('temporal'):
+        base = os.path.splitext(os.path.basename(nombre_anterior))[0]
+        nombre, _, _ = campo.storage.mover_archivo(
+            resultado['temporal'], campo.generate_filename(None, base + resultado['extension']),
+            resultado['sha256'], max_length=campo.max_length
+        )
+
+    planilla.imagen.name = nombre
+    planilla.tamaño_original = resultado['tamaño_original']
+    planilla.tamaño_procesado = resultado['tamaño_procesado']
+    planilla.preprocesamiento_reclamado = None
+    Planilla.objects.filter(Q(pk=planilla.pk) | Q(imagen=nombre_anterior)).update(
+        imagen=nombre,
+        tamaño_original=planilla.tamaño_original,
+        tamaño_procesado=planilla.tamaño_procesado,
+        preprocesamiento_reclamado=None
+    )
+    if nombre != nombre_anterior:
+        _descartar_si_libre(nombre_anterior)
+    logger.info(
+        "Planilla %s pre-procesada: %s -> %s bytes",
+        planilla.pk, planilla.tamaño_original, planilla.tamaño_procesado
+    )
+
+
+def adoptar_preprocesamiento(planilla) -> bool:
+    """
+    Reutilizar la imagen procesada de otra planilla con el mismo contenido
+    subido (una re-subida idéntica), sin volver a re-codificarla.
+
+    Returns:
+        True si la planilla quedó pre-procesada
+    """
+    from .models import Planilla
+
+    if not planilla.hash_contenido:
+        return False
+    origen = (
+        Planilla.objects
+        .filter(hash_contenido=planilla.hash_contenido, tamaño_procesado__isnull=False)
+        .exclude(pk=planilla.pk)
+        .values('imagen', 'tamaño_original', 'tamaño_procesado', 'archivo_bundle')
+        .first()
+    )
+    if origen is None:
+        return False
+    nombre_anterior = planilla.imagen.name
+    if not Planilla.objects.filter(pk=planilla.pk, tamaño_procesado__isnull=True).update(**origen):
+        planilla.refresh_from_db(fields=['imagen', 'tamaño_original', 'tamaño_procesado', 'archivo_bundle'])
+        return planilla.tamaño_procesado is not None
+    planilla.imagen.name = origen['imagen']
+    planilla.tamaño_original = origen['tamaño_original']
+    planilla.tamaño_procesado = origen['tamaño_procesado']
+    planilla.archivo_bundle = origen['archivo_bundle']
+    if nombre_anterior != origen['imagen']:
+        _descartar_si_libre(nombre_anterior)
+    logger.info("Planilla %s reutiliza la imagen pre-procesada %s", planilla.pk, origen['imagen'])
+    return True
+
+
+def reclamar_preprocesamiento(planilla) -> bool:
+    """
+    Reclamar el pre-procesamiento de una planilla con un UPDATE condicional:
+    solo una corrida encuentra la planilla sin reclamo vigente y lo registra.
+
+    Returns:
+        True si la corrida que llama debe pre-procesar la imagen
+    """
+    from datetime import timedelta
+
+    from django.db.models import Q
+    from django.utils import timezone
+
+    from .models import Planilla
+
+    ahora = timezone.now()
+    vencido = ahora - timedelta(seconds=settings.PREPROCESAMIENTO_ESPERA)
+    libre = Q(preprocesamiento_reclamado__isnull=True) | Q(preprocesamiento_reclamado__lt=vencido)
+    reclamada = Planilla.objects.filter(libre, pk=planilla.pk, tamaño_procesado__isnull=True).update(
+        preprocesamiento_reclamado=ahora
+    )
+    if reclamada:
+        planilla.preprocesamiento_reclamado = ahora
+    return bool(reclamada)
+
+
+def liberar_preprocesamiento(planilla) -> None:
+    """Devolver el reclamo de una corrida que falló, para que otra lo reintente"""
+    from .models import Planilla
+
+    Planilla.objects.filter(
+        pk=planilla.pk, tamaño_procesado__isnull=True, preprocesamiento_reclamado=planilla.preprocesamiento_reclamado
+    ).update(preprocesamiento_reclamado=None)
+
+
+def esperar_preprocesamiento(planilla, segundos: float) -> bool:
+    """
+    Esperar a que otra corrida termine de pre-procesar la planilla.
+
+    Returns:
+        True si terminó dentro del plazo (la planilla queda actualizada)
+    """
+    limite = time.monotonic() + segundos
+    while True:
+        planilla.refresh_from_db(fields=CAMPOS_PREPROCESAMIENTO)
+        if planilla.tamaño_procesado is not None:
+            return True
+        if planilla.preprocesamiento_reclamado is None or time.monotonic() >= limite:
+            # La otra corrida falló y liberó el reclamo, o no terminó a tiempo
+            return False
+        time.sleep(0.1)
+
+
+def preprocesar_planilla(planilla) -> None:
+    """
+    Pre-procesar la imagen de una planilla esperando el resultado.
+    Usado por el worker antes del análisis si aún no se pre-procesó.
+
+    Si el pre-procesamiento programado al subir sigue en curso se espera
+    hasta PREPROCESAMIENTO_ESPERA segundos en vez de empezar otro; pasado
+    ese plazo (la corrida se perdió) se pre-procesa aquí.
+    """
+    if not settings.PREPROCESAMIENTO_ACTIVO:
+        return
+    planilla.refresh_from_db(fields=CAMPOS_PREPROCESAMIENTO)
+    if planilla.tamaño_procesado is not None or adoptar_preprocesamiento(planilla):
+        return
+    reclamada = reclamar_preprocesamiento(planilla)
+    if not reclamada:
+        if esperar_preprocesamiento(planilla, settings.PREPROCESAMIENTO_ESPERA):
+            return
+        # El reclamo de la otra corrida ya venció o se liberó: tomarlo
+        reclamada = reclamar_preprocesamiento(planilla)
+        if not reclamada:
+            logger.warning(
+                "Pre-procesamiento de planilla %s no terminó en otra corrida, se ejecuta aquí", planilla.pk
+            )
+    try:
+        resultado = enviar_preprocesamiento(planilla).result()
+    except Exception:
+        if reclamada:
+            liberar_preprocesamiento(planilla)
+        raise
+    registrar_preprocesamiento(planilla, resultado)
+
+
+def programar_preprocesamiento(planilla) -> None:
+    """
+    Pre-procesar la imagen de una planilla en segundo plano, sin esperar.
+    Usado al subir imágenes.
+    """
+    if not settings.PREPROCESAMIENTO_ACTIVO:
+        return
+    if adoptar_preprocesamiento(planilla) or not reclamar_preprocesamiento(planilla):
+        return
+
+    def _al_terminar(futuro: Future) -> None:
+        # Corre en el hilo del pool que recibe los resultados: su conexión se cierra al terminar
+        from django.db import connection
+
+        try:
+            registrar_preprocesamiento(planilla, futuro.result())
+        except Exception as e:
+            liberar_preprocesamiento(planilla)
+            logger.error("Error pre-procesando planilla %s: %s", planilla.pk, e)
+        finally:
+            connection.close()
+
+    try:
+        enviar_preprocesamiento(planilla).add_done_callback(_al_terminar)
+    except Exception:
+        liberar_preprocesamiento(planilla)
+        raise
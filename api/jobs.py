@@ -0,0 +1,477 @@
+"""
+Cola de procesamiento de planillas respaldada por la base de datos.
+
+El endpoint procesar_con_azure solo encola un ProcesamientoJob y responde
+de inmediato; los workers (manage.py procesar_planillas) reclaman los
+trabajos en cola, ejecutan el análisis con Azure y escriben el resultado.
+Los lotes PDF/TIFF (/api/lotes/) usan la misma cola: su trabajo crea una
+planilla por cada documento encontrado en el archivo.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .archivo import restaurar_imagen
+from .cache_resultados import resultado_cache
+from .imagenes import preprocesar_planilla
+from .lotes import recortar_documentos
+from .materializacion import campos_encabezado, materializar_planilla
+from .metricas import registrar_transicion
+from .models import LotePlanillas, Planilla, ProcesamientoJob
+from .resultado_crudo import compactar_datos, copiar_resultado_crudo, guardar_resultado_crudo
+from .resumenes import clave_grupo, programar_actualizacion
+from .services import CLAVE_RESULTADO_CRUDO, azure_service, azure_service_async
+from .uploads import guardar_imagen
+
+logger = logging.getLogger(__name__)
+
+# Cantidad de candidatos que se leen por intento de reclamo
+CANDIDATOS_POR_RECLAMO = 10
+
+
+def _encolar(**objetivo) -> Tuple[ProcesamientoJob, bool]:
+    """
+    Trabajo activo de la planilla o lote `objetivo`, creándolo si no hay.
+
+    Dos encolados en paralelo pueden no ver el trabajo del otro; la
+    restricción única sobre los trabajos activos hace fallar el segundo
+    INSERT y ese encolado retorna el trabajo creado por el primero.
+
+    Returns:
+        (trabajo, True si se creó)
+    """
+    while True:
+        job = ProcesamientoJob.objects.filter(estado__in=['queued', 'running'], **objetivo).first()
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                return ProcesamientoJob.objects.create(**objetivo), True
+        except IntegrityError:
+            # Otro encolado ganó; si su trabajo ya terminó se vuelve a intentar
+            continue
+
+
+def encolar_planilla(planilla: Planilla) -> ProcesamientoJob:
+    """
+    Encolar una planilla para procesamiento.
+
+    Si la planilla ya tiene un trabajo activo (en cola o ejecutando) se
+    retorna ese mismo trabajo, así un reintento del cliente no duplica
+    el procesamiento.
+    """
+    job, creado = _encolar(planilla=planilla)
+    if creado:
+        logger.info("Planilla %s encolada (job %s)", planilla.id, job.id)
+    return job
+
+
+def encolar_lote(lote: LotePlanillas) -> ProcesamientoJob:
+    """Encolar un lote para procesamiento (sin duplicar un trabajo activo)"""
+    job, creado = _encolar(lote=lote)
+    if creado:
+        logger.info("Lote %s encolado (job %s)", lote.id, job.id)
+    return job
+
+
+def reclamar_job(worker_id: str) -> Optional[ProcesamientoJob]:
+    """
+    Reclamar el trabajo en cola más antiguo.
+
+    El reclamo es un UPDATE condicional sobre la fila (estado='queued'):
+    si otro worker lo tomó primero el UPDATE no afecta filas y se intenta
+    con el siguiente candidato, por lo que un trabajo nunca se procesa dos
+    veces. Funciona igual en SQLite y PostgreSQL.
+    """
+    candidatos = list(
+        ProcesamientoJob.objects
+        .filter(estado='queued')
+        .order_by('fecha_creacion', 'id')
+        .values_list('id', flat=True)[:CANDIDATOS_POR_RECLAMO]
+    )
+    for job_id in candidatos:
+        reclamado = ProcesamientoJob.objects.filter(pk=job_id, estado='queued').update(
+            estado='running',
+            worker=worker_id,
+            intentos=F('intentos') + 1,
+            fecha_inicio=timezone.now()
+        )
+        if reclamado:
+            return ProcesamientoJob.objects.select_related('planilla', 'lote').get(pk=job_id)
+    return None
+
+
+def liberar_jobs_vencidos(minutos: int) -> int:
+    """
+    Devolver a la cola los trabajos 'running' que llevan más de `minutos`
+    sin terminar (por ejemplo, porque el worker murió).
+
+    Returns:
+        Cantidad de trabajos liberados
+    """
+    limite = timezone.now() - timedelta(minutes=minutos)
+    liberados = ProcesamientoJob.objects.filter(
+        estado='running',
+        fecha_inicio__lt=limite
+    ).update(estado='queued', worker='')
+    if liberados:
+        logger.warning("Se liberaron %s trabajos vencidos", liberados)
+    return liberados
+
+
+def guardar_resultado(planilla: Planilla, datos_extraidos: Dict[str, Any]) -> None:
+    """
+    Guardar los datos extraídos, copiar el encabezado a sus columnas,
+    materializar las filas relacionales y marcar la planilla como
+    completada, todo en una transacción. Al confirmarse se actualiza el
+    resumen diario de su grupo.
+    """
+    # Si se re-procesa una planilla completada su grupo de resumen puede cambiar
+    anterior = planilla.status
+    clave_anterior = clave_grupo(planilla) if anterior == 'completed' else None
+    resultado = datos_extraidos.pop(CLAVE_RESULTADO_CRUDO, None)
+    compactar_datos(datos_extraidos)
+
+    planilla.datos_extraidos = datos_extraidos
+    planilla.status = 'completed'
+    planilla.error_procesamiento = None
+    encabezado = campos_encabezado(datos_extraidos)
+    for campo, valor in encabezado.items():
+        setattr(planilla, campo, valor)
+    try:
+        with transaction.atomic():
+            planilla.save(update_fields=[
+                'datos_extraidos', 'status', 'error_procesamiento', 'fecha_actualizacion',
+                *encabezado
+            ])
+            materializar_planilla(planilla, datos_extraidos)
+            if resultado is not None:
+                guardar_resultado_crudo(planilla, resultado)
+            else:
+                # Resultado desde la cache: reutilizar el de la planilla con la misma imagen
+                copiar_resultado_crudo(planilla)
+            programar_actualizacion(planilla, clave_anterior)
+    except Exception:
+        # La transacción se deshizo: en la base la planilla sigue en su estado anterior
+        planilla.status = anterior
+        raise
+    registrar_transicion(anterior, 'completed')
+
+
+def _marcar_error(planilla: Planilla, error: Exception, guardado: bool) -> List[str]:
+    """
+    Dejar la planilla en estado 'error' con el mensaje. Si lo que falló fue
+    guardar el resultado (`guardado`), los datos extraídos se conservan en
+    la planilla para no perder el análisis de Azure.
+
+    Returns:
+        Campos a guardar
+    """
+    registrar_transicion(planilla.status, 'error')
+    planilla.status = 'error'
+    planilla.error_procesamiento = str(error)
+    logger.error("Error procesando planilla %s: %s", planilla.id, error)
+    campos = ['status', 'error_procesamiento', 'fecha_actualizacion']
+    return campos + ['datos_extraidos'] if guardado else campos
+
+
+def procesar_planilla(planilla: Planilla) -> Dict[str, Any]:
+    """
+    Procesar una planilla con Azure Form Recognizer y guardar el resultado.
+
+    Si la misma imagen ya fue analizada con el modelo actual se reutiliza
+    el resultado en cache sin llamar a Azure. Si el análisis o el guardado
+    del resultado falla la planilla queda en estado 'error' y la excepción
+    se propaga al llamador.
+
+    Returns:
+        Dict con los datos extraídos
+    """
+    guardado = False
+    try:
+        datos_extraidos = resultado_cache.obtener(planilla.hash_contenido, azure_service.model_id)
+        if datos_extraidos is not None:
+            guardado = True
+            guardar_resultado(planilla, datos_extraidos)
+            logger.info("Planilla %s completada desde cache", planilla.id)
+            return datos_extraidos
+
+        registrar_transicion(planilla.status, 'processing')
+        planilla.status = 'processing'
+        planilla.save(update_fields=['status', 'fecha_actualizacion'])
+
+        # Una imagen archivada vuelve al directorio caliente para analizarla
+        restaurar_imagen(planilla)
+
+        # Reducir la imagen antes de enviarla si no se hizo al subirla
+        preprocesar_planilla(planilla)
+
+        # Obtener ruta completa de la imagen
+        image_path = os.path.join(settings.MEDIA_ROOT, planilla.imagen.name)
+
+        logger.info("Procesando planilla %s con Azure Form Recognizer", planilla.id)
+        datos_extraidos = azure_service.analyze_document(image_path)
+
+        # Un error al guardar también deja la planilla en 'error', no en 'processing'
+        guardado = True
+        guardar_resultado(planilla, datos_extraidos)
+    except Exception as e:
+        planilla.save(update_fields=_marcar_error(planilla, e, guardado))
+        raise
+
+    # Solo se cachean resultados procesados sin errores
+    if 'error' not in datos_extraidos and 'processing_error' not in datos_extraidos:
+        resultado_cache.guardar(planilla.hash_contenido, azure_service.model_id, datos_extraidos)
+
+    logger.info("Planilla %s procesada exitosamente", planilla.id)
+    return datos_extraidos
+
+
+def reclamar_planilla(planilla: Planilla) -> bool:
+    """
+    Reclamar una planilla pendiente para procesarla fuera de la cola.
+
+    El reclamo es un UPDATE condicional de 'pending' a 'processing' que
+    además excluye las planillas con un trabajo activo: dos peticiones en
+    paralelo no procesan la misma planilla y una planilla encolada queda
+    en manos del worker.
+
+    Returns:
+        True si la planilla quedó reclamada (y en estado 'processing')
+    """
+    reclamada = (
+        Planilla.objects
+        .filter(pk=planilla.pk, status='pending')
+        .exclude(jobs__estado__in=['queued', 'running'])
+        .update(status='processing', fecha_actualizacion=timezone.now())
+    )
+    if not reclamada:
+        return False
+    registrar_transicion('pending', 'processing')
+    planilla.status = 'processing'
+    return True
+
+
+async def procesar_planilla_async(planilla: Planilla) -> Dict[str, Any]:
+    """
+    Versión asíncrona de procesar_planilla para la vista ASGI.
+
+    La planilla debe venir reclamada con reclamar_planilla. El análisis usa
+    el cliente aio de Azure; las escrituras a la base de datos se delegan a
+    hilos con sync_to_async.
+
+    Returns:
+        Dict con los datos extraídos
+    """
+    guardado = False
+    try:
+        datos_extraidos = await sync_to_async(resultado_cache.obtener)(
+            planilla.hash_contenido, azure_service_async.model_id
+        )
+        if datos_extraidos is not None:
+            guardado = True
+            await sync_to_async(guardar_resultado)(planilla, datos_extraidos)
+            logger.info("Planilla %s completada desde cache", planilla.id)
+            return datos_extraidos
+
+        await sync_to_async(restaurar_imagen)(planilla)
+
+        # Fuera del hilo de sync_to_async compartido: puede esperar al pre-procesamiento de la subida
+        await sync_to_async(preprocesar_planilla, thread_sensitive=False)(planilla)
+
+        image_path = os.path.join(settings.MEDIA_ROOT, planilla.imagen.name)
+
+        logger.info("Procesando planilla %s con Azure Form Recognizer (async)", planilla.id)
+        datos_extraidos = await azure_service_async.analyze_document(image_path)
+
+        guardado = True
+        await sync_to_async(guardar_resultado)(planilla, datos_extraidos)
+    except Exception as e:
+        await planilla.asave(update_fields=_marcar_error(planilla, e, guardado))
+        raise
+
+    if 'error' not in datos_extraidos and 'processing_error' not in datos_extraidos:
+        await sync_to_async(resultado_cache.guardar)(
+            planilla.hash_contenido, azure_service_async.model_id, datos_extraidos
+        )
+
+    logger.info("Planilla %s procesada exitosamente", planilla.id)
+    return datos_extraidos
+
+
+def procesar_lote(lote: LotePlanillas) -> List[Planilla]:
+    """
+    Analizar un lote con una sola llamada a Azure y crear una planilla
+    completada por cada documento encontrado, con la imagen recortada de
+    su página.
+
+    Las planillas se crean en una transacción: si algo falla el lote queda
+    en estado 'error' sin planillas a medias y la excepción se propaga al
+    llamador. Los resultados no pasan por la cache por contenido: lo
+    analizado es el archivo completo, no la imagen recortada.
+
+    Returns:
+        Planillas creadas, en el orden de los documentos
+    """
+    if lote.status == 'completed':
+        # Un reintento del trabajo no vuelve a crear las planillas
+        return list(lote.planillas.sin_datos_extraidos().order_by('pagina', 'id'))
+
+    lote.status = 'processing'
+    lote.save(update_fields=['status', 'fecha_actualizacion'])
+
+    try:
+        ruta = lote.archivo.path
+        logger.info("Procesando lote %s (%s páginas) con Azure Form Recognizer", lote.id, lote.paginas)
+        documentos = azure_service.analyze_batch(ruta, lote.paginas)
+        if not documentos:
+            raise ValueError("Azure no encontró planillas en el lote")
+        recortes = recortar_documentos(ruta, [datos[CLAVE_RESULTADO_CRUDO] for datos in documentos])
+
+        base = os.path.splitext(os.path.basename(lote.nombre_archivo or lote.archivo.name))[0]
+        planillas = []
+        with transaction.atomic():
+            for indice, (datos, (pagina, contenido)) in enumerate(zip(documentos, recortes), start=1):
+                nombre = f"{base}-{indice:03d}-p{pagina}.jpg"
+                almacenado, sha256 = guardar_imagen(ContentFile(contenido), nombre)
+                planilla = Planilla.objects.create(
+                    imagen=almacenado,
+                    nombre_archivo=nombre,
+                    tamaño_archivo=len(contenido),
+                    hash_contenido=sha256,
+                    lote=lote,
+                    pagina=pagina
+                )
+                guardar_resultado(planilla, datos)
+                planillas.append(planilla)
+            lote.status = 'completed'
+            lote.error_procesamiento = None
+            lote.save(update_fields=['status', 'error_procesamiento', 'fecha_actualizacion'])
+    except Exception as e:
+        lote.status = 'error'
+        lote.error_procesamiento = str(e)
+        lote.save(update_fields=['status', 'error_procesamiento', 'fecha_actualizacion'])
+        logger.error("Error procesando lote %s: %s", lote.id, e)
+        raise
+
+    logger.info("Lote %s procesado: %s planillas", lote.id, len(planillas))
+    return planillas
+
+
+def ejecutar_job(job: ProcesamientoJob) -> bool:
+    """
+    Ejecutar un trabajo ya reclamado y registrar su estado final.
+
+    El estado final se escribe con un UPDATE condicionado a que el trabajo
+    siga 'running' y reclamado por este worker: si mientras tanto se
+    liberó por vencido y otro worker lo tomó, no se pisa su estado.
+
+    Returns:
+        True si la planilla (o el lote) se procesó correctamente
+    """
+    try:
+        if job.lote_id is not None:
+            procesar_lote(job.lote)
+        else:
+            procesar_planilla(job.planilla)
+    except Exception as e:
+        job.estado = 'failed'
+        job.error = str(e)
+    else:
+        job.estado = 'done'
+        job.error = None
+
+    job.fecha_fin = timezone.now()
+    propio = ProcesamientoJob.objects.filter(pk=job.pk, worker=job.worker, estado='running').update(
+        estado=job.estado,
+        error=job.error,
+        fecha_fin=job.fecha_fin
+    )
+    if not propio:
+        logger.warning("Job %s ya no pertenece al worker %s; no se registra su estado", job.id, job.worker)
+    return job.estado == 'done'
+
+
+def _bucle_worker(worker_id: str, intervalo: float, una_vez: bool, detener: threading.Event,
+                  liberar: bool = False) -> int:
+    """
+    Bucle de un hilo worker: reclama y ejecuta trabajos hasta que se detenga.
+
+    Si `liberar` es True el hilo además devuelve a la cola, cada
+    PROCESAMIENTO_LIBERAR_CADA segundos, los trabajos vencidos de workers
+    que murieron mientras este proceso sigue corriendo.
+    """
+    procesados = 0
+    ultima_liberacion = time.monotonic()
+    try:
+        while not detener.is_set():
+            close_old_connections()
+            if liberar and time.monotonic() - ultima_liberacion >= settings.PROCESAMIENTO_LIBERAR_CADA:
+                liberar_jobs_vencidos(settings.PROCESAMIENTO_TIMEOUT_JOB)
+                ultima_liberacion = time.monotonic()
+
+            job = reclamar_job(worker_id)
+            if job is None:
+                if una_vez:
+                    break
+                detener.wait(intervalo)
+                continue
+
+            ejecutar_job(job)
+            procesados += 1
+    finally:
+        # Cada hilo tiene su propia conexión; cerrarla al salir
+        connection.close()
+    return procesados
+
+
+def ejecutar_worker(hilos: int, intervalo: float, una_vez: bool = False,
+                    detener: Optional[threading.Event] = None) -> int:
+    """
+    Ejecutar un pool de `hilos` workers que consumen la cola.
+
+    Args:
+        hilos: Cantidad de hilos del pool
+        intervalo: Segundos de espera cuando la cola está vacía
+        una_vez: Si es True, terminar cuando la cola quede vacía
+        detener: Evento para detener el pool desde fuera
+
+    Returns:
+        Cantidad de trabajos procesados
+    """
+    detener = detener or threading.Event()
+    prefijo = f"{socket.gethostname()}:{os.getpid()}"
+
+    liberar_jobs_vencidos(settings.PROCESAMIENTO_TIMEOUT_JOB)
+
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='planilla-worker') as pool:
+        futuros = [
+            # Un solo hilo por proceso libera periódicamente los trabajos vencidos
+            pool.submit(_bucle_worker, f"{prefijo}:{i}", intervalo, una_vez, detener, i == 0)
+            for i in range(hilos)
+        ]
+        try:
+            procesados = sum(f.result() for f in futuros)
+        except KeyboardInterrupt:
+            detener.set()
+            procesados = sum(f.result() for f in futuros)
+
+    logger.info(
+        "Worker %s procesó %s trabajos en %.1fs",
+        prefijo, procesados, time.monotonic() - inicio
+    )
+    return procesados
@@ -0,0 +1,330 @@
+"""
+Límites de las llamadas a Azure compartidos entre hilos y procesos.
+
+- Tasa: un token bucket (AZURE_LIMITE_TPS envíos por segundo, ráfagas de
+  hasta AZURE_LIMITE_RAFAGA) cuyo estado vive en un archivo bloqueado con
+  flock. Cada envío reserva su turno y duerme hasta él, así los envíos de
+  todos los workers quedan espaciados justo bajo la cuota en vez de
+  alternar entre ráfagas y 429.
+- Concurrencia: un semáforo de AZURE_LIMITE_CONCURRENCIA cupos, cada uno
+  un archivo con flock. Un cupo se mantiene durante todo el análisis
+  (envío y polling); si el proceso muere el sistema operativo lo libera.
+- Reintentos: los envíos rechazados con 429/5xx o que no llegaron a Azure
+  se reintentan hasta AZURE_REINTENTOS veces. Se respeta Retry-After
+  agregando jitter para que los workers no vuelvan todos a la vez, y un
+  429 pausa el bucket para todos los procesos.
+
+Los archivos viven en AZURE_LIMITE_DIRECTORIO, que debe ser local y común
+a los workers de la máquina. Sin fcntl (Windows) los límites valen solo
+dentro del proceso. El módulo no usa el ORM.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import struct
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, TypeVar
+
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+from django.conf import settings
+
+from .metricas import AZURE_ESPERA_LIMITE, AZURE_REINTENTOS
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Estados HTTP con los que se reintenta el envío
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Tope de cualquier espera entre reintentos (s)
+ESPERA_MAXIMA = 60.0
+
+# Espera entre intentos de tomar un cupo de concurrencia (s)
+ESPERA_CUPO = 0.05
+
+# Estado del bucket: tokens disponibles y marca de tiempo (time.time())
+_ESTADO = struct.Struct('!dd')
+
+# Respaldo sin fcntl: un lock por ruta dentro del proceso
+_locks_locales = {}
+_locks_locales_lock = threading.Lock()
+
+
+def _lock_local(ruta: str) -> threading.Lock:
+    with _locks_locales_lock:
+        return _locks_locales.setdefault(ruta, threading.Lock())
+
+
+@contextmanager
+def _archivo_bloqueado(ruta: str):
+    """Descriptor del archivo `ruta` con un lock exclusivo"""
+    descriptor = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield descriptor
+        else:
+            with _lock_local(ruta):
+                yield descriptor
+    finally:
+        os.close(descriptor)
+
+
+class CuboTokens:
+    """Token bucket con el estado en un archivo compartido"""
+
+    def __init__(self, ruta: str, tasa: float, capacidad: float):
+        self.ruta = ruta
+        self.tasa = tasa
+        self.capacidad = max(1.0, capacidad)
+
+    def _leer(self, descriptor: int, ahora: float) -> float:
+        datos = os.pread(descriptor, _ESTADO.size, 0)
+        if len(datos) < _ESTADO.size:
+            return self.capacidad
+        tokens, marca = _ESTADO.unpack(datos)
+        return min(self.capacidad, tokens + max(0.0, ahora - marca) * self.tasa)
+
+    def reservar(self) -> float:
+        """
+        Tomar un token, aunque quede en deuda.
+
+        Returns:
+            Segundos a esperar antes de usar el turno reservado
+        """
+        with _archivo_bloqueado(self.ruta) as descriptor:
+            ahora = time.time()
+            tokens = self._leer(descriptor, ahora) - 1
+            os.pwrite(descriptor, _ESTADO.pack(tokens, ahora), 0)
+        return 0.0 if tokens >= 0 else -tokens / self.tasa
+
+    def pausar(self, segundos: float) -> None:
+        """No entregar turnos durante `segundos` (Azure respondió 429)"""
+        with _archivo_bloqueado(self.ruta) as descriptor:
+            ahora = time.time()
+            tokens = min(self._leer(descriptor, ahora), -segundos * self.tasa)
+            os.pwrite(descriptor, _ESTADO.pack(tokens, ahora), 0)
+
+
+class SemaforoArchivos:
+    """Semáforo de `cupos` lugares; cada cupo es un archivo con flock"""
+
+    def __init__(self, directorio: str, cupos: int):
+        self.rutas = [os.path.join(directorio, f'cupo-{i}.lock') for i in range(cupos)]
+        self._local = threading.BoundedSemaphore(cupos) if fcntl is None else None
+
+    def intentar(self) -> Optional[int]:
+        """
+        Tomar un cupo libre sin esperar.
+
+        Returns:
+            Descriptor que identifica el cupo, o None si están todos ocupados
+        """
+        if self._local is not None:
+            return 0 if self._local.acquire(blocking=False) else None
+        for ruta in random.sample(self.rutas, len(self.rutas)):
+            descriptor = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(descriptor)
+                continue
+            return descriptor
+        return None
+
+    def liberar(self, descriptor: int) -> None:
+        if self._local is not None:
+            self._local.release()
+            return
+        # Cerrar el descriptor libera el flock
+        os.close(descriptor)
+
+
+def retry_after(error: HttpResponseError) -> Optional[float]:
+    """Segundos indicados por Azure en retry-after-ms o Retry-After"""
+    respuesta = getattr(error, 'response', None)
+    if respuesta is None:
+        return None
+    cabeceras = respuesta.headers
+    for nombre in ('retry-after-ms', 'x-ms-retry-after-ms'):
+        valor = cabeceras.get(nombre)
+        if valor:
+            try:
+                return float(valor) / 1000
+            except ValueError:
+                pass
+    valor = cabeceras.get('Retry-After')
+    if not valor:
+        return None
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LimitadorAzure:
+    """Tasa, concurrencia y reintentos de los envíos de análisis (settings AZURE_LIMITE_*)"""
+
+    def __init__(self):
+        # Un semáforo por directorio y cupos: sin fcntl el límite es el BoundedSemaphore del semáforo
+        self._semaforos = {}
+        self._semaforos_lock = threading.Lock()
+
+    def _directorio(self) -> str:
+        directorio = settings.AZURE_LIMITE_DIRECTORIO
+        os.makedirs(directorio, exist_ok=True)
+        return directorio
+
+    def _cubo(self) -> Optional[CuboTokens]:
+        if settings.AZURE_LIMITE_TPS <= 0:
+            return None
+        return CuboTokens(
+            os.path.join(self._directorio(), 'tasa.bucket'),
+            settings.AZURE_LIMITE_TPS, settings.AZURE_LIMITE_RAFAGA
+        )
+
+    def _semaforo(self) -> Optional[SemaforoArchivos]:
+        cupos = settings.AZURE_LIMITE_CONCURRENCIA
+        if cupos <= 0:
+            return None
+        clave = (settings.AZURE_LIMITE_DIRECTORIO, cupos)
+        with self._semaforos_lock:
+            semaforo = self._semaforos.get(clave)
+            if semaforo is None:
+                semaforo = self._semaforos[clave] = SemaforoArchivos(self._directorio(), cupos)
+        return semaforo
+
+    def turno(self) -> float:
+        """Reservar el turno del próximo envío; retorna los segundos a esperar"""
+        cubo = self._cubo()
+        espera = cubo.reservar() if cubo is not None else 0.0
+        AZURE_ESPERA_LIMITE.observar(espera, 'tasa')
+        return espera
+
+    def espera_reintento(self, error: Exception, intento: int) -> Optional[float]:
+        """
+        Segundos a esperar antes de reintentar un envío fallido.
+
+        Returns:
+            La espera, o None si el error no se reintenta o se agotaron los intentos
+        """
+        if isinstance(error, HttpResponseError):
+            estado = error.status_code
+            if estado not in ESTADOS_REINTENTABLES:
+                return None
+        elif isinstance(error, ServiceRequestError):
+            # La petición no llegó a Azure: reintentar no duplica el análisis
+            estado = 'conexion'
+        else:
+            return None
+        if intento >= settings.AZURE_REINTENTOS:
+            return None
+
+        indicado = retry_after(error) if isinstance(error, HttpResponseError) else None
+        if indicado is not None:
+            # Nunca antes de lo indicado; el jitter separa a los workers
+            espera = indicado * random.uniform(1.0, 1.0 + settings.AZURE_REINTENTO_JITTER)
+        else:
+            espera = settings.AZURE_REINTENTO_BASE * 2 ** intento * random.uniform(0.5, 1.5)
+        espera = min(espera, ESPERA_MAXIMA)
+
+        if estado == 429:
+            cubo = self._cubo()
+            if cubo is not None:
+                cubo.pausar(indicado if indicado is not None else espera)
+        AZURE_REINTENTOS.inc(str(estado))
+        logger.warning("Envío a Azure rechazado (%s), reintento %s en %.2f s", estado, intento + 1, espera)
+        return espera
+
+    def llamar(self, funcion: Callable[[], T], antes_de_reintentar: Optional[Callable[[], None]] = None) -> T:
+        """Ejecutar el envío respetando la tasa y reintentando los rechazos"""
+        intento = 0
+        while True:
+            espera = self.turno()
+            if espera:
+                time.sleep(espera)
+            try:
+                return funcion()
+            except (HttpResponseError, ServiceRequestError) as e:
+                espera = self.espera_reintento(e, intento)
+                if espera is None:
+                    raise
+            time.sleep(espera)
+            if antes_de_reintentar is not None:
+                antes_de_reintentar()
+            intento += 1
+
+    async def llamar_async(self, funcion):
+        """
+        Variante de llamar() para corrutinas: `funcion` retorna un awaitable.
+
+        El bucket se lee y escribe bajo un flock bloqueante; se hace en un
+        hilo para no detener el event loop mientras otro proceso lo tiene.
+        """
+        intento = 0
+        while True:
+            espera = await asyncio.to_thread(self.turno)
+            if espera:
+                await asyncio.sleep(espera)
+            try:
+                return await funcion()
+            except (HttpResponseError, ServiceRequestError) as e:
+                espera = await asyncio.to_thread(self.espera_reintento, e, intento)
+                if espera is None:
+                    raise
+            await asyncio.sleep(espera)
+            intento += 1
+
+    @contextmanager
+    def cupo(self):
+        """Ocupar un cupo de concurrencia durante el bloque"""
+        semaforo = self._semaforo()
+        if semaforo is None:
+            yield
+            return
+        inicio = time.monotonic()
+        descriptor = semaforo.intentar()
+        while descriptor is None:
+            time.sleep(ESPERA_CUPO * random.uniform(0.5, 1.5))
+            descriptor = semaforo.intentar()
+        AZURE_ESPERA_LIMITE.observar(time.monotonic() - inicio, 'concurrencia')
+        try:
+            yield
+        finally:
+            semaforo.liberar(descriptor)
+
+    @asynccontextmanager
+    async def cupo_async(self):
+        """Variante de cupo() que espera sin bloquear el event loop"""
+        semaforo = self._semaforo()
+        if semaforo is None:
+            yield
+            return
+        inicio = time.monotonic()
+        descriptor = semaforo.intentar()
+        while descriptor is None:
+            await asyncio.sleep(ESPERA_CUPO * random.uniform(0.5, 1.5))
+            descriptor = semaforo.intentar()
+        AZURE_ESPERA_LIMITE.observar(time.monotonic() - inicio, 'concurrencia')
+        try:
+            yield
+        finally:
+            semaforo.liberar(descriptor)
+
+
+limitador_azure = LimitadorAzure()
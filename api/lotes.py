@@ -0,0 +1,193 @@
+"""
+Lotes de planillas: un PDF o TIFF de varias páginas analizado con una sola
+llamada a Azure.
+
+Algunos terminales escanean todas las planillas del día en un solo
+archivo. En vez de un envío y un polling por página, el lote completo se
+envía una vez (AzureFormRecognizerService.analyze_batch) y cada documento
+de result.documents queda como una Planilla con sus propios datos
+extraídos y la imagen recortada de su página (jobs.procesar_lote).
+
+Los TIFF se leen con Pillow. Los PDF requieren pypdfium2, una dependencia
+opcional que se importa solo al recibir o recortar un PDF.
+"""
+
+import io
+import logging
+import os
+from typing import Any, Callable, Dict, List, Tuple
+
+from django.conf import settings
+from PIL import Image
+
+from .models import LotePlanillas
+from .services import pagina_documento
+
+logger = logging.getLogger(__name__)
+
+FIRMA_PDF = b'%PDF-'
+FIRMAS_TIFF = (b'II*\x00', b'MM\x00*')
+
+
+class LoteNoDisponible(Exception):
+    """pypdfium2 no está instalado"""
+
+
+def _pdfium():
+    """Importar pypdfium2 al usarlo, con un error claro si falta"""
+    try:
+        import pypdfium2  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise LoteNoDisponible(
+            'Los lotes en PDF requieren pypdfium2 (pip install pypdfium2); los TIFF no'
+        ) from e
+    return pypdfium2
+
+
+def tipo_lote(cabecera: bytes) -> str:
+    """
+    Formato del lote según sus magic bytes.
+
+    Raises:
+        ValueError: Si no es un PDF ni un TIFF
+    """
+    if cabecera.startswith(FIRMA_PDF):
+        return 'pdf'
+    if cabecera.startswith(FIRMAS_TIFF):
+        return 'tiff'
+    raise ValueError("El lote debe ser un PDF o un TIFF de varias páginas")
+
+
+def contar_paginas(archivo) -> int:
+    """Páginas de un lote (ruta o archivo abierto, que queda al inicio)"""
+    if isinstance(archivo, str):
+        with open(archivo, 'rb') as f:
+            return contar_paginas(f)
+
+    tipo = tipo_lote(archivo.read(8))
+    archivo.seek(0)
+    try:
+        if tipo == 'pdf':
+            documento = _pdfium().PdfDocument(archivo.read())
+            try:
+                return len(documento)
+            finally:
+                documento.close()
+        with Image.open(archivo) as imagen:
+            return getattr(imagen, 'n_frames', 1)
+    except LoteNoDisponible:
+        raise
+    except Exception as e:
+        raise ValueError(f"No se pudo leer el lote: {e}") from e
+    finally:
+        archivo.seek(0)
+
+
+def crear_lote(archivo) -> LotePlanillas:
+    """
+    Validar y guardar el archivo subido de un lote.
+
+    Raises:
+        ValueError: Si el archivo no es un PDF/TIFF válido o excede los límites
+        LoteNoDisponible: Si es un PDF y falta pypdfium2
+    """
+    if archivo.size > settings.LOTES_MAX_TAMANO_ARCHIVO:
+        raise ValueError(f"El archivo excede el tamaño máximo de {settings.LOTES_MAX_TAMANO_ARCHIVO} bytes")
+
+    paginas = contar_paginas(archivo)
+    if paginas > settings.LOTES_MAX_PAGINAS:
+        raise ValueError(f"El lote tiene {paginas} páginas; el máximo es {settings.LOTES_MAX_PAGINAS}")
+
+    lote = LotePlanillas(nombre_archivo=archivo.name, tamaño_archivo=archivo.size, paginas=paginas)
+    lote.archivo.save(os.path.basename(archivo.name), archivo, save=False)
+    lote.save()
+    logger.info("Lote %s recibido: %s (%s páginas)", lote.id, archivo.name, paginas)
+    return lote
+
+
+def _lector_paginas(ruta: str) -> Tuple[Callable[[int], Image.Image], Callable[[], None]]:
+    """
+    Funciones para obtener la imagen de una página (desde 1) y para cerrar
+    el archivo.
+    """
+    with open(ruta, 'rb') as f:
+        tipo = tipo_lote(f.read(8))
+
+    if tipo == 'pdf':
+        documento = _pdfium().PdfDocument(ruta)
+
+        def pagina_pdf(numero: int) -> Image.Image:
+            return documento[numero - 1].render(scale=settings.LOTES_DPI / 72).to_pil()
+
+        return pagina_pdf, documento.close
+
+    imagen = Image.open(ruta)
+
+    def pagina_tiff(numero: int) -> Image.Image:
+        imagen.seek(numero - 1)
+        return imagen.copy()
+
+    return pagina_tiff, imagen.close
+
+
+def _caja_documento(documento: Dict[str, Any], pagina: Dict[str, Any], ancho: int, alto: int) -> Tuple[int, ...]:
+    """
+    Rectángulo en píxeles que contiene las regiones del documento en la
+    página, con un margen. Sin polígonos se usa la página completa.
+    """
+    puntos = [
+        punto
+        for region in documento.get('bounding_regions') or []
+        if region['page_number'] == pagina.get('page_number')
+        for punto in region.get('polygon') or []
+    ]
+    if not puntos or not pagina.get('width') or not pagina.get('height'):
+        return 0, 0, ancho, alto
+
+    # Los polígonos vienen en la unidad de la página (pulgadas en PDF, píxeles en imágenes)
+    escala_x = ancho / pagina['width']
+    escala_y = alto / pagina['height']
+    margen_x = ancho * settings.LOTES_MARGEN_RECORTE
+    margen_y = alto * settings.LOTES_MARGEN_RECORTE
+    izquierda = max(0, int(min(p['x'] for p in puntos) * escala_x - margen_x))
+    arriba = max(0, int(min(p['y'] for p in puntos) * escala_y - margen_y))
+    derecha = min(ancho, int(max(p['x'] for p in puntos) * escala_x + margen_x) + 1)
+    abajo = min(alto, int(max(p['y'] for p in puntos) * escala_y + margen_y) + 1)
+    if derecha <= izquierda or abajo <= arriba:
+        return 0, 0, ancho, alto
+    return izquierda, arriba, derecha, abajo
+
+
+def recortar_documentos(ruta: str, resultados: List[Dict[str, Any]]) -> List[Tuple[int, bytes]]:
+    """
+    Recortar de su página la imagen de cada documento de un lote.
+
+    Args:
+        ruta: Ruta al archivo del lote
+        resultados: Resultado de cada documento (services.dividir_resultado)
+
+    Returns:
+        Lista de (número de página, JPEG en escala de grises), en el mismo orden
+    """
+    obtener, cerrar = _lector_paginas(ruta)
+    cache = {}
+    recortes = []
+    try:
+        for resultado in resultados:
+            documento = resultado['documents'][0]
+            numero = pagina_documento(documento)
+            if numero not in cache:
+                # Varias planillas pueden compartir una página: rasterizarla una vez
+                cache = {numero: obtener(numero)}
+            imagen = cache[numero]
+            pagina = next((p for p in resultado['pages'] if p['page_number'] == numero), {})
+            recorte = imagen.crop(_caja_documento(documento, pagina, *imagen.size)).convert('L')
+            lado = settings.PREPROCESAMIENTO_LADO_MAXIMO
+            recorte.thumbnail((lado, lado), Image.LANCZOS)
+
+            contenido = io.BytesIO()
+            recorte.save(contenido, 'JPEG', quality=settings.PREPROCESAMIENTO_CALIDAD_JPEG, optimize=True)
+            recortes.append((numero, contenido.getvalue()))
+    finally:
+        cerrar()
+    return recortes
@@ -0,0 +1,28 @@
+"""
+Mover a bundles zip las imágenes de planillas completadas antiguas.
+
+Uso:
+    python manage.py archivar_planillas
+    python manage.py archivar_planillas --dias 30 --max-por-bundle 500
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.archivo import archivar_planillas
+
+
+class Command(BaseCommand):
+    help = 'Archiva en bundles zip las imágenes de planillas completadas hace más de N días'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Antigüedad mínima (por defecto ARCHIVO_DIAS)')
+        parser.add_argument(
+            '--max-por-bundle', type=int, help='Imágenes por bundle (por defecto ARCHIVO_MAX_POR_BUNDLE)'
+        )
+
+    def handle(self, *args, **options):
+        totales = archivar_planillas(options['dias'], options['max_por_bundle'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Bundles: {totales['bundles']}, imágenes: {totales['imagenes']}, "
+            f"planillas: {totales['planillas']}"
+        ))
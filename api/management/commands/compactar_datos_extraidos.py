@@ -0,0 +1,27 @@
+"""
+Pasar datos_extraidos de planillas y de la cache al formato compacto: el
+texto, las tablas y los documentos completos se quitan del JSON (quedan
+en ResultadoCrudo).
+
+Uso:
+    python manage.py compactar_datos_extraidos
+    python manage.py compactar_datos_extraidos --lote 1000
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.resultado_crudo import compactar_planillas
+
+
+class Command(BaseCommand):
+    help = 'Quita de datos_extraidos el contenido pesado del formato anterior'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Filas por transacción')
+
+    def handle(self, *args, **options):
+        totales = compactar_planillas(options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Planillas compactadas: {totales['planillas']} "
+            f"(resultados crudos creados: {totales['resultados']}), cache: {totales['cache']}"
+        ))
@@ -0,0 +1,34 @@
+"""
+Generar un snapshot Parquet de planillas, tarifas, ingresos, egresos y
+control de boletos en SNAPSHOTS_ROOT.
+
+Uso:
+    python manage.py exportar_snapshot             # incremental desde el último
+    python manage.py exportar_snapshot --completo
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.snapshots import SnapshotNoDisponible, generar_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Escribe un snapshot columnar (Parquet) por entidad para análisis'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--completo',
+            action='store_true',
+            help='Exportar todas las filas aunque exista un snapshot anterior'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            manifest = generar_snapshot(completo=options['completo'])
+        except SnapshotNoDisponible as e:
+            raise CommandError(str(e)) from e
+
+        filas = ', '.join(f'{entidad}: {n}' for entidad, n in manifest['filas'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot {manifest['nombre']} ({manifest['tipo']}) - {filas}"
+        ))
@@ -0,0 +1,27 @@
+"""
+Limpieza de subidas reanudables abandonadas.
+
+Uso:
+    python manage.py limpiar_subidas --horas 48
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.subidas import limpiar_subidas_abandonadas
+
+
+class Command(BaseCommand):
+    help = 'Elimina las subidas reanudables sin actividad y sus archivos parciales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas',
+            type=int,
+            default=settings.SUBIDAS_EXPIRACION_HORAS,
+            help='Horas sin actividad tras las cuales una subida se elimina'
+        )
+
+    def handle(self, *args, **options):
+        eliminadas = limpiar_subidas_abandonadas(options['horas'])
+        self.stdout.write(self.style.SUCCESS(f'Subidas eliminadas: {eliminadas}'))
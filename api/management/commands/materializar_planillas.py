@@ -0,0 +1,42 @@
+"""
+Materializar en filas relacionales los datos extraídos de planillas ya procesadas.
+
+Uso:
+    python manage.py materializar_planillas
+    python manage.py materializar_planillas --solo-vacias
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.materializacion import materializar_planilla
+from api.models import Planilla
+
+
+class Command(BaseCommand):
+    help = 'Escribe las tarifas/ingresos/egresos/control de boletos de las planillas completadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--solo-vacias',
+            action='store_true',
+            help='Materializar solo planillas sin filas de tarifas ni ingresos'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help='Planillas leídas por consulta'
+        )
+
+    def handle(self, *args, **options):
+        planillas = Planilla.objects.filter(status='completed', datos_extraidos__isnull=False)
+        if options['solo_vacias']:
+            planillas = planillas.filter(tarifas__isnull=True, ingresos__isnull=True)
+
+        total = 0
+        filas = 0
+        for planilla in planillas.only('id', 'datos_extraidos').iterator(chunk_size=options['lote']):
+            filas += sum(materializar_planilla(planilla).values())
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Planillas materializadas: {total} ({filas} filas)'))
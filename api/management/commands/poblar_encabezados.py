@@ -0,0 +1,50 @@
+"""
+Copiar el encabezado de datos_extraidos a las columnas indexadas de Planilla
+para las planillas procesadas antes de que existieran esas columnas.
+
+Uso:
+    python manage.py poblar_encabezados
+    python manage.py poblar_encabezados --todas --lote 1000
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.materializacion import CAMPOS_ENCABEZADO, campos_encabezado
+from api.models import Planilla
+
+
+class Command(BaseCommand):
+    help = 'Rellena numero_planilla, fecha_planilla, numero_bus, patente_bus y codigo_conductor'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todas',
+            action='store_true',
+            help='Recalcular también las planillas que ya tienen encabezado'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help='Planillas leídas y actualizadas por consulta'
+        )
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        planillas = Planilla.objects.filter(status='completed', datos_extraidos__isnull=False)
+        if not options['todas']:
+            planillas = planillas.filter(numero_planilla__isnull=True, fecha_planilla__isnull=True)
+
+        pendientes = []
+        total = 0
+        for planilla in planillas.only('id', 'datos_extraidos').iterator(chunk_size=lote):
+            for campo, valor in campos_encabezado(planilla.datos_extraidos).items():
+                setattr(planilla, campo, valor)
+            pendientes.append(planilla)
+            if len(pendientes) >= lote:
+                total += Planilla.objects.bulk_update(pendientes, list(CAMPOS_ENCABEZADO))
+                pendientes = []
+        if pendientes:
+            total += Planilla.objects.bulk_update(pendientes, list(CAMPOS_ENCABEZADO))
+
+        self.stdout.write(self.style.SUCCESS(f'Planillas actualizadas: {total}'))
@@ -0,0 +1,96 @@
+"""
+Worker de la cola de procesamiento de planillas.
+
+Uso:
+    python manage.py procesar_planillas --hilos 4 --procesos 2
+    python manage.py procesar_planillas --una-vez
+"""
+
+import multiprocessing
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _ejecutar_proceso(hilos, intervalo, una_vez):
+    """Punto de entrada de cada proceso hijo del pool."""
+    # En plataformas con 'spawn' el proceso hijo parte sin Django configurado
+    django.setup()
+    from api.jobs import ejecutar_worker
+
+    try:
+        ejecutar_worker(hilos, intervalo, una_vez)
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Procesa con Azure Form Recognizer las planillas encoladas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=settings.PROCESAMIENTO_HILOS,
+            help='Cantidad de hilos por proceso'
+        )
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=1,
+            help='Cantidad de procesos worker'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=settings.PROCESAMIENTO_INTERVALO,
+            help='Segundos de espera cuando la cola está vacía'
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Terminar cuando la cola quede vacía'
+        )
+
+    def handle(self, *args, **options):
+        hilos = max(1, options['hilos'])
+        procesos = max(1, options['procesos'])
+        intervalo = options['intervalo']
+        una_vez = options['una_vez']
+
+        self.stdout.write(
+            f"Iniciando {procesos} proceso(s) con {hilos} hilo(s) cada uno"
+        )
+
+        if procesos == 1:
+            from api.jobs import ejecutar_worker
+
+            try:
+                procesados = ejecutar_worker(hilos, intervalo, una_vez)
+            except KeyboardInterrupt:
+                return
+            self.stdout.write(self.style.SUCCESS(f"Trabajos procesados: {procesados}"))
+            return
+
+        # Las conexiones abiertas no deben heredarse a los procesos hijos
+        connections.close_all()
+        hijos = [
+            multiprocessing.Process(
+                target=_ejecutar_proceso,
+                args=(hilos, intervalo, una_vez),
+                name=f'planilla-worker-{i}'
+            )
+            for i in range(procesos)
+        ]
+        for hijo in hijos:
+            hijo.start()
+        try:
+            for hijo in hijos:
+                hijo.join()
+        except KeyboardInterrupt:
+            for hijo in hijos:
+                hijo.join()
+
+        self.stdout.write(self.style.SUCCESS("Workers detenidos"))
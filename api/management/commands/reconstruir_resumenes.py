@@ -0,0 +1,31 @@
+"""
+Reconstruir la tabla de resúmenes diarios desde las planillas completadas.
+
+Uso:
+    python manage.py reconstruir_resumenes
+    python manage.py reconstruir_resumenes --desde 2024-01-01 --hasta 2024-01-31
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.normalizacion import parsear_fecha
+from api.resumenes import reconstruir_resumenes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula ResumenDiario completo o para un rango de fechas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Fecha final (AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        fechas = {}
+        for opcion in ('desde', 'hasta'):
+            if options[opcion]:
+                fechas[opcion] = parsear_fecha(options[opcion])
+                if fechas[opcion] is None:
+                    raise CommandError(f'--{opcion}: fecha inválida, use AAAA-MM-DD')
+
+        filas = reconstruir_resumenes(**fechas)
+        self.stdout.write(self.style.SUCCESS(f'Resúmenes escritos: {filas}'))
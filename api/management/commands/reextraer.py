@@ -0,0 +1,44 @@
+"""
+Volver a mapear datos_extraidos desde los resultados crudos guardados, sin
+llamar a Azure (p. ej. tras corregir el mapeo de campos).
+
+Uso:
+    python manage.py reextraer
+    python manage.py reextraer --desde 2024-01-01 --procesos 8 --lote 500
+"""
+
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.normalizacion import parsear_fecha
+from api.resultado_crudo import reextraer
+
+
+class Command(BaseCommand):
+    help = 'Re-genera datos_extraidos de las planillas desde sus resultados crudos de Azure'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Solo resultados guardados desde esta fecha (AAAA-MM-DD)')
+        parser.add_argument(
+            '--procesos', type=int, help='Procesos del pool (por defecto REEXTRAER_PROCESOS; 0 sin pool)'
+        )
+        parser.add_argument('--lote', type=int, help='Planillas por lote (por defecto REEXTRAER_LOTE)')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            fecha = parsear_fecha(options['desde'])
+            if fecha is None:
+                raise CommandError('--desde: fecha inválida, use AAAA-MM-DD')
+            desde = timezone.make_aware(datetime.combine(fecha, time.min))
+
+        def progreso(planillas, errores, total):
+            self.stdout.write(f'{planillas + errores}/{total} planillas ({errores} errores)')
+
+        totales = reextraer(desde, options['procesos'], options['lote'], progreso=progreso)
+        self.stdout.write(self.style.SUCCESS(
+            f"Planillas re-extraídas: {totales['planillas']} de {totales['total']}, "
+            f"errores: {totales['errores']}, {totales['segundos']} s"
+        ))
@@ -0,0 +1,216 @@
+"""
+Materialización de los datos extraídos en filas relacionales.
+
+_process_planilla_data deja las listas tarifas/ingresos/egresos/control_boletos
+en el JSON datos_extraidos; aquí se escriben como filas de Tarifa, Ingreso,
+Egreso y ControlBoleto con bulk_create, en una sola transacción por planilla.
+Re-materializar una planilla reemplaza sus filas anteriores. Los ítems
+mal formados (valores ilegibles, fuera de rango o faltantes) se omiten con
+un aviso en el log en vez de hacer fallar la planilla.
+
+Los campos del encabezado (info_general) se copian a columnas indexadas de
+Planilla para poder filtrar sin leer el JSON.
+"""
+
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional
+
+from django.db import transaction
+
+from .models import ControlBoleto, Egreso, Ingreso, Planilla, Tarifa
+from .normalizacion import normalizar_patente, parsear_fecha
+
+logger = logging.getLogger(__name__)
+
+CENTAVOS = Decimal('0.01')
+
+# Máximo de las columnas PositiveIntegerField en todos los motores
+ENTERO_MAXIMO = 2147483647
+
+# Columnas del encabezado y la clave de info_general de la que se copian
+CAMPOS_ENCABEZADO = {
+    'numero_planilla': 'numero_planilla',
+    'fecha_planilla': 'fecha',
+    'numero_bus': 'numero_bus',
+    'patente_bus': 'patente_bus',
+    'codigo_conductor': 'codigo_conductor',
+    'ciudad_origen': 'ciudad_origen',
+    'ciudad_retorno': 'ciudad_retorno',
+}
+
+
+def _decimal(valor: Any, modelo=None, campo: Optional[str] = None) -> Optional[Decimal]:
+    """
+    Convertir un monto del JSON a Decimal con 2 decimales (None si no es
+    válido o no cabe en la columna `campo` de `modelo`).
+    """
+    try:
+        numero = Decimal(str(valor)).quantize(CENTAVOS)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not numero.is_finite():
+        return None
+    if modelo is not None:
+        columna = modelo._meta.get_field(campo)
+        if abs(numero) >= Decimal(10) ** (columna.max_digits - columna.decimal_places):
+            return None
+    return numero
+
+
+def _entero(valor: Any) -> Optional[int]:
+    """Convertir un valor del JSON a entero no negativo (None si no es válido)"""
+    try:
+        numero = Decimal(str(valor).strip())
+        if numero != numero.to_integral_value():
+            return None
+        numero = int(numero)
+    except (InvalidOperation, TypeError, ValueError, OverflowError):
+        return None
+    return numero if 0 <= numero <= ENTERO_MAXIMO else None
+
+
+def _texto(valor: Any, largo: Optional[int] = None) -> str:
+    texto = '' if valor is None else str(valor)
+    return texto[:largo] if largo else texto
+
+
+def _omitir(planilla: Planilla, tipo: str, item: Any, motivo: str) -> None:
+    logger.warning("Planilla %s: %s omitido (%s): %r", planilla.pk, tipo, motivo, item)
+
+
+def campos_encabezado(datos_extraidos: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Valores de las columnas de encabezado a partir de datos_extraidos.
+
+    Returns:
+        Dict columna -> valor (None si el dato no está o no es válido)
+    """
+    info = (datos_extraidos or {}).get('info_general') or {}
+    valores = {}
+    for columna, clave in CAMPOS_ENCABEZADO.items():
+        valor = info.get(clave)
+        if columna == 'fecha_planilla':
+            valor = parsear_fecha(valor)
+        elif columna == 'patente_bus':
+            valor = normalizar_patente(valor)
+        else:
+            valor = str(valor).strip() if valor not in (None, '') else None
+        if isinstance(valor, str):
+            valor = valor[:Planilla._meta.get_field(columna).max_length] or None
+        valores[columna] = valor
+    return valores
+
+
+def construir_tarifas(planilla: Planilla, datos: List[Dict[str, Any]]) -> List[Tarifa]:
+    """Tarifas con precio positivo; el subtotal es precio × cantidad"""
+    tarifas = []
+    for item in datos:
+        if not isinstance(item, dict):
+            _omitir(planilla, 'tarifa', item, 'no es un objeto')
+            continue
+        precio = _decimal(item.get('precio'), Tarifa, 'precio')
+        cantidad = _entero(item.get('cantidad') or 1)
+        if precio is None or precio <= 0 or not cantidad:
+            continue
+        subtotal = precio * cantidad
+        if _decimal(subtotal, Tarifa, 'subtotal') is None:
+            _omitir(planilla, 'tarifa', item, 'subtotal fuera de rango')
+            continue
+        tarifas.append(Tarifa(
+            planilla=planilla,
+            concepto=_texto(item.get('concepto'), 200),
+            precio=precio,
+            cantidad=cantidad,
+            subtotal=subtotal
+        ))
+    return tarifas
+
+
+def construir_montos(modelo, planilla: Planilla, datos: List[Dict[str, Any]]) -> list:
+    """Ingresos o egresos con monto positivo"""
+    filas = []
+    for item in datos:
+        if not isinstance(item, dict):
+            _omitir(planilla, modelo._meta.model_name, item, 'no es un objeto')
+            continue
+        monto = _decimal(item.get('monto'), modelo, 'monto')
+        if monto is None or monto <= 0:
+            continue
+        filas.append(modelo(
+            planilla=planilla,
+            concepto=_texto(item.get('concepto'), 200),
+            monto=monto,
+            observaciones=_texto(item.get('observaciones'))
+        ))
+    return filas
+
+
+def construir_control_boletos(planilla: Planilla, datos: List[Dict[str, Any]]) -> List[ControlBoleto]:
+    """
+    Controles de boletos con los totales calculados (bulk_create no llama a
+    save()). Un talonario sin números válidos se omite.
+    """
+    controles = []
+    for item in datos:
+        if not isinstance(item, dict):
+            _omitir(planilla, 'talonario', item, 'no es un objeto')
+            continue
+        numeros = {
+            'numero_inicial': _entero(item.get('numero_inicial')),
+            'numero_final': _entero(item.get('numero_final')),
+            'cantidad_vendidos': _entero(item.get('cantidad_vendidos')),
+            'cantidad_devueltos': _entero(item.get('cantidad_devueltos') or 0),
+            'cantidad_anulados': _entero(item.get('cantidad_anulados') or 0),
+        }
+        invalidos = [campo for campo, valor in numeros.items() if valor is None]
+        if invalidos:
+            _omitir(planilla, 'talonario', item, f"sin {', '.join(invalidos)} válido")
+            continue
+        control = ControlBoleto(planilla=planilla, **numeros)
+        control.calcular_totales()
+        if control.total_boletos <= 0 or control.boletos_faltantes < 0:
+            logger.warning(
+                "Planilla %s: talonario %s-%s inconsistente, se omite",
+                planilla.pk, control.numero_inicial, control.numero_final
+            )
+            continue
+        controles.append(control)
+    return controles
+
+
+def materializar_planilla(planilla: Planilla, datos_extraidos: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """
+    Escribir las filas relacionales de una planilla a partir de sus datos extraídos.
+
+    Las filas anteriores se eliminan y las nuevas se insertan con un
+    bulk_create por modelo, todo dentro de una transacción.
+
+    Args:
+        planilla: Planilla a materializar
+        datos_extraidos: Datos a usar; por defecto planilla.datos_extraidos
+
+    Returns:
+        Dict con la cantidad de filas creadas por modelo
+    """
+    datos = datos_extraidos if datos_extraidos is not None else (planilla.datos_extraidos or {})
+
+    tarifas = construir_tarifas(planilla, datos.get('tarifas') or [])
+    ingresos = construir_montos(Ingreso, planilla, datos.get('ingresos') or [])
+    egresos = construir_montos(Egreso, planilla, datos.get('egresos') or [])
+    controles = construir_control_boletos(planilla, datos.get('control_boletos') or [])
+
+    with transaction.atomic():
+        for modelo in (Tarifa, Ingreso, Egreso, ControlBoleto):
+            modelo.objects.filter(planilla=planilla).delete()
+        Tarifa.objects.bulk_create(tarifas)
+        Ingreso.objects.bulk_create(ingresos)
+        Egreso.objects.bulk_create(egresos)
+        ControlBoleto.objects.bulk_create(controles)
+
+    return {
+        'tarifas': len(tarifas),
+        'ingresos': len(ingresos),
+        'egresos': len(egresos),
+        'control_boletos': len(controles),
+    }
@@ -0,0 +1,198 @@
+"""
+Entrega de archivos de MEDIA_ROOT (imágenes de planillas y miniaturas).
+
+Con MEDIA_SERVIDOR_PROXY configurado Django solo valida el acceso y
+responde una cabecera X-Accel-Redirect (nginx) o X-Sendfile (Apache,
+lighttpd): el proxy envía los bytes y el worker de Python queda libre.
+Sin proxy se responde un FileResponse, que usa wsgi.file_wrapper
+(sendfile) para el archivo completo, con soporte de Range (206) y de
+peticiones condicionales (ETag / Last-Modified).
+
+Las imágenes archivadas viven dentro de un bundle zip que el proxy no
+puede leer: se sirven siempre desde Python.
+"""
+
+import os
+import re
+import zipfile
+from datetime import datetime
+from typing import BinaryIO, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .archivo import ruta_bundle
+
+PROXIES = ('x-accel-redirect', 'x-sendfile')
+
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _Tramo:
+    """Lectura limitada a `largo` bytes de un archivo abierto"""
+
+    def __init__(self, archivo: BinaryIO, largo: int):
+        self.archivo = archivo
+        self.restante = largo
+
+    def read(self, tamaño: int = -1) -> bytes:
+        if self.restante <= 0:
+            return b''
+        if tamaño < 0 or tamaño > self.restante:
+            tamaño = self.restante
+        datos = self.archivo.read(tamaño)
+        self.restante -= len(datos)
+        return datos
+
+    def close(self) -> None:
+        self.archivo.close()
+
+
+def rango_solicitado(request, tamaño: int, etag: str, ultima_modificacion: Optional[int]):
+    """
+    Rango de bytes pedido con la cabecera Range.
+
+    Solo se atiende un rango simple; varios rangos o un If-Range que no
+    coincide con la versión actual se responden con el archivo completo.
+
+    Returns:
+        Tupla (inicio, fin) inclusiva, None para el archivo completo o
+        False si el rango no es satisfacible
+    """
+    cabecera = request.headers.get('Range', '')
+    coincidencia = _RANGO.match(cabecera.replace(' ', ''))
+    if not coincidencia:
+        return None
+
+    si_rango = request.headers.get('If-Range')
+    if si_rango:
+        fecha = parse_http_date_safe(si_rango)
+        vigente = si_rango == etag if fecha is None else fecha == ultima_modificacion
+        if not vigente:
+            return None
+
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        if not fin or int(fin) == 0:
+            return False
+        # bytes=-N: los últimos N bytes
+        return max(0, tamaño - int(fin)), tamaño - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamaño - 1) if fin else tamaño - 1
+    if inicio >= tamaño or fin < inicio:
+        return False
+    return inicio, fin
+
+
+def _responder(request, abrir, tamaño: int, content_type: str, etag: str,
+               ultima_modificacion: Optional[int], cache_control: str, completo_directo: bool):
+    """
+    Respuesta con el contenido de `abrir()` atendiendo condicionales y Range.
+
+    Args:
+        abrir: Función sin argumentos que retorna el archivo abierto
+        completo_directo: El archivo es un archivo real en disco y puede
+            entregarse a FileResponse tal cual (sendfile)
+    """
+    respuesta = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if respuesta is None:
+        rango = rango_solicitado(request, tamaño, etag, ultima_modificacion)
+        if rango is False:
+            respuesta = HttpResponse(status=416)
+            respuesta['Content-Range'] = f'bytes */{tamaño}'
+        elif rango is None:
+            archivo = abrir()
+            cuerpo = archivo if completo_directo else _Tramo(archivo, tamaño)
+            respuesta = FileResponse(cuerpo, content_type=content_type)
+            respuesta['Content-Length'] = tamaño
+        else:
+            inicio, fin = rango
+            archivo = abrir()
+            archivo.seek(inicio)
+            respuesta = FileResponse(_Tramo(archivo, fin - inicio + 1), content_type=content_type, status=206)
+            respuesta['Content-Length'] = fin - inicio + 1
+            respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{tamaño}'
+
+    respuesta['Accept-Ranges'] = 'bytes'
+    respuesta['ETag'] = etag
+    respuesta['Cache-Control'] = cache_control
+    if ultima_modificacion is not None:
+        respuesta['Last-Modified'] = http_date(ultima_modificacion)
+    return respuesta
+
+
+def _cache_control(cache_control: Optional[str]) -> str:
+    return cache_control or f'private, max-age={settings.MEDIA_MAX_AGE}'
+
+
+def servir_archivo(request, ruta: str, content_type: str, etag: Optional[str] = None,
+                   cache_control: Optional[str] = None):
+    """
+    Servir un archivo dentro de MEDIA_ROOT, delegando al proxy si hay uno
+    configurado.
+
+    Args:
+        ruta: Ruta absoluta del archivo
+        etag: ETag a usar; por defecto se deriva del tamaño y la fecha de modificación
+    """
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError as e:
+        raise Http404('Archivo no encontrado') from e
+    etag = etag or quote_etag(f'{estado.st_size:x}-{estado.st_mtime_ns:x}')
+    cache_control = _cache_control(cache_control)
+
+    proxy = settings.MEDIA_SERVIDOR_PROXY
+    if proxy and proxy not in PROXIES:
+        raise ImproperlyConfigured(f"MEDIA_SERVIDOR_PROXY debe ser '' o uno de: {', '.join(PROXIES)}")
+    if proxy:
+        # El proxy resuelve Range y condicionales sobre el archivo real
+        respuesta = HttpResponse(content_type=content_type)
+        if proxy == 'x-accel-redirect':
+            relativa = os.path.relpath(ruta, settings.MEDIA_ROOT).replace(os.sep, '/')
+            respuesta['X-Accel-Redirect'] = settings.MEDIA_PREFIJO_INTERNO.rstrip('/') + '/' + relativa
+        else:
+            respuesta['X-Sendfile'] = ruta
+        respuesta['ETag'] = etag
+        respuesta['Cache-Control'] = cache_control
+        return respuesta
+
+    return _responder(
+        request, lambda: open(ruta, 'rb'), estado.st_size, content_type, etag,
+        int(estado.st_mtime), cache_control, completo_directo=True
+    )
+
+
+def _miembro_bundle(planilla) -> Tuple[zipfile.ZipInfo, str]:
+    ruta = ruta_bundle(planilla.archivo_bundle)
+    try:
+        with zipfile.ZipFile(ruta) as bundle:
+            return bundle.getinfo(planilla.imagen.name), ruta
+    except (FileNotFoundError, KeyError) as e:
+        raise Http404('La imagen archivada no está disponible') from e
+
+
+def servir_imagen(request, planilla, content_type: str):
+    """Servir la imagen de una planilla desde disco o desde su bundle archivado"""
+    if not planilla.imagen:
+        raise Http404('La planilla no tiene imagen disponible')
+    ruta = planilla.imagen.path
+    if os.path.exists(ruta) or not planilla.archivo_bundle:
+        return servir_archivo(request, ruta, content_type)
+
+    info, ruta_zip = _miembro_bundle(planilla)
+
+    def abrir():
+        with zipfile.ZipFile(ruta_zip) as bundle:
+            return bundle.open(info)
+
+    # El CRC del miembro identifica el contenido sin leerlo
+    etag = quote_etag(f'{info.file_size:x}-{info.CRC:x}')
+    ultima_modificacion = int(datetime(*info.date_time).timestamp())
+    return _responder(
+        request, abrir, info.file_size, content_type, etag, ultima_modificacion,
+        _cache_control(None), completo_directo=False
+    )
@@ -0,0 +1,315 @@
+"""
+Métricas de rendimiento expuestas en /metrics con el formato de texto de
+Prometheus.
+
+- MetricasMiddleware mide la latencia de cada petición por vista, y las
+  consultas SQL y el tiempo de base de datos que usó.
+- Las consultas se miden con un execute_wrapper que se instala en cada
+  conexión nueva (también en los workers de la cola).
+- Los servicios registran la duración de las llamadas a Azure separando
+  el envío del análisis del polling, los bytes de imágenes recibidos y los
+  cambios de estado de las planillas.
+- La profundidad de la cola y las planillas por estado se leen de la base
+  de datos al momento de exponer las métricas.
+
+Los valores viven en memoria del proceso: con varios workers de gunicorn
+cada scrape ve el proceso que lo atiende (Prometheus los distingue por
+instancia). Registrar un valor solo toma un lock y suma sobre listas ya
+creadas. El módulo no importa el ORM al cargarse, así lo pueden usar los
+procesos hijos de los pools.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+REGISTRO: List['_Metrica'] = []
+
+Etiquetas = Tuple[str, ...]
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _comillas(valor) -> str:
+    return f'"{_escapar(valor)}"'
+
+
+class _Metrica:
+    tipo = ''
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores: Dict[Etiquetas, object] = {}
+        self._lock = threading.Lock()
+        REGISTRO.append(self)
+
+    def _etiquetas(self, valores: Etiquetas, extra: str = '') -> str:
+        pares = [f'{nombre}={_comillas(valor)}' for nombre, valor in zip(self.etiquetas, valores)]
+        if extra:
+            pares.append(extra)
+        return '{' + ','.join(pares) + '}' if pares else ''
+
+    def lineas(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Contador(_Metrica):
+    """Contador monotónico"""
+
+    tipo = 'counter'
+
+    def inc(self, *etiquetas: str, cantidad: float = 1) -> None:
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def valor(self, *etiquetas: str) -> float:
+        return self._valores.get(etiquetas, 0)
+
+    def lineas(self) -> Iterator[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        for etiquetas, valor in valores:
+            yield f'{self.nombre}{self._etiquetas(etiquetas)} {valor}'
+
+
+class Histograma(_Metrica):
+    """Histograma con límites fijos; cada serie guarda conteos por tramo y la suma"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 limites: Sequence[float] = LIMITES_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites)
+
+    def observar(self, valor: float, *etiquetas: str) -> None:
+        tramo = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._valores.get(etiquetas)
+            if serie is None:
+                serie = self._valores[etiquetas] = [[0] * (len(self.limites) + 1), 0.0]
+            serie[0][tramo] += 1
+            serie[1] += valor
+
+    def total(self, *etiquetas: str) -> int:
+        serie = self._valores.get(etiquetas)
+        return sum(serie[0]) if serie else 0
+
+    def lineas(self) -> Iterator[str]:
+        with self._lock:
+            series = [(etiquetas, list(conteos), suma) for etiquetas, (conteos, suma) in self._valores.items()]
+        for etiquetas, conteos, suma in series:
+            acumulado = 0
+            for limite, conteo in zip(self.limites, conteos):
+                acumulado += conteo
+                yield f'{self.nombre}_bucket{self._etiquetas(etiquetas, f"le={_comillas(limite)}")} {acumulado}'
+            acumulado += conteos[-1]
+            yield f'{self.nombre}_bucket{self._etiquetas(etiquetas, "le=" + _comillas("+Inf"))} {acumulado}'
+            yield f'{self.nombre}_sum{self._etiquetas(etiquetas)} {suma}'
+            yield f'{self.nombre}_count{self._etiquetas(etiquetas)} {acumulado}'
+
+
+class Medidor(_Metrica):
+    """Valor instantáneo calculado por `leer` al exponer las métricas"""
+
+    tipo = 'gauge'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str],
+                 leer: Callable[[], Dict[Etiquetas, float]]):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.leer = leer
+
+    def lineas(self) -> Iterator[str]:
+        for etiquetas, valor in self.leer().items():
+            yield f'{self.nombre}{self._etiquetas(etiquetas)} {valor}'
+
+
+def _trabajos_en_cola() -> Dict[Etiquetas, float]:
+    from django.db.models import Count
+
+    from .models import ProcesamientoJob
+
+    valores = {('queued',): 0, ('running',): 0}
+    filas = (
+        ProcesamientoJob.objects
+        .filter(estado__in=['queued', 'running'])
+        .order_by()
+        .values_list('estado')
+        .annotate(total=Count('id'))
+    )
+    for estado, total in filas:
+        valores[(estado,)] = total
+    return valores
+
+
+def _planillas_por_estado() -> Dict[Etiquetas, float]:
+    from django.db.models import Count
+
+    from .models import Planilla
+
+    filas = Planilla.objects.order_by().values_list('status').annotate(total=Count('id'))
+    return {(estado,): total for estado, total in filas}
+
+
+HTTP_SEGUNDOS = Histograma(
+    'planilla_http_peticion_segundos', 'Duración de las peticiones HTTP por vista',
+    ('metodo', 'vista', 'estado')
+)
+HTTP_CONSULTAS = Histograma(
+    'planilla_http_consultas_sql', 'Consultas SQL por petición HTTP', ('vista',), LIMITES_CONSULTAS
+)
+HTTP_SQL_SEGUNDOS = Histograma(
+    'planilla_http_sql_segundos', 'Tiempo de base de datos por petición HTTP', ('vista',)
+)
+DB_CONSULTA_SEGUNDOS = Histograma(
+    'planilla_db_consulta_segundos', 'Duración de cada consulta SQL (peticiones y workers)'
+)
+AZURE_SEGUNDOS = Histograma(
+    'planilla_azure_segundos', 'Duración de las llamadas a Azure por fase (envio, polling)',
+    ('fase', 'cliente')
+)
+AZURE_ERRORES = Contador(
+    'planilla_azure_errores_total', 'Errores de Azure por fase', ('fase', 'cliente')
+)
+AZURE_REINTENTOS = Contador(
+    'planilla_azure_reintentos_total', 'Envíos de análisis reintentados por estado HTTP', ('estado',)
+)
+AZURE_ESPERA_LIMITE = Histograma(
+    'planilla_azure_espera_limite_segundos', 'Espera por el límite de tasa o de concurrencia de Azure',
+    ('limite',)
+)
+BYTES_SUBIDOS = Contador(
+    'planilla_bytes_subidos_total', 'Bytes de imágenes recibidos', ('via',)
+)
+TRANSICIONES = Contador(
+    'planilla_transiciones_total', 'Cambios de estado de las planillas', ('desde', 'hacia')
+)
+COLA = Medidor(
+    'planilla_cola_trabajos', 'Trabajos de procesamiento en cola o ejecutando', ('estado',), _trabajos_en_cola
+)
+PLANILLAS = Medidor(
+    'planilla_planillas', 'Planillas por estado', ('estado',), _planillas_por_estado
+)
+
+
+def registrar_transicion(anterior: Optional[str], nuevo: str) -> None:
+    """Contar el cambio de estado de una planilla (no hace nada si no cambia)"""
+    if anterior != nuevo:
+        TRANSICIONES.inc(anterior or '', nuevo)
+
+
+@contextmanager
+def medir_azure(fase: str, cliente: str):
+    """
+    Medir una fase de la llamada a Azure y contar sus errores:
+
+        with medir_azure('envio', 'sync'):
+            poller = client.begin_analyze_document(...)
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        AZURE_ERRORES.inc(fase, cliente)
+        raise
+    finally:
+        AZURE_SEGUNDOS.observar(time.perf_counter() - inicio, fase, cliente)
+
+
+# [consultas, segundos] de la petición en curso; None fuera de una petición
+_sql_peticion: ContextVar[Optional[List]] = ContextVar('sql_peticion', default=None)
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        segundos = time.perf_counter() - inicio
+        DB_CONSULTA_SEGUNDOS.observar(segundos)
+        peticion = _sql_peticion.get()
+        if peticion is not None:
+            peticion[0] += 1
+            peticion[1] += segundos
+
+
+def instalar_medicion_sql(sender, connection, **kwargs):  # pylint: disable=unused-argument
+    """Receptor de connection_created: medir todas las consultas de la conexión"""
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+def _vista(request) -> str:
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        # Sin ruta (404): una sola serie, no una por URL
+        return 'sin_ruta'
+    return coincidencia.view_name or coincidencia.route
+
+
+class MetricasMiddleware:
+    """Latencia, consultas SQL y tiempo de base de datos de cada petición"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self._acall(request)
+        inicio = time.perf_counter()
+        sql = [0, 0.0]
+        token = _sql_peticion.set(sql)
+        try:
+            response = self.get_response(request)
+        finally:
+            _sql_peticion.reset(token)
+        self._registrar(request, response, inicio, sql)
+        return response
+
+    async def _acall(self, request):
+        inicio = time.perf_counter()
+        sql = [0, 0.0]
+        token = _sql_peticion.set(sql)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _sql_peticion.reset(token)
+        self._registrar(request, response, inicio, sql)
+        return response
+
+    @staticmethod
+    def _registrar(request, response, inicio: float, sql: List) -> None:
+        vista = _vista(request)
+        HTTP_SEGUNDOS.observar(time.perf_counter() - inicio, request.method, vista, str(response.status_code))
+        HTTP_CONSULTAS.observar(sql[0], vista)
+        HTTP_SQL_SEGUNDOS.observar(sql[1], vista)
+
+
+def exponer() -> str:
+    """Todas las métricas registradas en formato de texto de Prometheus"""
+    lineas = []
+    for metrica in REGISTRO:
+        lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+        lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+        lineas.extend(metrica.lineas())
+    return '\n'.join(lineas) + '\n'
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcesamientoJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('queued', 'En cola'), ('running', 'Ejecutando'), ('done', 'Terminado'), ('failed', 'Fallido')], default='queued', help_text='Estado del trabajo en la cola', max_length=20)),
+                ('worker', models.CharField(blank=True, help_text='Identificador del worker que reclamó el trabajo', max_length=100)),
+                ('intentos', models.PositiveIntegerField(default=0, help_text='Cantidad de veces que el trabajo fue reclamado')),
+                ('error', models.TextField(blank=True, help_text='Mensaje de error si el trabajo falla', null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('planilla', models.ForeignKey(help_text='Planilla a procesar', on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='api.planilla')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Procesamiento',
+                'verbose_name_plural': 'Trabajos de Procesamiento',
+                'ordering': ['fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_creacion'], name='api_procesa_estado_5f9ca6_idx')],
+            },
+        ),
+    ]
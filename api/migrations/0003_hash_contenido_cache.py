@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_procesamientojob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultadoAnalisisCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash_contenido', models.CharField(help_text='SHA-256 de la imagen analizada', max_length=64)),
+                ('model_id', models.CharField(help_text='Modelo de Azure usado en el análisis', max_length=100)),
+                ('datos_extraidos', models.JSONField(help_text='Datos extraídos por Azure Form Recognizer')),
+                ('hits', models.PositiveIntegerField(default=0, help_text='Cantidad de veces que se reutilizó el resultado')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('ultimo_uso', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Resultado en Cache',
+                'verbose_name_plural': 'Resultados en Cache',
+            },
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='hash_contenido',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 del contenido de la imagen subida', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='resultadoanalisiscache',
+            constraint=models.UniqueConstraint(fields=('hash_contenido', 'model_id'), name='resultado_cache_hash_modelo_unico'),
+        ),
+    ]
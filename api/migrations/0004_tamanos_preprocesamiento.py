@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_hash_contenido_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planilla',
+            name='tamaño_original',
+            field=models.PositiveIntegerField(blank=True, help_text='Tamaño de la imagen antes del pre-procesamiento, en bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='tamaño_procesado',
+            field=models.PositiveIntegerField(blank=True, help_text='Tamaño de la imagen pre-procesada enviada a Azure, en bytes', null=True),
+        ),
+    ]
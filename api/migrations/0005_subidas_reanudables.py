@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_tamanos_preprocesamiento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaReanudable',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre_archivo', models.CharField(help_text='Nombre original del archivo', max_length=255)),
+                ('tamaño_total', models.PositiveIntegerField(help_text='Tamaño total del archivo en bytes')),
+                ('tamaño_chunk', models.PositiveIntegerField(help_text='Tamaño de cada chunk en bytes (el último puede ser menor)')),
+                ('sha256', models.CharField(blank=True, help_text='SHA-256 esperado, informado por el cliente (opcional)', max_length=64)),
+                ('estado', models.CharField(choices=[('active', 'En curso'), ('completed', 'Completada')], default='active', help_text='Estado de la subida', max_length=20)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('planilla', models.OneToOneField(blank=True, help_text='Planilla creada al finalizar la subida', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='subida', to='api.planilla')),
+            ],
+            options={
+                'verbose_name': 'Subida Reanudable',
+                'verbose_name_plural': 'Subidas Reanudables',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChunkSubida',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField(help_text='Número del chunk (desde 0)')),
+                ('subida', models.ForeignKey(help_text='Subida a la que pertenece el chunk', on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.subidareanudable')),
+            ],
+            options={
+                'verbose_name': 'Chunk de Subida',
+                'verbose_name_plural': 'Chunks de Subida',
+                'ordering': ['numero'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chunksubida',
+            constraint=models.UniqueConstraint(fields=('subida', 'numero'), name='chunk_subida_unico'),
+        ),
+    ]
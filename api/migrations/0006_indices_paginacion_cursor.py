@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_subidas_reanudables'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='controlboleto',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='control_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='controlboleto',
+            index=models.Index(fields=['planilla', '-fecha_creacion', '-id'], name='control_planilla_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='egreso',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='egreso_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='egreso',
+            index=models.Index(fields=['planilla', '-fecha_creacion', '-id'], name='egreso_planilla_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingreso',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='ingreso_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingreso',
+            index=models.Index(fields=['planilla', '-fecha_creacion', '-id'], name='ingreso_planilla_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planilla',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='planilla_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarifa',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='tarifa_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarifa',
+            index=models.Index(fields=['planilla', '-fecha_creacion', '-id'], name='tarifa_planilla_fecha_idx'),
+        ),
+    ]
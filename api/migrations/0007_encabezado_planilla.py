@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_indices_paginacion_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planilla',
+            name='codigo_conductor',
+            field=models.CharField(blank=True, db_index=True, help_text='Código del conductor', max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='fecha_planilla',
+            field=models.DateField(blank=True, db_index=True, help_text='Fecha de la planilla', null=True),
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='numero_bus',
+            field=models.CharField(blank=True, db_index=True, help_text='Número interno del bus', max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='numero_planilla',
+            field=models.CharField(blank=True, db_index=True, help_text='Número de la planilla impreso en el formulario', max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='patente_bus',
+            field=models.CharField(blank=True, db_index=True, help_text='Patente del bus, normalizada (mayúsculas, sin espacios ni guiones)', max_length=20, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='controlboleto',
+            index=models.Index(fields=['planilla', 'numero_inicial'], name='control_planilla_numero_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='egreso',
+            index=models.Index(fields=['planilla', 'concepto'], name='egreso_planilla_concepto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingreso',
+            index=models.Index(fields=['planilla', 'concepto'], name='ingreso_planilla_concepto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planilla',
+            index=models.Index(fields=['status', '-fecha_creacion', '-id'], name='planilla_status_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarifa',
+            index=models.Index(fields=['planilla', 'concepto'], name='tarifa_planilla_concepto_idx'),
+        ),
+    ]
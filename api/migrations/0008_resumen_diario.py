@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:31
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_encabezado_planilla'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planilla',
+            name='ciudad_origen',
+            field=models.CharField(blank=True, help_text='Ciudad de origen del recorrido', max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='ciudad_retorno',
+            field=models.CharField(blank=True, help_text='Ciudad de retorno del recorrido', max_length=100, null=True),
+        ),
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(help_text='Fecha de la planilla (o de creación si no se leyó)')),
+                ('numero_bus', models.CharField(blank=True, default='', help_text='Número interno del bus', max_length=20)),
+                ('codigo_conductor', models.CharField(blank=True, default='', help_text='Código del conductor', max_length=20)),
+                ('ciudad_origen', models.CharField(blank=True, default='', help_text='Ciudad de origen del recorrido', max_length=100)),
+                ('ciudad_retorno', models.CharField(blank=True, default='', help_text='Ciudad de retorno del recorrido', max_length=100)),
+                ('planillas', models.PositiveIntegerField(default=0, help_text='Cantidad de planillas completadas del grupo')),
+                ('total_ingresos', models.DecimalField(decimal_places=2, default=Decimal('0'), help_text='Suma de los ingresos del grupo', max_digits=14)),
+                ('total_egresos', models.DecimalField(decimal_places=2, default=Decimal('0'), help_text='Suma de los egresos del grupo', max_digits=14)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario',
+                'verbose_name_plural': 'Resúmenes Diarios',
+                'ordering': ['-fecha', 'numero_bus'],
+                'indexes': [models.Index(fields=['numero_bus', 'fecha'], name='resumen_bus_fecha_idx'), models.Index(fields=['codigo_conductor', 'fecha'], name='resumen_conductor_fecha_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumendiario',
+            constraint=models.UniqueConstraint(fields=('fecha', 'numero_bus', 'codigo_conductor', 'ciudad_origen', 'ciudad_retorno'), name='resumen_diario_grupo_unico'),
+        ),
+    ]
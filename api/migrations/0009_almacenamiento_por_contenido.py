@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:37
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_resumen_diario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planilla',
+            name='archivo_bundle',
+            field=models.CharField(blank=True, db_index=True, help_text='Bundle zip (relativo a MEDIA_ROOT) donde se archivó la imagen', max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='planilla',
+            name='imagen',
+            field=models.ImageField(help_text='Imagen de la planilla de recaudación', storage=api.storage.obtener_storage_planillas, upload_to='planillas/'),
+        ),
+    ]
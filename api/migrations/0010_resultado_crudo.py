@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:45
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_almacenamiento_por_contenido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultadoCrudo',
+            fields=[
+                ('planilla', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resultado_crudo', serialize=False, to='api.planilla')),
+                ('model_id', models.CharField(blank=True, default='', help_text='Modelo de Azure que produjo el resultado', max_length=100)),
+                ('contenido', models.BinaryField(help_text='AnalyzeResult.to_dict() en JSON comprimido con zlib')),
+                ('tamaño_original', models.PositiveIntegerField(help_text='Tamaño del JSON sin comprimir en bytes')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Resultado Crudo',
+                'verbose_name_plural': 'Resultados Crudos',
+            },
+        ),
+        migrations.AlterField(
+            model_name='planilla',
+            name='datos_extraidos',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Datos extraídos por Azure Form Recognizer', null=True),
+        ),
+        migrations.AlterField(
+            model_name='resultadoanalisiscache',
+            name='datos_extraidos',
+            field=models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Datos extraídos por Azure Form Recognizer'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_resultado_crudo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotePlanillas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.FileField(help_text='Archivo PDF o TIFF con las planillas del lote', upload_to='lotes/')),
+                ('nombre_archivo', models.CharField(blank=True, help_text='Nombre original del archivo', max_length=255)),
+                ('tamaño_archivo', models.PositiveIntegerField(help_text='Tamaño del archivo en bytes')),
+                ('paginas', models.PositiveIntegerField(help_text='Cantidad de páginas del archivo')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('processing', 'Procesando'), ('completed', 'Completada'), ('error', 'Error')], default='pending', help_text='Estado del procesamiento del lote', max_length=20)),
+                ('error_procesamiento', models.TextField(blank=True, help_text='Mensaje de error si el procesamiento falla', null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Lote de Planillas',
+                'verbose_name_plural': 'Lotes de Planillas',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='pagina',
+            field=models.PositiveIntegerField(blank=True, help_text='Página del lote donde está la planilla (desde 1)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='procesamientojob',
+            name='planilla',
+            field=models.ForeignKey(blank=True, help_text='Planilla a procesar', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='api.planilla'),
+        ),
+        migrations.AddField(
+            model_name='planilla',
+            name='lote',
+            field=models.ForeignKey(blank=True, help_text='Lote PDF/TIFF del que se extrajo la planilla', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='planillas', to='api.loteplanillas'),
+        ),
+        migrations.AddField(
+            model_name='procesamientojob',
+            name='lote',
+            field=models.ForeignKey(blank=True, help_text='Lote a procesar (en lugar de una planilla)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='api.loteplanillas'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:14
+
+from django.db import migrations, models
+
+
+def cerrar_duplicados(apps, schema_editor):
+    """Dejar activo solo el trabajo más antiguo de cada planilla o lote"""
+    ProcesamientoJob = apps.get_model('api', 'ProcesamientoJob')
+    vistos = set()
+    activos = ProcesamientoJob.objects.filter(estado__in=['queued', 'running']).order_by('fecha_creacion', 'id')
+    for job in activos.only('id', 'planilla_id', 'lote_id'):
+        clave = ('lote', job.lote_id) if job.lote_id is not None else ('planilla', job.planilla_id)
+        if clave in vistos:
+            ProcesamientoJob.objects.filter(pk=job.pk).update(estado='failed', error='Trabajo duplicado')
+        vistos.add(clave)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_lotes_planillas'),
+    ]
+
+    operations = [
+        migrations.RunPython(cerrar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='procesamientojob',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['queued', 'running'])), fields=('planilla',), name='job_planilla_activo_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='procesamientojob',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['queued', 'running'])), fields=('lote',), name='job_lote_activo_unico'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_job_activo_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(help_text='Contador: hits o misses', max_length=20, unique=True)),
+                ('valor', models.PositiveBigIntegerField(default=0, help_text='Cantidad acumulada')),
+            ],
+            options={
+                'verbose_name': 'Contador de Cache',
+                'verbose_name_plural': 'Contadores de Cache',
+            },
+        ),
+    ]
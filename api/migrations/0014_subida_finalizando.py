@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_contadores_cache'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subidareanudable',
+            name='estado',
+            field=models.CharField(choices=[('active', 'En curso'), ('finalizing', 'Finalizando'), ('completed', 'Completada')], default='active', help_text='Estado de la subida', max_length=20),
+        ),
+    ]
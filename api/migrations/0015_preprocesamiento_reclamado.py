@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:36
+
+from django.db import migrations, models
+
+
+def limpiar_reclamos(apps, schema_editor):
+    """Quitar el tamaño_original que marcaba un reclamo sin terminar (el reclamo ahora es una fecha)"""
+    Planilla = apps.get_model('api', 'Planilla')
+    Planilla.objects.filter(tamaño_original__isnull=False, tamaño_procesado__isnull=True).update(tamaño_original=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_subida_finalizando'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planilla',
+            name='preprocesamiento_reclamado',
+            field=models.DateTimeField(blank=True, help_text='Inicio del pre-procesamiento en curso; vence tras PREPROCESAMIENTO_ESPERA segundos', null=True),
+        ),
+        migrations.RunPython(limpiar_reclamos, migrations.RunPython.noop),
+    ]
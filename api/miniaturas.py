@@ -0,0 +1,100 @@
+"""
+Miniaturas de las imágenes de planillas con cache en disco.
+
+Se generan al primer pedido en MEDIA_ROOT/miniaturas/<lado>/ y se reutilizan
+desde disco. El nombre se deriva del SHA-256 del contenido, así la URL de
+una miniatura nunca cambia de contenido y puede cachearse indefinidamente.
+"""
+
+import logging
+import os
+import uuid
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from .archivo import abrir_imagen
+
+logger = logging.getLogger(__name__)
+
+
+def tamaños_miniatura():
+    """Lados máximos permitidos, en píxeles"""
+    return settings.MINIATURAS_TAMANOS
+
+
+def clave_miniatura(planilla) -> str:
+    """Identificador estable del contenido de la imagen de la planilla"""
+    return planilla.hash_contenido or f'planilla-{planilla.pk}'
+
+
+def ruta_miniatura(planilla, lado: int) -> str:
+    clave = clave_miniatura(planilla)
+    # Subdirectorio por los dos primeros caracteres para no acumular un solo directorio
+    return os.path.join(settings.MEDIA_ROOT, 'miniaturas', str(lado), clave[:2], f'{clave}.jpg')
+
+
+def etag_miniatura(planilla, lado: int) -> str:
+    return f'"{clave_miniatura(planilla)}-{lado}"'
+
+
+def generar_miniatura(origen, destino: str, lado: int, calidad: int) -> None:
+    """
+    Escribir una miniatura JPEG de `origen` (ruta o archivo abierto) con el
+    lado mayor <= `lado`.
+    Se escribe a un temporal y se renombra, así un pedido concurrente nunca
+    lee un archivo a medias.
+    """
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with Image.open(origen) as imagen:
+        # draft() permite al decodificador JPEG reducir al leer
+        imagen.draft('RGB', (lado, lado))
+        imagen = ImageOps.exif_transpose(imagen)
+        imagen.thumbnail((lado, lado), Image.LANCZOS)
+        if imagen.mode not in ('RGB', 'L'):
+            imagen = imagen.convert('RGB')
+        # Un nombre por escritura: dos hilos del mismo proceso no comparten el temporal
+        temporal = f'{destino}.{uuid.uuid4().hex}.tmp'
+        try:
+            imagen.save(temporal, format='JPEG', quality=calidad, optimize=True, progressive=True)
+            os.replace(temporal, destino)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+
+def obtener_miniatura(planilla, lado: int) -> Optional[str]:
+    """
+    Ruta de la miniatura de la planilla, generándola si aún no existe.
+
+    Returns:
+        Ruta en disco, o None si la planilla no tiene imagen disponible
+    """
+    destino = ruta_miniatura(planilla, lado)
+    if os.path.exists(destino):
+        return destino
+
+    # La imagen puede estar en el directorio caliente o en un bundle archivado
+    origen = abrir_imagen(planilla)
+    if origen is None:
+        return None
+    with origen:
+        generar_miniatura(origen, destino, lado, settings.MINIATURAS_CALIDAD_JPEG)
+    logger.info("Miniatura %spx generada para planilla %s", lado, planilla.pk)
+    return destino
+
+
+def urls_miniaturas(planilla, request=None) -> Dict[str, str]:
+    """
+    URLs de las miniaturas de la planilla por lado, absolutas si hay request.
+    Llevan la clave del contenido como versión para poder cachearlas sin expiración.
+    """
+    version = clave_miniatura(planilla)[:16]
+    urls = {}
+    for lado in tamaños_miniatura():
+        url = reverse('planilla-miniatura', kwargs={'pk': planilla.pk, 'lado': lado}) + f'?v={version}'
+        urls[str(lado)] = request.build_absolute_uri(url) if request is not None else url
+    return urls
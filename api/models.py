@@ -1,7 +1,28 @@
+import uuid
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from .storage import obtener_storage_planillas
+
+
+class PlanillaQuerySet(models.QuerySet):
+    """
+    Consultas de Planilla ajustadas a cada uso de la API.
+    datos_extraidos es una columna JSON grande: solo se carga donde se usa.
+    """
+    
+    RELACIONES = ('tarifas', 'ingresos', 'egresos', 'control_boletos')
+    
+    def sin_datos_extraidos(self):
+        """Omitir la columna JSON de datos extraídos"""
+        return self.defer('datos_extraidos')
+    
+    def con_relaciones(self):
+        """Precargar tarifas, ingresos, egresos y control de boletos (una consulta por relación)"""
+        return self.prefetch_related(*self.RELACIONES)
+
 
 class Planilla(models.Model):
     """
@@ -19,6 +40,7 @@ class Planilla(models.Model):
     # Campos principales
     imagen = models.ImageField(
         upload_to='planillas/',
+        storage=obtener_storage_planillas,
         help_text='Imagen de la planilla de recaudación'
     )
     fecha_creacion = models.DateTimeField(auto_now_add=True)
@@ -34,6 +56,7 @@ class Planilla(models.Model):
     datos_extraidos = models.JSONField(
         null=True,
         blank=True,
+        encoder=DjangoJSONEncoder,
         help_text='Datos extraídos por Azure Form Recognizer'
     )
     error_procesamiento = models.TextField(
@@ -54,16 +77,161 @@ class Planilla(models.Model):
         blank=True,
         help_text='Tamaño del archivo en bytes'
     )
+    tamaño_original = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Tamaño de la imagen antes del pre-procesamiento, en bytes'
+    )
+    tamaño_procesado = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Tamaño de la imagen pre-procesada enviada a Azure, en bytes'
+    )
+    preprocesamiento_reclamado = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text='Inicio del pre-procesamiento en curso; vence tras PREPROCESAMIENTO_ESPERA segundos'
+    )
+    hash_contenido = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='SHA-256 del contenido de la imagen subida'
+    )
+    archivo_bundle = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='Bundle zip (relativo a MEDIA_ROOT) donde se archivó la imagen'
+    )
+    lote = models.ForeignKey(
+        'LotePlanillas',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='planillas',
+        help_text='Lote PDF/TIFF del que se extrajo la planilla'
+    )
+    pagina = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Página del lote donde está la planilla (desde 1)'
+    )
+    
+    # Encabezado de la planilla, copiado de datos_extraidos['info_general']
+    # al terminar el procesamiento para poder filtrar por índice
+    numero_planilla = models.CharField(
+        max_length=50,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='Número de la planilla impreso en el formulario'
+    )
+    fecha_planilla = models.DateField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='Fecha de la planilla'
+    )
+    numero_bus = models.CharField(
+        max_length=20,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='Número interno del bus'
+    )
+    patente_bus = models.CharField(
+        max_length=20,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='Patente del bus, normalizada (mayúsculas, sin espacios ni guiones)'
+    )
+    codigo_conductor = models.CharField(
+        max_length=20,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='Código del conductor'
+    )
+    ciudad_origen = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        help_text='Ciudad de origen del recorrido'
+    )
+    ciudad_retorno = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        help_text='Ciudad de retorno del recorrido'
+    )
+    
+    objects = PlanillaQuerySet.as_manager()
     
     class Meta:
         ordering = ['-fecha_creacion']
         verbose_name = 'Planilla'
         verbose_name_plural = 'Planillas'
+        indexes = [
+            # Paginación por cursor (api.pagination.FechaCursorPagination)
+            models.Index(fields=['-fecha_creacion', '-id'], name='planilla_fecha_id_idx'),
+            models.Index(fields=['status', '-fecha_creacion', '-id'], name='planilla_status_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"Planilla {self.id} - {self.get_status_display()}"
 
 
+class LotePlanillas(models.Model):
+    """
+    Archivo PDF o TIFF de varias páginas con muchas planillas escaneadas.
+    Se analiza con una sola llamada a Azure y cada documento encontrado
+    queda como una Planilla con la imagen recortada de su página.
+    """
+    
+    archivo = models.FileField(
+        upload_to='lotes/',
+        help_text='Archivo PDF o TIFF con las planillas del lote'
+    )
+    nombre_archivo = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text='Nombre original del archivo'
+    )
+    tamaño_archivo = models.PositiveIntegerField(
+        help_text='Tamaño del archivo en bytes'
+    )
+    paginas = models.PositiveIntegerField(
+        help_text='Cantidad de páginas del archivo'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Planilla.STATUS_CHOICES,
+        default='pending',
+        help_text='Estado del procesamiento del lote'
+    )
+    error_procesamiento = models.TextField(
+        null=True,
+        blank=True,
+        help_text='Mensaje de error si el procesamiento falla'
+    )
+    
+    # Metadatos
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-fecha_creacion']
+        verbose_name = 'Lote de Planillas'
+        verbose_name_plural = 'Lotes de Planillas'
+    
+    def __str__(self):
+        return f"Lote {self.id} - {self.paginas} páginas ({self.get_status_display()})"
+
+
 class Tarifa(models.Model):
     """
     Modelo que representa las tarifas de la empresa.
@@ -106,6 +274,11 @@ class Tarifa(models.Model):
         ordering = ['concepto']
         verbose_name = 'Tarifa'
         verbose_name_plural = 'Tarifas'
+        indexes = [
+            models.Index(fields=['-fecha_creacion', '-id'], name='tarifa_fecha_id_idx'),
+            models.Index(fields=['planilla', '-fecha_creacion', '-id'], name='tarifa_planilla_fecha_idx'),
+            models.Index(fields=['planilla', 'concepto'], name='tarifa_planilla_concepto_idx'),
+        ]
     
     def __str__(self):
         return f"{self.concepto} - ${self.precio}"
@@ -146,6 +319,11 @@ class Ingreso(models.Model):
         ordering = ['concepto']
         verbose_name = 'Ingreso'
         verbose_name_plural = 'Ingresos'
+        indexes = [
+            models.Index(fields=['-fecha_creacion', '-id'], name='ingreso_fecha_id_idx'),
+            models.Index(fields=['planilla', '-fecha_creacion', '-id'], name='ingreso_planilla_fecha_idx'),
+            models.Index(fields=['planilla', 'concepto'], name='ingreso_planilla_concepto_idx'),
+        ]
     
     def __str__(self):
         return f"{self.concepto} - ${self.monto}"
@@ -186,6 +364,11 @@ class Egreso(models.Model):
         ordering = ['concepto']
         verbose_name = 'Egreso'
         verbose_name_plural = 'Egresos'
+        indexes = [
+            models.Index(fields=['-fecha_creacion', '-id'], name='egreso_fecha_id_idx'),
+            models.Index(fields=['planilla', '-fecha_creacion', '-id'], name='egreso_planilla_fecha_idx'),
+            models.Index(fields=['planilla', 'concepto'], name='egreso_planilla_concepto_idx'),
+        ]
     
     def __str__(self):
         return f"{self.concepto} - ${self.monto}"
@@ -238,8 +421,17 @@ class ControlBoleto(models.Model):
         ordering = ['numero_inicial']
         verbose_name = 'Control de Boleto'
         verbose_name_plural = 'Controles de Boletos'
+        indexes = [
+            models.Index(fields=['-fecha_creacion', '-id'], name='control_fecha_id_idx'),
+            models.Index(fields=['planilla', '-fecha_creacion', '-id'], name='control_planilla_fecha_idx'),
+            models.Index(fields=['planilla', 'numero_inicial'], name='control_planilla_numero_idx'),
+        ]
     
-    def save(self, *args, **kwargs):
+    def calcular_totales(self):
+        """
+        Calcular total_boletos y boletos_faltantes.
+        Se llama desde save() y también antes de bulk_create, que no pasa por save().
+        """
         # Calcular total de boletos
         self.total_boletos = self.numero_final - self.numero_inicial + 1
         
@@ -247,8 +439,371 @@ class ControlBoleto(models.Model):
         self.boletos_faltantes = self.total_boletos - (
             self.cantidad_vendidos + self.cantidad_devueltos + self.cantidad_anulados
         )
-        
+    
+    def save(self, *args, **kwargs):
+        self.calcular_totales()
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Talonario {self.numero_inicial}-{self.numero_final}"
+
+
+class ProcesamientoJob(models.Model):
+    """
+    Trabajo de procesamiento en cola para Azure Form Recognizer.
+    Los workers (manage.py procesar_planillas) reclaman los trabajos en
+    estado 'queued' y escriben el resultado en la planilla asociada, o
+    crean las planillas del lote asociado.
+    """
+    
+    ESTADO_CHOICES = [
+        ('queued', 'En cola'),
+        ('running', 'Ejecutando'),
+        ('done', 'Terminado'),
+        ('failed', 'Fallido'),
+    ]
+    
+    planilla = models.ForeignKey(
+        Planilla,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        help_text='Planilla a procesar'
+    )
+    lote = models.ForeignKey(
+        LotePlanillas,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        help_text='Lote a procesar (en lugar de una planilla)'
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='queued',
+        help_text='Estado del trabajo en la cola'
+    )
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text='Identificador del worker que reclamó el trabajo'
+    )
+    intentos = models.PositiveIntegerField(
+        default=0,
+        help_text='Cantidad de veces que el trabajo fue reclamado'
+    )
+    error = models.TextField(
+        null=True,
+        blank=True,
+        help_text='Mensaje de error si el trabajo falla'
+    )
+    
+    # Metadatos
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['fecha_creacion']
+        verbose_name = 'Trabajo de Procesamiento'
+        verbose_name_plural = 'Trabajos de Procesamiento'
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion']),
+        ]
+        constraints = [
+            # Un solo trabajo activo por planilla o lote, aunque se encole en paralelo
+            models.UniqueConstraint(
+                fields=['planilla'],
+                condition=models.Q(estado__in=['queued', 'running']),
+                name='job_planilla_activo_unico'
+            ),
+            models.UniqueConstraint(
+                fields=['lote'],
+                condition=models.Q(estado__in=['queued', 'running']),
+                name='job_lote_activo_unico'
+            ),
+        ]
+    
+    def __str__(self):
+        if self.lote_id is not None:
+            return f"Job {self.id} - Lote {self.lote_id} ({self.get_estado_display()})"
+        return f"Job {self.id} - Planilla {self.planilla_id} ({self.get_estado_display()})"
+
+
+class ResultadoAnalisisCache(models.Model):
+    """
+    Cache de resultados de Azure Form Recognizer por contenido de imagen.
+    Permite reutilizar los datos extraídos cuando se sube de nuevo la misma
+    imagen, sin volver a llamar a Azure.
+    """
+    
+    hash_contenido = models.CharField(
+        max_length=64,
+        help_text='SHA-256 de la imagen analizada'
+    )
+    model_id = models.CharField(
+        max_length=100,
+        help_text='Modelo de Azure usado en el análisis'
+    )
+    datos_extraidos = models.JSONField(
+        encoder=DjangoJSONEncoder,
+        help_text='Datos extraídos por Azure Form Recognizer'
+    )
+    hits = models.PositiveIntegerField(
+        default=0,
+        help_text='Cantidad de veces que se reutilizó el resultado'
+    )
+    
+    # Metadatos
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    ultimo_uso = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Resultado en Cache'
+        verbose_name_plural = 'Resultados en Cache'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['hash_contenido', 'model_id'],
+                name='resultado_cache_hash_modelo_unico'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.hash_contenido[:12]} ({self.model_id})"
+
+
+class ContadorCache(models.Model):
+    """
+    Contadores de aciertos y fallos de la cache de resultados. Viven en la
+    base de datos para sumar las consultas de todos los procesos (web y
+    workers) y sobrevivir a los reinicios y a la expulsión de entradas.
+    """
+    
+    nombre = models.CharField(
+        max_length=20,
+        unique=True,
+        help_text='Contador: hits o misses'
+    )
+    valor = models.PositiveBigIntegerField(
+        default=0,
+        help_text='Cantidad acumulada'
+    )
+    
+    class Meta:
+        verbose_name = 'Contador de Cache'
+        verbose_name_plural = 'Contadores de Cache'
+    
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
+
+
+class ResultadoCrudo(models.Model):
+    """
+    Resultado completo del análisis de Azure (AnalyzeResult.to_dict()) como
+    JSON compacto comprimido con zlib. Permite volver a mapear los datos
+    extraídos sin llamar a Azure (manage.py reextraer).
+    """
+    
+    planilla = models.OneToOneField(
+        Planilla,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='resultado_crudo'
+    )
+    model_id = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text='Modelo de Azure que produjo el resultado'
+    )
+    contenido = models.BinaryField(
+        help_text='AnalyzeResult.to_dict() en JSON comprimido con zlib'
+    )
+    tamaño_original = models.PositiveIntegerField(
+        help_text='Tamaño del JSON sin comprimir en bytes'
+    )
+    
+    # Metadatos
+    fecha_creacion = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Resultado Crudo'
+        verbose_name_plural = 'Resultados Crudos'
+    
+    def __str__(self):
+        return f"Resultado crudo de planilla {self.planilla_id}"
+
+
+class SubidaReanudable(models.Model):
+    """
+    Sesión de subida reanudable de una imagen de planilla.
+    El cliente envía la imagen en chunks numerados de tamaño fijo; si la
+    conexión se corta solo reenvía los chunks que faltan.
+    """
+    
+    ESTADO_CHOICES = [
+        ('active', 'En curso'),
+        ('finalizing', 'Finalizando'),
+        ('completed', 'Completada'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    nombre_archivo = models.CharField(
+        max_length=255,
+        help_text='Nombre original del archivo'
+    )
+    tamaño_total = models.PositiveIntegerField(
+        help_text='Tamaño total del archivo en bytes'
+    )
+    tamaño_chunk = models.PositiveIntegerField(
+        help_text='Tamaño de cada chunk en bytes (el último puede ser menor)'
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text='SHA-256 esperado, informado por el cliente (opcional)'
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='active',
+        help_text='Estado de la subida'
+    )
+    planilla = models.OneToOneField(
+        Planilla,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='subida',
+        help_text='Planilla creada al finalizar la subida'
+    )
+    
+    # Metadatos
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-fecha_creacion']
+        verbose_name = 'Subida Reanudable'
+        verbose_name_plural = 'Subidas Reanudables'
+    
+    def __str__(self):
+        return f"Subida {self.id} - {self.nombre_archivo}"
+    
+    @property
+    def total_chunks(self) -> int:
+        return (self.tamaño_total + self.tamaño_chunk - 1) // self.tamaño_chunk
+    
+    def largo_chunk(self, numero: int) -> int:
+        """Largo esperado del chunk `numero` (el último puede ser menor)"""
+        inicio = numero * self.tamaño_chunk
+        return min(self.tamaño_chunk, self.tamaño_total - inicio)
+
+
+class ChunkSubida(models.Model):
+    """
+    Chunk recibido de una subida reanudable. Una fila por chunk: insertar
+    es atómico, así chunks enviados en paralelo no se pisan entre sí.
+    """
+    
+    subida = models.ForeignKey(
+        SubidaReanudable,
+        on_delete=models.CASCADE,
+        related_name='chunks',
+        help_text='Subida a la que pertenece el chunk'
+    )
+    numero = models.PositiveIntegerField(
+        help_text='Número del chunk (desde 0)'
+    )
+    
+    class Meta:
+        ordering = ['numero']
+        verbose_name = 'Chunk de Subida'
+        verbose_name_plural = 'Chunks de Subida'
+        constraints = [
+            models.UniqueConstraint(fields=['subida', 'numero'], name='chunk_subida_unico'),
+        ]
+    
+    def __str__(self):
+        return f"Chunk {self.numero} de {self.subida_id}"
+
+
+class ResumenDiario(models.Model):
+    """
+    Totales precalculados de ingresos y egresos por día, bus, conductor y
+    ruta. Se actualiza el grupo de cada planilla al completarse, así los
+    reportes leen pocas filas en lugar de todas las líneas de las planillas.
+    """
+    
+    fecha = models.DateField(
+        help_text='Fecha de la planilla (o de creación si no se leyó)'
+    )
+    numero_bus = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        help_text='Número interno del bus'
+    )
+    codigo_conductor = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        help_text='Código del conductor'
+    )
+    ciudad_origen = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text='Ciudad de origen del recorrido'
+    )
+    ciudad_retorno = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text='Ciudad de retorno del recorrido'
+    )
+    
+    # Totales
+    planillas = models.PositiveIntegerField(
+        default=0,
+        help_text='Cantidad de planillas completadas del grupo'
+    )
+    total_ingresos = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0'),
+        help_text='Suma de los ingresos del grupo'
+    )
+    total_egresos = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0'),
+        help_text='Suma de los egresos del grupo'
+    )
+    
+    # Metadatos
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-fecha', 'numero_bus']
+        verbose_name = 'Resumen Diario'
+        verbose_name_plural = 'Resúmenes Diarios'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'numero_bus', 'codigo_conductor', 'ciudad_origen', 'ciudad_retorno'],
+                name='resumen_diario_grupo_unico'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['numero_bus', 'fecha'], name='resumen_bus_fecha_idx'),
+            models.Index(fields=['codigo_conductor', 'fecha'], name='resumen_conductor_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.fecha} bus {self.numero_bus or '-'} ({self.planillas} planillas)"
+    
+    @property
+    def balance(self) -> Decimal:
+        return self.total_ingresos - self.total_egresos
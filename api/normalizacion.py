@@ -0,0 +1,326 @@
+"""
+Normalización de los campos extraídos por el modelo rendibus.
+
+El mapa de campos es declarativo: cada sección (tarifas, ingresos, egresos,
+boletos, encabezado) lista los campos del modelo de Azure y el parser que
+les corresponde (montos CLP, enteros, fechas, horas, patentes). Un valor
+que no se puede interpretar se registra como error de ese campo y el resto
+del documento se normaliza igual.
+
+Los campos pueden venir con la forma del JSON REST de Azure (valueString,
+valueNumber, valueDate...) o con la de DocumentField.to_dict() (value,
+value_type) e incluso como objetos del SDK.
+
+normalizar_lote procesa muchos documentos por columnas: cada campo se
+parsea una vez por valor distinto del lote, así re-normalizar resultados
+guardados cuesta poco aunque sean miles. El módulo no usa el ORM y puede
+correr en procesos hijos.
+"""
+
+import re
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y', '%d.%m.%Y')
+
+# Claves de valor del JSON REST, en orden de preferencia
+CLAVES_VALOR = (
+    'valueString', 'valueNumber', 'valueInteger', 'valueDate', 'valueTime', 'valueCurrency',
+)
+
+_MONEDA = re.compile(r'\$|CLP|\s', re.IGNORECASE)
+_MONTO = re.compile(r'^-?[\d.,]*\d[\d.,]*$')
+_MILES = re.compile(r'^-?\d{1,3}([.,]\d{3})+$')
+_SEPARADORES_ENTERO = re.compile(r'[\s.,]')
+_ENTERO = re.compile(r'^\d+$')
+_HORA = re.compile(r'^(\d{1,2})\s*[:.hH]\s*(\d{2})')
+_HORA_COMPACTA = re.compile(r'^(\d{2})(\d{2})$')
+_SEPARADORES_PATENTE = re.compile(r'[\s.\-·]')
+_PATENTE = re.compile(r'^[A-Z0-9]{5,8}$')
+
+
+def normalizar_patente(patente: Any) -> Optional[str]:
+    """Patente en mayúsculas, sin espacios, guiones ni puntos (AB-CD 12 -> ABCD12)"""
+    if not patente:
+        return None
+    return _SEPARADORES_PATENTE.sub('', str(patente)).upper() or None
+
+
+def parsear_fecha(valor: Any) -> Optional[date]:
+    """Fecha de la planilla en los formatos habituales; None si no se reconoce"""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    if not valor:
+        return None
+    texto = str(valor).strip()[:10]
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+# Parsers: reciben un valor no vacío y lanzan ValueError si no es válido
+
+def parsear_clp(valor: Any) -> float:
+    """
+    Monto en pesos: '$ 12.500' -> 12500.0. El punto es separador de miles;
+    la coma es decimal salvo que agrupe de a tres dígitos (lectura '12,500').
+    """
+    if isinstance(valor, bool):
+        raise ValueError(f'Monto inválido: {valor!r}')
+    if isinstance(valor, (int, float, Decimal)):
+        return float(valor)
+    texto = _MONEDA.sub('', str(valor))
+    if not _MONTO.match(texto):
+        raise ValueError(f'Monto inválido: {valor!r}')
+    if '.' in texto and ',' in texto:
+        # El último separador es el decimal
+        if texto.rfind(',') > texto.rfind('.'):
+            texto = texto.replace('.', '').replace(',', '.')
+        else:
+            texto = texto.replace(',', '')
+    elif '.' in texto or _MILES.match(texto):
+        texto = texto.replace('.', '').replace(',', '')
+    else:
+        texto = texto.replace(',', '.')
+    try:
+        return float(texto)
+    except ValueError:
+        raise ValueError(f'Monto inválido: {valor!r}') from None
+
+
+def parsear_entero(valor: Any) -> int:
+    """Número de boleto: '001.234' -> 1234"""
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        if valor != int(valor) or valor < 0:
+            raise ValueError(f'Número inválido: {valor!r}')
+        return int(valor)
+    texto = _SEPARADORES_ENTERO.sub('', str(valor))
+    if not _ENTERO.match(texto):
+        raise ValueError(f'Número inválido: {valor!r}')
+    return int(texto)
+
+
+def parsear_fecha_iso(valor: Any) -> str:
+    fecha = parsear_fecha(valor)
+    if fecha is None:
+        raise ValueError(f'Fecha inválida: {valor!r}')
+    return fecha.isoformat()
+
+
+def parsear_hora(valor: Any) -> str:
+    """Hora 'HH:MM' desde '8:30', '08.30', '8h30', '0830' o un time"""
+    if isinstance(valor, (time, datetime)):
+        return valor.strftime('%H:%M')
+    texto = str(valor).strip()
+    coincidencia = _HORA.match(texto) or _HORA_COMPACTA.match(texto)
+    if not coincidencia:
+        raise ValueError(f'Hora inválida: {valor!r}')
+    horas, minutos = int(coincidencia.group(1)), int(coincidencia.group(2))
+    if horas > 23 or minutos > 59:
+        raise ValueError(f'Hora inválida: {valor!r}')
+    return f'{horas:02d}:{minutos:02d}'
+
+
+def parsear_patente(valor: Any) -> str:
+    patente = normalizar_patente(valor)
+    if not patente or not _PATENTE.match(patente):
+        raise ValueError(f'Patente inválida: {valor!r}')
+    return patente
+
+
+def parsear_texto(valor: Any) -> str:
+    return str(valor).strip()
+
+
+# Mapa de campos del modelo rendibus
+
+TARIFAS = [f'Tarifa {i}' for i in range(1, 7)]
+
+# Campo -> observaciones del ingreso
+INGRESOS = {
+    'Total Ingreso Ruta': 'Ingreso en ruta',
+    'Total Ingreso Oficina': 'Ingreso en oficina',
+}
+
+EGRESOS = ['Losa', 'Cena', 'Viáticos', 'Pensión', 'Otros']
+
+# (ticket inicial, ticket final) por tarifa
+TICKETS = [(f'Ticket Inicial T{i}', f'Ticket Final T{i}') for i in range(1, 7)]
+
+# Clave de info_general -> (campo, parser)
+INFO_GENERAL = {
+    'ciudad_origen': ('Ciudad Origen', parsear_texto),
+    'ciudad_retorno': ('Ciudad Retorno', parsear_texto),
+    'fecha': ('Fecha', parsear_fecha_iso),
+    'numero_planilla': ('Nro Planilla', parsear_texto),
+    'conductor': ('Nom. Conductor', parsear_texto),
+    'codigo_conductor': ('Cód. Conductor', parsear_texto),
+    'asistente': ('Nom. Asistente', parsear_texto),
+    'codigo_asistente': ('Cód. Asistente', parsear_texto),
+    'numero_bus': ('Número Bus', parsear_texto),
+    'patente_bus': ('Patente Bus', parsear_patente),
+    'horario_origen': ('Horario Horigen', parsear_hora),
+    'horario_retorno': ('Horario Retorno', parsear_hora),
+}
+
+# Campo -> parser, para todos los campos que se leen
+PARSERS: Dict[str, Callable[[Any], Any]] = {
+    **{campo: parsear_clp for campo in TARIFAS},
+    **{campo: parsear_clp for campo in INGRESOS},
+    **{campo: parsear_clp for campo in EGRESOS},
+    **{campo: parsear_entero for par in TICKETS for campo in par},
+    **{campo: parser for campo, parser in INFO_GENERAL.values()},
+}
+
+
+def valor_campo(campo: Any) -> Any:
+    """Valor crudo de un campo en cualquiera de sus formas; None si está vacío"""
+    if campo is None:
+        return None
+    if isinstance(campo, dict):
+        if 'value' in campo:
+            valor = campo['value']
+        else:
+            valor = next((campo[clave] for clave in CLAVES_VALOR if campo.get(clave) not in (None, '')), None)
+        if valor in (None, ''):
+            valor = campo.get('content')
+    else:
+        valor = getattr(campo, 'value', None)
+        if valor in (None, ''):
+            valor = getattr(campo, 'content', None)
+
+    # Moneda: {'amount': ...} en JSON, CurrencyValue en el SDK
+    if isinstance(valor, dict) and 'amount' in valor:
+        valor = valor['amount']
+    elif hasattr(valor, 'amount'):
+        valor = valor.amount
+    if isinstance(valor, str) and not valor.strip():
+        return None
+    return valor
+
+
+def campos_documento(documentos: Any) -> Dict[str, Any]:
+    """Campos del primer documento analizado (dict o AnalyzedDocument)"""
+    if not documentos:
+        return {}
+    documento = documentos[0]
+    campos = documento.get('fields') if isinstance(documento, dict) else getattr(documento, 'fields', None)
+    return campos or {}
+
+
+def _parsear(parser: Callable[[Any], Any], valor: Any) -> Any:
+    """Resultado del parser, o el ValueError si el valor no es válido"""
+    try:
+        return parser(valor)
+    except ValueError as e:
+        return e
+    except TypeError:
+        return ValueError(f'Valor inválido: {valor!r}')
+
+
+def _parsear_columna(parser: Callable[[Any], Any], valores: List[Any]) -> List[Any]:
+    """Parsear una columna del lote; cada valor distinto se parsea una sola vez"""
+    resultados: Dict[Any, Any] = {}
+    columna = []
+    for valor in valores:
+        if valor is None:
+            columna.append(None)
+            continue
+        try:
+            if valor not in resultados:
+                resultados[valor] = _parsear(parser, valor)
+            columna.append(resultados[valor])
+        except TypeError:
+            # Valor no hasheable (lista, dict): se parsea sin memorizar
+            columna.append(_parsear(parser, valor))
+    return columna
+
+
+def _armar(indice: int, columnas: Dict[str, List[Any]]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    errores: Dict[str, str] = {}
+
+    def valor(campo):
+        resultado = columnas[campo][indice]
+        if isinstance(resultado, ValueError):
+            errores[campo] = str(resultado)
+            return None
+        return resultado
+
+    tarifas = []
+    for campo in TARIFAS:
+        precio = valor(campo)
+        if precio is not None:
+            tarifas.append({
+                'concepto': campo,
+                'precio': precio,
+                'cantidad': 1,  # Se calculará basado en tickets
+                'subtotal': 0  # Se calculará
+            })
+
+    ingresos = []
+    for campo, observaciones in INGRESOS.items():
+        monto = valor(campo)
+        if monto is not None:
+            ingresos.append({'concepto': campo, 'monto': monto, 'observaciones': observaciones})
+
+    egresos = []
+    for campo in EGRESOS:
+        monto = valor(campo)
+        if monto:
+            egresos.append({'concepto': campo, 'monto': monto, 'observaciones': f'Egreso: {campo}'})
+
+    control_boletos = []
+    for campo_inicial, campo_final in TICKETS:
+        inicial, final = valor(campo_inicial), valor(campo_final)
+        if inicial is not None and final is not None and final > inicial:
+            control_boletos.append({
+                'numero_inicial': inicial,
+                'numero_final': final,
+                'cantidad_vendidos': final - inicial + 1,
+                'cantidad_devueltos': 0,
+                'cantidad_anulados': 0
+            })
+
+    info_general = {}
+    for clave, (campo, _) in INFO_GENERAL.items():
+        resultado = valor(campo)
+        info_general[clave] = '' if resultado is None else resultado
+
+    datos = {
+        'tarifas': tarifas,
+        'ingresos': ingresos,
+        'egresos': egresos,
+        'control_boletos': control_boletos,
+        'info_general': info_general,
+    }
+    return datos, errores
+
+
+def normalizar_lote(documentos: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, str]]]:
+    """
+    Normalizar los campos de varios documentos.
+
+    Args:
+        documentos: Lista de dicts campo -> valor de Azure (ver campos_documento)
+
+    Returns:
+        Por documento, una tupla (datos, errores): datos con tarifas,
+        ingresos, egresos, control_boletos e info_general; errores con
+        campo -> mensaje para los valores que no se pudieron interpretar
+    """
+    columnas = {
+        campo: _parsear_columna(parser, [valor_campo(campos.get(campo)) for campos in documentos])
+        for campo, parser in PARSERS.items()
+    }
+    return [_armar(indice, columnas) for indice in range(len(documentos))]
+
+
+def normalizar_documento(campos: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Normalizar los campos de un documento (ver normalizar_lote)"""
+    return normalizar_lote([campos])[0]
@@ -0,0 +1,81 @@
+"""
+Paginación de los endpoints de listado.
+
+Por defecto se usa paginación por cursor sobre (fecha_creacion, id): cada
+página es un WHERE sobre el índice compuesto, sin COUNT(*) ni OFFSET, así
+una página profunda cuesta lo mismo que la primera. Si la petición trae
+?page= se usa la paginación por número de página (panel de administración).
+"""
+
+from django.conf import settings
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+
+
+class FechaCursorPagination(CursorPagination):
+    """Cursor sobre fecha de creación descendente, desempatando por id"""
+
+    ordering = ('-fecha_creacion', '-id')
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.PAGINACION_MAX_PAGE_SIZE
+
+
+class ResumenCursorPagination(FechaCursorPagination):
+    """Cursor para ResumenDiario, que se ordena por fecha del resumen"""
+
+    ordering = ('-fecha', '-id')
+
+
+class NumeroPaginaPagination(PageNumberPagination):
+    """Paginación por número de página con tamaño configurable"""
+
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.PAGINACION_MAX_PAGE_SIZE
+
+
+class PaginacionMixta(BasePagination):
+    """
+    Paginación por cursor, salvo que la petición use ?page=.
+    Delega en FechaCursorPagination o NumeroPaginaPagination por petición.
+    """
+
+    cursor_class = FechaCursorPagination
+
+    def __init__(self):
+        self.paginador = self.cursor_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if NumeroPaginaPagination.page_query_param in request.query_params:
+            self.paginador = NumeroPaginaPagination()
+        else:
+            self.paginador = self.cursor_class()
+        return self.paginador.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginador.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginador.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.paginador.to_html()
+
+    def get_results(self, data):
+        return self.paginador.get_results(data)
+
+    def get_schema_operation_parameters(self, view):
+        return (
+            self.cursor_class().get_schema_operation_parameters(view)
+            + NumeroPaginaPagination().get_schema_operation_parameters(view)
+        )
+
+
+class PaginacionMixtaResumen(PaginacionMixta):
+    """PaginacionMixta con el cursor por fecha de ResumenDiario"""
+
+    cursor_class = ResumenCursorPagination
@@ -0,0 +1,138 @@
+"""
+Polling de los análisis de Azure con intervalos configurables, adaptativo
+y con plazo máximo.
+
+Con el polling por defecto del SDK cada consulta espera el Retry-After de
+Azure (o un intervalo fijo): una planilla de una página que termina en
+1,2 s puede quedar esperando hasta la siguiente consulta, y una operación
+trabada se consulta para siempre.
+
+PollingAdaptativo reemplaza al LROBasePolling del SDK:
+
+- Si ya se conoce cuánto tardan los análisis (promedio móvil exponencial
+  de las duraciones recientes, por proceso) la primera espera llega
+  hasta el momento en que el análisis debería estar listo.
+- Pasado ese momento las esperas crecen en forma geométrica desde
+  AZURE_POLLING_INTERVALO_INICIAL hasta AZURE_POLLING_INTERVALO_MAXIMO.
+- Si el análisis no termina en AZURE_ANALISIS_PLAZO segundos se deja de
+  consultar y se lanza PlazoAnalisisAgotado; el llamador marca la planilla
+  con error. La API de Form Recognizer no permite cancelar un análisis en
+  curso: el resultado, si llega, se descarta.
+"""
+
+import threading
+import time
+from typing import Optional
+
+from azure.core.exceptions import AzureError
+from azure.core.polling.async_base_polling import AsyncLROBasePolling
+from azure.core.polling.base_polling import LROBasePolling
+from django.conf import settings
+
+# Crecimiento de la espera entre consultas pasado el tiempo estimado
+FACTOR_ESPERA = 1.5
+
+
+class PlazoAnalisisAgotado(AzureError):
+    """El análisis no terminó dentro del plazo configurado"""
+
+
+class EstimadorDuracion:
+    """Promedio móvil exponencial de la duración de los análisis"""
+
+    def __init__(self, alfa: float):
+        self.alfa = alfa
+        self.valor: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def registrar(self, segundos: float) -> None:
+        with self._lock:
+            if self.valor is None:
+                self.valor = segundos
+            else:
+                self.valor = self.alfa * segundos + (1 - self.alfa) * self.valor
+
+
+estimador_analisis = EstimadorDuracion(settings.AZURE_POLLING_ALFA)
+
+
+class _PlanPolling:
+    """Cálculo de las esperas compartido por las variantes síncrona y aio"""
+
+    def _configurar(self, intervalo_inicial: float, intervalo_maximo: float, plazo: float,
+                    estimador: Optional[EstimadorDuracion]) -> None:
+        self._intervalo_inicial = intervalo_inicial
+        self._intervalo_maximo = intervalo_maximo
+        self._intervalo = intervalo_inicial
+        self._plazo = plazo
+        self._estimador = estimador
+        self._inicio = time.monotonic()
+
+    def initialize(self, client, initial_response, deserialization_callback):
+        # El plazo y la duración se miden desde que Azure aceptó el análisis
+        self._inicio = time.monotonic()
+        super().initialize(client, initial_response, deserialization_callback)
+
+    def _extract_delay(self) -> float:
+        transcurrido = time.monotonic() - self._inicio
+        restante = self._plazo - transcurrido
+        if restante <= 0:
+            raise PlazoAnalisisAgotado(f"El análisis no terminó en {self._plazo:g} s")
+
+        estimado = self._estimador.valor if self._estimador is not None else None
+        if estimado is not None and transcurrido + self._intervalo_inicial < estimado:
+            # Dormir hasta el momento en que el análisis suele estar listo
+            espera = estimado - transcurrido
+        else:
+            espera = self._intervalo
+            self._intervalo = min(self._intervalo * FACTOR_ESPERA, self._intervalo_maximo)
+        return min(espera, self._intervalo_maximo, restante)
+
+    def _registrar_duracion(self) -> None:
+        if self._estimador is not None:
+            self._estimador.registrar(time.monotonic() - self._inicio)
+
+
+class PollingAdaptativo(_PlanPolling, LROBasePolling):
+    """Polling síncrono (DocumentAnalysisClient)"""
+
+    def __init__(self, intervalo_inicial: float, intervalo_maximo: float, plazo: float,
+                 estimador: Optional[EstimadorDuracion] = None, **kwargs):
+        super().__init__(timeout=intervalo_inicial, **kwargs)
+        self._configurar(intervalo_inicial, intervalo_maximo, plazo, estimador)
+
+    def run(self) -> None:
+        super().run()
+        self._registrar_duracion()
+
+
+class PollingAdaptativoAsync(_PlanPolling, AsyncLROBasePolling):
+    """Polling del cliente aio"""
+
+    def __init__(self, intervalo_inicial: float, intervalo_maximo: float, plazo: float,
+                 estimador: Optional[EstimadorDuracion] = None, **kwargs):
+        super().__init__(timeout=intervalo_inicial, **kwargs)
+        self._configurar(intervalo_inicial, intervalo_maximo, plazo, estimador)
+
+    async def run(self) -> None:
+        await super().run()
+        self._registrar_duracion()
+
+
+def crear_polling(asincrono: bool = False, plazo: Optional[float] = None, estimar: bool = True):
+    """
+    Polling configurado con los settings AZURE_POLLING_* y AZURE_ANALISIS_PLAZO.
+
+    Args:
+        plazo: Plazo propio del análisis en segundos (por defecto AZURE_ANALISIS_PLAZO)
+        estimar: False para análisis atípicos (lotes de varias páginas) que no
+            deben usar ni alterar el promedio de duración de las planillas
+    """
+    clase = PollingAdaptativoAsync if asincrono else PollingAdaptativo
+    adaptativo = estimar and settings.AZURE_POLLING_ADAPTATIVO
+    return clase(
+        intervalo_inicial=settings.AZURE_POLLING_INTERVALO_INICIAL,
+        intervalo_maximo=settings.AZURE_POLLING_INTERVALO_MAXIMO,
+        plazo=settings.AZURE_ANALISIS_PLAZO if plazo is None else plazo,
+        estimador=estimador_analisis if adaptativo else None,
+    )
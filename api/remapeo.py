@@ -0,0 +1,57 @@
+"""
+Serialización de resultados crudos de Azure y su mapeo a datos_extraidos.
+
+Las funciones de este módulo corren en los procesos del pool de
+re-extracción. Como en imagenes.py, no usan el ORM: los procesos hijos se
+crean con 'spawn' y no tienen Django configurado.
+"""
+
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+NIVEL_COMPRESION = 6
+
+
+def comprimir(resultado: Dict[str, Any]) -> Tuple[bytes, int]:
+    """
+    Serializar un resultado como JSON compacto (sin espacios) y comprimirlo.
+
+    Returns:
+        Tupla (bytes comprimidos, tamaño del JSON sin comprimir)
+    """
+    texto = json.dumps(resultado, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    datos = texto.encode('utf-8')
+    return zlib.compress(datos, NIVEL_COMPRESION), len(datos)
+
+
+def descomprimir(contenido: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(bytes(contenido)))
+
+
+def mapear_lote(lote: List[Tuple[int, bytes]]) -> List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Mapear resultados comprimidos a datos_extraidos con el mapeo actual.
+
+    Args:
+        lote: Lista de (planilla_id, contenido comprimido)
+
+    Returns:
+        Lista de (planilla_id, datos_extraidos o None, error o None)
+    """
+    # pylint: disable=import-outside-toplevel
+    from azure.ai.formrecognizer import AnalyzeResult
+
+    from .services import azure_service
+
+    mapeados = []
+    for planilla_id, contenido in lote:
+        try:
+            resultado = AnalyzeResult.from_dict(descomprimir(contenido))
+            datos = azure_service._extract_data_from_result(resultado)  # pylint: disable=protected-access
+            mapeados.append((planilla_id, datos, None))
+        except Exception as e:  # pylint: disable=broad-except
+            mapeados.append((planilla_id, None, str(e)))
+    return mapeados
@@ -0,0 +1,298 @@
+"""
+Resultados completos de Azure guardados comprimidos y re-extracción.
+
+Al terminar un análisis se guarda AnalyzeResult.to_dict() en ResultadoCrudo
+como JSON compacto (sin espacios) comprimido con zlib. Si se corrige el
+mapeo de campos (_extract_data_from_result / normalizacion.py) reextraer()
+vuelve a generar datos_extraidos de las planillas desde esos resultados, sin
+llamar a Azure: los resultados se leen por lotes, se mapean en un pool de
+procesos (remapeo.py) y se escriben de vuelta con una transacción por lote.
+"""
+
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .materializacion import CAMPOS_ENCABEZADO, campos_encabezado, materializar_planilla
+from .models import Planilla, ResultadoAnalisisCache, ResultadoCrudo
+from .remapeo import comprimir, mapear_lote
+from .resumenes import actualizar_resumenes, clave_grupo
+
+logger = logging.getLogger(__name__)
+
+
+# Claves del formato anterior de datos_extraidos cuyo contenido vive ahora en ResultadoCrudo
+CLAVES_PESADAS = ('raw_result', 'texto_completo', 'tablas', 'campos_detectados')
+
+
+def compactar_datos(datos: Dict[str, Any]) -> Dict[str, Any]:
+    """Quitar de datos_extraidos (en el lugar) las claves pesadas del formato anterior"""
+    for clave in CLAVES_PESADAS:
+        datos.pop(clave, None)
+    return datos
+
+
+def guardar_resultado_crudo(planilla: Planilla, resultado: Dict[str, Any]) -> ResultadoCrudo:
+    """Guardar (o reemplazar) el resultado completo de la planilla"""
+    contenido, tamaño = comprimir(resultado)
+    crudo, _ = ResultadoCrudo.objects.update_or_create(
+        planilla=planilla,
+        defaults={
+            'model_id': resultado.get('model_id') or '',
+            'contenido': contenido,
+            'tamaño_original': tamaño,
+        }
+    )
+    logger.debug("Resultado crudo de planilla %s: %s -> %s bytes", planilla.pk, tamaño, len(contenido))
+    return crudo
+
+
+def copiar_resultado_crudo(planilla: Planilla) -> bool:
+    """
+    Copiar el resultado de otra planilla con la misma imagen (la planilla se
+    completó desde la cache y no hubo análisis propio).
+
+    Returns:
+        True si se encontró un resultado para copiar
+    """
+    if not planilla.hash_contenido:
+        return False
+    origen = (
+        ResultadoCrudo.objects
+        .filter(planilla__hash_contenido=planilla.hash_contenido)
+        .exclude(planilla=planilla)
+        .order_by('-fecha_creacion')
+        .first()
+    )
+    if origen is None:
+        return False
+    ResultadoCrudo.objects.update_or_create(
+        planilla=planilla,
+        defaults={
+            'model_id': origen.model_id,
+            'contenido': origen.contenido,
+            'tamaño_original': origen.tamaño_original,
+        }
+    )
+    return True
+
+
+def _lotes(queryset, tamaño: int) -> Iterator[List[Tuple[int, bytes]]]:
+    """Lotes de (planilla_id, contenido) por keyset sobre planilla_id"""
+    ultimo = 0
+    while True:
+        filas = list(queryset.filter(planilla_id__gt=ultimo).values_list('planilla_id', 'contenido')[:tamaño])
+        if not filas:
+            return
+        yield [(planilla_id, bytes(contenido)) for planilla_id, contenido in filas]
+        ultimo = filas[-1][0]
+
+
+def _actualizar_cache(planillas: List[Planilla]) -> None:
+    """
+    Re-mapear las entradas de ResultadoAnalisisCache de las imágenes de
+    `planillas`: la del modelo con que se analizó cada una recibe los datos
+    re-extraídos y las de otros modelos, mapeadas con el mapeo anterior, se
+    eliminan. Sin esto una re-subida de la misma imagen volvería a los
+    datos viejos.
+    """
+    modelos = dict(
+        ResultadoCrudo.objects.filter(planilla__in=planillas).values_list('planilla_id', 'model_id')
+    )
+    por_hash = {
+        planilla.hash_contenido: (modelos.get(planilla.pk), planilla.datos_extraidos)
+        for planilla in planillas if planilla.hash_contenido
+    }
+    if not por_hash:
+        return
+
+    entradas = (
+        ResultadoAnalisisCache.objects
+        .filter(hash_contenido__in=por_hash)
+        .only('id', 'hash_contenido', 'model_id')
+    )
+    vigentes, obsoletas = [], []
+    for entrada in entradas:
+        model_id, datos = por_hash[entrada.hash_contenido]
+        if entrada.model_id == model_id:
+            entrada.datos_extraidos = datos
+            vigentes.append(entrada)
+        else:
+            obsoletas.append(entrada.pk)
+    ResultadoAnalisisCache.objects.bulk_update(vigentes, ['datos_extraidos'])
+    ResultadoAnalisisCache.objects.filter(pk__in=obsoletas).delete()
+
+
+def escribir_lote(mapeados: List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]) -> Tuple[int, int]:
+    """
+    Escribir los datos re-extraídos de un lote en una transacción:
+    datos_extraidos y encabezado con bulk_update, filas relacionales, las
+    entradas de cache de sus imágenes y, al confirmar, los resúmenes de los
+    grupos afectados.
+
+    Returns:
+        Tupla (planillas actualizadas, errores)
+    """
+    validos = {planilla_id: datos for planilla_id, datos, error in mapeados if error is None}
+    errores = len(mapeados) - len(validos)
+    for planilla_id, _, error in mapeados:
+        if error is not None:
+            logger.error("No se pudo re-extraer la planilla %s: %s", planilla_id, error)
+
+    planillas = list(Planilla.objects.sin_datos_extraidos().filter(pk__in=validos))
+    ahora = timezone.now()
+    claves = set()
+    with transaction.atomic():
+        for planilla in planillas:
+            claves.add(clave_grupo(planilla))
+            planilla.datos_extraidos = validos[planilla.pk]
+            for campo, valor in campos_encabezado(planilla.datos_extraidos).items():
+                setattr(planilla, campo, valor)
+            planilla.fecha_actualizacion = ahora
+            claves.add(clave_grupo(planilla))
+            materializar_planilla(planilla, planilla.datos_extraidos)
+        Planilla.objects.bulk_update(
+            planillas, ['datos_extraidos', 'fecha_actualizacion', *CAMPOS_ENCABEZADO]
+        )
+        _actualizar_cache(planillas)
+        transaction.on_commit(lambda: actualizar_resumenes(claves))
+    return len(planillas), errores
+
+
+def reextraer(desde: Optional[datetime] = None, procesos: Optional[int] = None, lote: Optional[int] = None,
+              progreso: Optional[Callable[[int, int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Re-generar datos_extraidos de las planillas completadas desde sus
+    resultados crudos.
+
+    Args:
+        desde: Solo resultados guardados desde esa fecha
+        procesos: Procesos del pool (0 mapea en el proceso actual)
+        lote: Planillas por lote de lectura, mapeo y escritura
+        progreso: Llamado tras cada lote con (procesadas, errores, total)
+
+    Returns:
+        Dict con 'planillas', 'errores', 'total' y 'segundos'
+    """
+    procesos = settings.REEXTRAER_PROCESOS if procesos is None else procesos
+    lote = lote or settings.REEXTRAER_LOTE
+
+    crudos = ResultadoCrudo.objects.filter(planilla__status='completed').order_by('planilla_id')
+    if desde is not None:
+        crudos = crudos.filter(fecha_creacion__gte=desde)
+    total = crudos.count()
+    inicio = time.monotonic()
+    totales = {'planillas': 0, 'errores': 0, 'total': total}
+
+    def _escribir(mapeados):
+        planillas, errores = escribir_lote(mapeados)
+        totales['planillas'] += planillas
+        totales['errores'] += errores
+        if progreso is not None:
+            progreso(totales['planillas'], totales['errores'], total)
+
+    if procesos == 0:
+        for datos in _lotes(crudos, lote):
+            _escribir(mapear_lote(datos))
+    else:
+        pool = ProcessPoolExecutor(
+            max_workers=procesos,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        with pool:
+            # Pocos lotes en vuelo: la memoria no crece con el total y los
+            # procesos mapean mientras se escribe el lote anterior
+            pendientes = deque()
+            for datos in _lotes(crudos, lote):
+                pendientes.append(pool.submit(mapear_lote, datos))
+                if len(pendientes) >= procesos * 2:
+                    _escribir(pendientes.popleft().result())
+            while pendientes:
+                _escribir(pendientes.popleft().result())
+
+    totales['segundos'] = round(time.monotonic() - inicio, 2)
+    logger.info("Re-extracción: %s", totales)
+    return totales
+
+
+def _resultado_parcial(datos: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Resultado crudo reconstruido desde datos_extraidos del formato anterior:
+    el texto y los documentos alcanzan para volver a mapear los campos.
+    """
+    documentos = (datos.get('raw_result') or {}).get('documents') or []
+    if not all(isinstance(documento, dict) for documento in documentos):
+        return None
+    if not documentos and not datos.get('texto_completo'):
+        return None
+    return {'content': datos.get('texto_completo') or '', 'documents': documentos}
+
+
+def compactar_planillas(lote: int = 500) -> Dict[str, int]:
+    """
+    Pasar al formato compacto las planillas y entradas de cache guardadas
+    con el formato anterior de datos_extraidos. Si una planilla no tiene
+    resultado crudo se le guarda uno parcial antes de quitar el contenido.
+
+    Returns:
+        Dict con 'planillas', 'resultados' (crudos creados) y 'cache'
+    """
+    filtro = Q()
+    for clave in CLAVES_PESADAS:
+        filtro |= Q(datos_extraidos__has_key=clave)
+    totales = {'planillas': 0, 'resultados': 0, 'cache': 0}
+
+    ultimo = 0
+    while True:
+        planillas = list(
+            Planilla.objects.filter(filtro, pk__gt=ultimo).order_by('pk').only('id', 'datos_extraidos')[:lote]
+        )
+        if not planillas:
+            break
+        ultimo = planillas[-1].pk
+        con_crudo = set(
+            ResultadoCrudo.objects.filter(planilla__in=planillas).values_list('planilla_id', flat=True)
+        )
+        crudos = []
+        for planilla in planillas:
+            datos = planilla.datos_extraidos
+            parcial = None if planilla.pk in con_crudo else _resultado_parcial(datos)
+            if parcial is not None:
+                contenido, tamaño = comprimir(parcial)
+                crudos.append(ResultadoCrudo(planilla=planilla, contenido=contenido, tamaño_original=tamaño))
+            datos.setdefault('paginas', (datos.get('raw_result') or {}).get('pages', 0))
+            compactar_datos(datos)
+        with transaction.atomic():
+            ResultadoCrudo.objects.bulk_create(crudos)
+            # Sin fecha_actualizacion: los datos de negocio no cambian
+            Planilla.objects.bulk_update(planillas, ['datos_extraidos'])
+        totales['planillas'] += len(planillas)
+        totales['resultados'] += len(crudos)
+
+    ultimo = 0
+    while True:
+        entradas = list(
+            ResultadoAnalisisCache.objects
+            .filter(filtro, pk__gt=ultimo)
+            .order_by('pk')
+            .only('id', 'datos_extraidos')[:lote]
+        )
+        if not entradas:
+            break
+        ultimo = entradas[-1].pk
+        for entrada in entradas:
+            compactar_datos(entrada.datos_extraidos)
+        ResultadoAnalisisCache.objects.bulk_update(entradas, ['datos_extraidos'])
+        totales['cache'] += len(entradas)
+
+    logger.info("Datos extraídos compactados: %s", totales)
+    return totales
@@ -0,0 +1,245 @@
+"""
+Resúmenes diarios de ingresos y egresos (tabla ResumenDiario).
+
+Un grupo es (fecha, bus, conductor, ciudad origen, ciudad retorno). Cuando
+una planilla se completa se recalcula en SQL solo su grupo; los reportes
+agrupan luego las filas de ResumenDiario, que son O(días) y no O(líneas).
+"""
+
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+from .models import Egreso, Ingreso, Planilla, ResumenDiario
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_GRUPO = ('fecha', 'numero_bus', 'codigo_conductor', 'ciudad_origen', 'ciudad_retorno')
+
+# Agrupaciones disponibles en el reporte y sus columnas en ResumenDiario
+AGRUPACIONES = {
+    'dia': ('fecha',),
+    'bus': ('numero_bus',),
+    'conductor': ('codigo_conductor',),
+    'ruta': ('ciudad_origen', 'ciudad_retorno'),
+}
+
+CERO = Value(Decimal('0'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+Clave = Tuple[date, str, str, str, str]
+
+# Veces que se recalcula un grupo cuya fila creó otro proceso en paralelo
+REINTENTOS_RESUMEN = 3
+
+
+# Alias de las anotaciones del grupo (no pueden llamarse igual que los campos)
+ALIAS_GRUPO = tuple(f'grupo_{campo}' for campo in CAMPOS_GRUPO)
+
+
+def _expresiones_grupo(prefijo: str = '') -> Dict[str, Any]:
+    """Expresiones SQL de las columnas del grupo, sobre Planilla o sus líneas"""
+    return {
+        'grupo_fecha': Coalesce(f'{prefijo}fecha_planilla', TruncDate(f'{prefijo}fecha_creacion')),
+        'grupo_numero_bus': Coalesce(f'{prefijo}numero_bus', Value('')),
+        'grupo_codigo_conductor': Coalesce(f'{prefijo}codigo_conductor', Value('')),
+        'grupo_ciudad_origen': Coalesce(f'{prefijo}ciudad_origen', Value('')),
+        'grupo_ciudad_retorno': Coalesce(f'{prefijo}ciudad_retorno', Value('')),
+    }
+
+
+def clave_grupo(planilla: Planilla) -> Clave:
+    """Grupo al que pertenece una planilla según sus columnas de encabezado"""
+    return (
+        planilla.fecha_planilla or planilla.fecha_creacion.date(),
+        planilla.numero_bus or '',
+        planilla.codigo_conductor or '',
+        planilla.ciudad_origen or '',
+        planilla.ciudad_retorno or '',
+    )
+
+
+def _filtro_grupos(claves: Iterable[Clave], prefijo: str = '') -> Q:
+    """Q que selecciona las planillas (o sus líneas) de los grupos indicados"""
+    filtro = Q(pk__in=[])
+    for clave in claves:
+        condicion = Q()
+        for campo, valor in zip(CAMPOS_GRUPO, clave):
+            if campo == 'fecha':
+                condicion &= (
+                    Q(**{f'{prefijo}fecha_planilla': valor})
+                    | Q(**{f'{prefijo}fecha_planilla__isnull': True, f'{prefijo}fecha_creacion__date': valor})
+                )
+            elif valor:
+                condicion &= Q(**{f'{prefijo}{campo}': valor})
+            else:
+                condicion &= Q(**{f'{prefijo}{campo}__isnull': True}) | Q(**{f'{prefijo}{campo}': ''})
+        filtro |= condicion
+    return filtro
+
+
+def calcular_resumenes(filtro: Optional[Q] = None, filtro_lineas: Optional[Q] = None) -> Dict[Clave, Dict[str, Any]]:
+    """
+    Calcular los totales por grupo con tres consultas agrupadas en SQL
+    (planillas, ingresos y egresos), sin traer líneas a Python.
+
+    Args:
+        filtro: Q sobre Planilla que limita las planillas consideradas
+        filtro_lineas: El mismo filtro expresado sobre Ingreso/Egreso (prefijo planilla__)
+    """
+    grupo = _expresiones_grupo()
+    grupo_lineas = _expresiones_grupo('planilla__')
+
+    planillas = Planilla.objects.filter(status='completed')
+    if filtro is not None:
+        planillas = planillas.filter(filtro)
+    resumenes: Dict[Clave, Dict[str, Any]] = {}
+    for fila in planillas.annotate(**grupo).values(*ALIAS_GRUPO).annotate(total=Count('id')).order_by():
+        clave = tuple(fila[c] for c in ALIAS_GRUPO)
+        resumenes[clave] = {'planillas': fila['total'], 'total_ingresos': Decimal('0'), 'total_egresos': Decimal('0')}
+
+    for modelo, campo in ((Ingreso, 'total_ingresos'), (Egreso, 'total_egresos')):
+        lineas = modelo.objects.filter(planilla__status='completed')
+        if filtro_lineas is not None:
+            lineas = lineas.filter(filtro_lineas)
+        filas = lineas.annotate(**grupo_lineas).values(*ALIAS_GRUPO).annotate(total=Sum('monto')).order_by()
+        for fila in filas:
+            clave = tuple(fila[c] for c in ALIAS_GRUPO)
+            if clave in resumenes:
+                resumenes[clave][campo] = fila['total'] or Decimal('0')
+
+    return resumenes
+
+
+def _reemplazar_resumenes(claves: Iterable[Clave]) -> None:
+    """Bloquear las filas de los grupos, recalcularlos y escribirlas (dentro de una transacción)"""
+    bloqueo = Q(pk__in=[])
+    for clave in claves:
+        bloqueo |= Q(**dict(zip(CAMPOS_GRUPO, clave)))
+    list(ResumenDiario.objects.select_for_update().filter(bloqueo).values_list('pk', flat=True))
+
+    resumenes = calcular_resumenes(_filtro_grupos(claves), _filtro_grupos(claves, 'planilla__'))
+    for clave in claves:
+        valores = dict(zip(CAMPOS_GRUPO, clave))
+        totales = resumenes.get(clave)
+        if totales is None:
+            # El grupo quedó sin planillas (p. ej. cambió el encabezado)
+            ResumenDiario.objects.filter(**valores).delete()
+        else:
+            ResumenDiario.objects.update_or_create(defaults=totales, **valores)
+
+
+def actualizar_resumenes(claves: Iterable[Clave]) -> None:
+    """
+    Recalcular los grupos indicados y reemplazar sus filas de ResumenDiario.
+
+    Las filas existentes de los grupos se bloquean antes de recalcular: dos
+    actualizaciones del mismo grupo se serializan y la segunda ya suma la
+    planilla de la primera. Si dos procesos crean a la vez la fila de un
+    grupo nuevo, el INSERT perdedor falla por la restricción única y ese
+    proceso vuelve a bloquear y recalcular.
+    """
+    claves = set(claves)
+    if not claves:
+        return
+    for intento in range(1, REINTENTOS_RESUMEN + 1):
+        try:
+            with transaction.atomic():
+                _reemplazar_resumenes(claves)
+            return
+        except IntegrityError:
+            if intento == REINTENTOS_RESUMEN:
+                raise
+            logger.warning("Resumen creado en paralelo, se recalcula (intento %s)", intento)
+
+
+def programar_actualizacion(planilla: Planilla, clave_anterior: Optional[Clave] = None) -> None:
+    """
+    Actualizar los resúmenes de la planilla al confirmarse la transacción
+    en curso (y su grupo anterior, si el encabezado cambió).
+    """
+    claves = {clave_grupo(planilla)}
+    if clave_anterior is not None:
+        claves.add(clave_anterior)
+
+    def _actualizar():
+        try:
+            actualizar_resumenes(claves)
+        except Exception as e:
+            logger.error("Error actualizando resúmenes de la planilla %s: %s", planilla.pk, e)
+
+    transaction.on_commit(_actualizar)
+
+
+def reconstruir_resumenes(desde: Optional[date] = None, hasta: Optional[date] = None) -> int:
+    """
+    Recalcular ResumenDiario completo (o el rango de fechas indicado).
+
+    Returns:
+        Cantidad de filas de resumen escritas
+    """
+    existentes = ResumenDiario.objects.all()
+    filtro = filtro_lineas = None
+    if desde or hasta:
+        planillas = Planilla.objects.annotate(dia=_expresiones_grupo()['grupo_fecha'])
+        if desde:
+            planillas = planillas.filter(dia__gte=desde)
+            existentes = existentes.filter(fecha__gte=desde)
+        if hasta:
+            planillas = planillas.filter(dia__lte=hasta)
+            existentes = existentes.filter(fecha__lte=hasta)
+        filtro = Q(pk__in=planillas.values('pk'))
+        filtro_lineas = Q(planilla__in=planillas.values('pk'))
+
+    resumenes = calcular_resumenes(filtro, filtro_lineas)
+    filas = [
+        ResumenDiario(**dict(zip(CAMPOS_GRUPO, clave)), **totales)
+        for clave, totales in resumenes.items()
+    ]
+
+    with transaction.atomic():
+        existentes.delete()
+        ResumenDiario.objects.bulk_create(filas, batch_size=1000)
+
+    logger.info("Resúmenes diarios reconstruidos: %s filas", len(filas))
+    return len(filas)
+
+
+def reporte(agrupar: List[str], filtros: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Totales de ingresos y egresos agrupados en SQL sobre ResumenDiario.
+
+    Args:
+        agrupar: Claves de AGRUPACIONES (dia, bus, conductor, ruta)
+        filtros: Filtros de Django sobre ResumenDiario
+
+    Returns:
+        Lista de filas con las columnas del grupo, planillas, totales y balance
+    """
+    columnas = [c for clave in agrupar for c in AGRUPACIONES[clave]]
+    filas = (
+        ResumenDiario.objects
+        .filter(**filtros)
+        .values(*columnas)
+        .annotate(
+            total_planillas=Coalesce(Sum('planillas'), 0),
+            ingresos=Coalesce(Sum('total_ingresos'), CERO),
+            egresos=Coalesce(Sum('total_egresos'), CERO),
+        )
+        .annotate(balance=F('ingresos') - F('egresos'))
+        .order_by(*columnas)
+    )
+    return [
+        {
+            **{c: fila[c] for c in columnas},
+            'planillas': fila['total_planillas'],
+            'total_ingresos': fila['ingresos'],
+            'total_egresos': fila['egresos'],
+            'balance': fila['balance'],
+        }
+        for fila in filas
+    ]
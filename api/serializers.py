@@ -1,5 +1,11 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Planilla, Tarifa, Ingreso, Egreso, ControlBoleto
+from .imagenes import programar_preprocesamiento
+from .miniaturas import urls_miniaturas
+from .uploads import ArchivoConHash, ArchivoSubido
+from .models import (
+    Planilla, Tarifa, Ingreso, Egreso, ControlBoleto, ProcesamientoJob, ResumenDiario, LotePlanillas
+)
 
 
 class TarifaSerializer(serializers.ModelSerializer):
@@ -77,13 +83,31 @@ class ControlBoletoSerializer(serializers.ModelSerializer):
 class PlanillaListSerializer(serializers.ModelSerializer):
     """Serializer para listar planillas (versión simplificada)"""
     
+    miniaturas = serializers.SerializerMethodField()
+    
     class Meta:
         model = Planilla
         fields = [
-            'id', 'imagen', 'status', 'fecha_creacion', 'fecha_actualizacion',
-            'nombre_archivo', 'tamaño_archivo'
+            'id', 'imagen', 'miniaturas', 'status', 'fecha_creacion', 'fecha_actualizacion',
+            'nombre_archivo', 'tamaño_archivo', 'tamaño_original', 'tamaño_procesado',
+            'numero_planilla', 'fecha_planilla', 'numero_bus', 'patente_bus', 'codigo_conductor'
+        ]
+        read_only_fields = [
+            'id', 'fecha_creacion', 'fecha_actualizacion', 'tamaño_original', 'tamaño_procesado',
+            'numero_planilla', 'fecha_planilla', 'numero_bus', 'patente_bus', 'codigo_conductor'
         ]
-        read_only_fields = ['id', 'fecha_creacion', 'fecha_actualizacion']
+    
+    # Columnas que debe leer la consulta del listado (ver PlanillaViewSet.get_queryset)
+    CAMPOS_CONSULTA = [
+        'id', 'imagen', 'status', 'fecha_creacion', 'fecha_actualizacion',
+        'nombre_archivo', 'tamaño_archivo', 'tamaño_original', 'tamaño_procesado',
+        'numero_planilla', 'fecha_planilla', 'numero_bus', 'patente_bus', 'codigo_conductor',
+        'hash_contenido'
+    ]
+    
+    def get_miniaturas(self, obj):
+        """URLs de las miniaturas por lado en píxeles"""
+        return urls_miniaturas(obj, self.context.get('request'))
 
 
 class PlanillaDetailSerializer(serializers.ModelSerializer):
@@ -99,11 +123,15 @@ class PlanillaDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'imagen', 'status', 'fecha_creacion', 'fecha_actualizacion',
             'datos_extraidos', 'error_procesamiento', 'nombre_archivo',
-            'tamaño_archivo', 'tarifas', 'ingresos', 'egresos', 'control_boletos'
+            'tamaño_archivo', 'tamaño_original', 'tamaño_procesado', 'hash_contenido',
+            'archivo_bundle', 'numero_planilla', 'fecha_planilla', 'numero_bus', 'patente_bus',
+            'codigo_conductor', 'lote', 'pagina', 'tarifas', 'ingresos', 'egresos', 'control_boletos'
         ]
         read_only_fields = [
             'id', 'fecha_creacion', 'fecha_actualizacion', 'datos_extraidos',
-            'error_procesamiento', 'tamaño_archivo'
+            'error_procesamiento', 'tamaño_archivo', 'tamaño_original',
+            'tamaño_procesado', 'hash_contenido', 'archivo_bundle', 'numero_planilla',
+            'fecha_planilla', 'numero_bus', 'patente_bus', 'codigo_conductor', 'lote', 'pagina'
         ]
 
 
@@ -116,14 +144,31 @@ class PlanillaCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         """Crear planilla y extraer metadatos del archivo"""
-        imagen = validated_data.get('imagen')
+        imagen = validated_data.pop('imagen', None)
+        planilla = Planilla(**validated_data)
         
         # Extraer metadatos del archivo
         if imagen:
-            validated_data['nombre_archivo'] = imagen.name
-            validated_data['tamaño_archivo'] = imagen.size
+            planilla.nombre_archivo = imagen.name
+            planilla.tamaño_archivo = imagen.size
+            
+            if isinstance(imagen, ArchivoSubido):
+                # El upload handler ya la dejó en MEDIA_ROOT con su hash
+                planilla.imagen.name = imagen.nombre_almacenado
+                planilla.hash_contenido = imagen.sha256
+                imagen.close()
+            else:
+                # Guardar la imagen calculando el hash mientras se copia
+                contenido = ArchivoConHash(imagen)
+                planilla.imagen.save(imagen.name, contenido, save=False)
+                planilla.hash_contenido = contenido.sha256
         
-        return super().create(validated_data)
+        planilla.save()
+        
+        # Reducir la imagen en segundo plano una vez confirmada la fila
+        if planilla.imagen:
+            transaction.on_commit(lambda: programar_preprocesamiento(planilla))
+        return planilla
 
 
 class PlanillaUpdateSerializer(serializers.ModelSerializer):
@@ -133,3 +178,56 @@ class PlanillaUpdateSerializer(serializers.ModelSerializer):
         model = Planilla
         fields = ['status', 'datos_extraidos', 'error_procesamiento']
         read_only_fields = ['datos_extraidos', 'error_procesamiento']
+
+
+class ProcesamientoJobSerializer(serializers.ModelSerializer):
+    """Serializer para consultar el estado de un trabajo de procesamiento"""
+    
+    # Los trabajos de lotes no tienen planilla
+    planilla_status = serializers.CharField(source='planilla.status', read_only=True, allow_null=True)
+    
+    class Meta:
+        model = ProcesamientoJob
+        fields = [
+            'id', 'planilla', 'planilla_status', 'lote', 'estado', 'intentos', 'error',
+            'fecha_creacion', 'fecha_inicio', 'fecha_fin'
+        ]
+        read_only_fields = fields
+
+
+class LotePlanillasSerializer(serializers.ModelSerializer):
+    """Serializer de solo lectura para un lote y las planillas creadas desde él"""
+    
+    planillas = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    
+    class Meta:
+        model = LotePlanillas
+        fields = [
+            'id', 'archivo', 'nombre_archivo', 'tamaño_archivo', 'paginas', 'status',
+            'error_procesamiento', 'planillas', 'fecha_creacion', 'fecha_actualizacion'
+        ]
+        read_only_fields = fields
+
+
+class SubidaReanudableCreateSerializer(serializers.Serializer):
+    """Serializer para iniciar una subida reanudable"""
+    
+    nombre_archivo = serializers.CharField(max_length=255)
+    tamaño_total = serializers.IntegerField(min_value=1)
+    tamaño_chunk = serializers.IntegerField(required=False, min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+
+
+class ResumenDiarioSerializer(serializers.ModelSerializer):
+    """Serializer de solo lectura para los resúmenes diarios precalculados"""
+    
+    balance = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    
+    class Meta:
+        model = ResumenDiario
+        fields = [
+            'id', 'fecha', 'numero_bus', 'codigo_conductor', 'ciudad_origen',
+            'ciudad_retorno', 'planillas', 'total_ingresos', 'total_egresos',
+            'balance', 'fecha_actualizacion'
+        ]
+        read_only_fields = fields
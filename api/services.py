@@ -1,12 +1,23 @@
+import asyncio
 import logging
-from typing import Dict, Any
+from typing import Any, Callable, Dict, List, Optional
 from django.conf import settings
-from azure.ai.formrecognizer import DocumentAnalysisClient
+from azure.ai.formrecognizer import AnalyzeResult, DocumentAnalysisClient
+from azure.ai.formrecognizer.aio import DocumentAnalysisClient as AsyncDocumentAnalysisClient
 from azure.core.credentials import AzureKeyCredential
 from azure.core.exceptions import AzureError
 
+from .limites import limitador_azure
+from .metricas import medir_azure
+from .normalizacion import campos_documento, normalizar_documento
+from .polling import crear_polling
+
 logger = logging.getLogger(__name__)
 
+# Clave con el AnalyzeResult.to_dict() en el dict que retorna analyze_document;
+# guardar_resultado la quita antes de guardar datos_extraidos
+CLAVE_RESULTADO_CRUDO = '_resultado_crudo'
+
 
 class AzureFormRecognizerService:
     """
@@ -19,10 +30,11 @@ class AzureFormRecognizerService:
     - Mapeo de campos a modelos Django: Planilla, Tarifa, Ingreso, Egreso, ControlBoleto
     """
     
-    def __init__(self):
-        self.endpoint = settings.AZURE_FORM_RECOGNIZER_ENDPOINT
-        self.key = settings.AZURE_FORM_RECOGNIZER_KEY
-        self.model_id = settings.AZURE_FORM_RECOGNIZER_MODEL_ID
+    def __init__(self, endpoint: Optional[str] = None, key: Optional[str] = None,
+                 model_id: Optional[str] = None):
+        self.endpoint = endpoint or settings.AZURE_FORM_RECOGNIZER_ENDPOINT
+        self.key = key or settings.AZURE_FORM_RECOGNIZER_KEY
+        self.model_id = model_id or settings.AZURE_FORM_RECOGNIZER_MODEL_ID
         
         if not self.endpoint or not self.key:
             logger.warning("Azure Form Recognizer credentials not configured")
@@ -56,16 +68,13 @@ class AzureFormRecognizerService:
             raise ValueError("Azure Form Recognizer not configured")
         
         try:
-            with open(image_path, "rb") as f:
-                # Usar el modelo entrenado personalizado
-                poller = self.client.begin_analyze_document(
-                    self.model_id, 
-                    document=f
-                )
-                result = poller.result()
+            with limitador_azure.cupo(), open(image_path, "rb") as f:
+                result = self._analizar(f, crear_polling)
             
             # Extraer datos del resultado
             extracted_data = self._extract_data_from_result(result)
+            # Resultado completo para guardarlo comprimido (ver resultado_crudo.py)
+            extracted_data[CLAVE_RESULTADO_CRUDO] = result.to_dict()
             
             logger.info("Successfully analyzed document: %s", image_path)
             return extracted_data
@@ -80,10 +89,70 @@ class AzureFormRecognizerService:
             logger.error("Unexpected error analyzing document: %s", e)
             raise
     
+    def analyze_batch(self, path: str, paginas: int) -> List[Dict[str, Any]]:
+        """
+        Analizar un lote (PDF o TIFF de varias páginas) con una sola llamada.
+        
+        Cada documento de result.documents es una planilla: sus datos se
+        extraen por separado, igual que los de una imagen suelta.
+        
+        Args:
+            path: Ruta al archivo del lote
+            paginas: Páginas del archivo, para extender el plazo del análisis
+            
+        Returns:
+            Lista con los datos extraídos de cada documento, en orden; cada
+            uno lleva en CLAVE_RESULTADO_CRUDO el resultado de sus páginas
+            (ver dividir_resultado)
+        """
+        if not self.is_configured():
+            raise ValueError("Azure Form Recognizer not configured")
+        
+        plazo = settings.AZURE_ANALISIS_PLAZO + paginas * settings.LOTES_PLAZO_POR_PAGINA
+        try:
+            with limitador_azure.cupo(), open(path, "rb") as f:
+                result = self._analizar(f, lambda: crear_polling(plazo=plazo, estimar=False))
+        except AzureError as e:
+            logger.error("Azure Form Recognizer error: %s", e)
+            raise
+        
+        documentos = []
+        for parcial in dividir_resultado(result.to_dict()):
+            extracted_data = self._extract_data_from_result(AnalyzeResult.from_dict(parcial))
+            extracted_data[CLAVE_RESULTADO_CRUDO] = parcial
+            documentos.append(extracted_data)
+        
+        logger.info("Successfully analyzed batch: %s (%s documents)", path, len(documentos))
+        return documentos
+    
+    def _analizar(self, f, polling: Callable[[], Any]):
+        """
+        Enviar el archivo al modelo entrenado y esperar el resultado.
+        
+        Los reintentos del envío los hace el limitador (retry_total=0 solo
+        afecta al POST); cada intento usa un polling nuevo de `polling()`.
+        """
+        with medir_azure('envio', 'sync'):
+            poller = limitador_azure.llamar(
+                lambda: self.client.begin_analyze_document(
+                    self.model_id, 
+                    document=f,
+                    polling=polling(),
+                    retry_total=0
+                ),
+                antes_de_reintentar=lambda: f.seek(0)
+            )
+        with medir_azure('polling', 'sync'):
+            return poller.result()
+    
     def _extract_data_from_result(self, result) -> Dict[str, Any]:
         """
         Extraer datos estructurados del resultado del modelo entrenado.
         
+        Solo se conservan los campos de negocio que expone la API; el texto,
+        las tablas y los documentos completos quedan en el resultado crudo
+        comprimido (ResultadoCrudo), que se lee solo cuando se pide.
+        
         Args:
             result: Resultado del análisis de Azure
             
@@ -91,59 +160,19 @@ class AzureFormRecognizerService:
             Dict con los datos extraídos estructurados
         """
         extracted_data = {
-            'raw_result': {},
             'tarifas': [],
             'ingresos': [],
             'egresos': [],
             'control_boletos': [],
-            'texto_completo': '',
-            'tablas': [],
-            'campos_detectados': {}
+            'info_general': {},
+            'paginas': 0
         }
         
         try:
-            # Extraer texto completo
-            if hasattr(result, 'content'):
-                extracted_data['texto_completo'] = result.content
-            
-            # Extraer tablas
-            if hasattr(result, 'tables'):
-                for table in result.tables:
-                    table_data = {
-                        'row_count': table.row_count,
-                        'column_count': table.column_count,
-                        'cells': []
-                    }
-                    
-                    for cell in table.cells:
-                        table_data['cells'].append({
-                            'text': cell.content,
-                            'row_index': cell.row_index,
-                            'column_index': cell.column_index,
-                            'confidence': cell.confidence
-                        })
-                    
-                    extracted_data['tablas'].append(table_data)
-            
-            # Extraer campos específicos (key-value pairs)
-            if hasattr(result, 'key_value_pairs'):
-                for kv_pair in result.key_value_pairs:
-                    if kv_pair.key and kv_pair.value:
-                        extracted_data['campos_detectados'][kv_pair.key.content] = {
-                            'value': kv_pair.value.content,
-                            'confidence': kv_pair.confidence
-                        }
-            
-            # Guardar resultado completo incluyendo documentos
-            extracted_data['raw_result'] = {
-                'pages': len(result.pages) if hasattr(result, 'pages') else 0,
-                'tables_count': len(result.tables) if hasattr(result, 'tables') else 0,
-                'key_value_pairs_count': len(result.key_value_pairs) if hasattr(result, 'key_value_pairs') else 0,
-                'documents': result.documents if hasattr(result, 'documents') else []
-            }
+            extracted_data['paginas'] = len(getattr(result, 'pages', None) or [])
             
             # Procesar datos específicos de planillas usando el modelo entrenado
-            extracted_data = self._process_planilla_data(extracted_data)
+            extracted_data = self._process_planilla_data(extracted_data, getattr(result, 'documents', None) or [])
             
         except Exception as e:
             logger.error("Error processing Azure result: %s", e)
@@ -151,105 +180,28 @@ class AzureFormRecognizerService:
         
         return extracted_data
     
-    def _process_planilla_data(self, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _process_planilla_data(self, extracted_data: Dict[str, Any], documents) -> Dict[str, Any]:
         """
         Procesar datos específicos del modelo entrenado rendibus.v1.
         
         Args:
             extracted_data: Datos extraídos de Azure
+            documents: Documentos analizados (AnalyzedDocument o su to_dict())
             
         Returns:
             Datos procesados específicos para planillas
         """
         try:
-            # Obtener campos del documento
-            documents = extracted_data.get('raw_result', {}).get('documents', [])
             if not documents:
                 return extracted_data
             
-            fields = documents[0].get('fields', {})
-            
-            # Procesar tarifas (Tarifa 1-6)
-            tarifas = []
-            for i in range(1, 7):
-                tarifa_key = f"Tarifa {i}"
-                if tarifa_key in fields:
-                    tarifa_data = fields[tarifa_key]
-                    tarifas.append({
-                        'concepto': f'Tarifa {i}',
-                        'precio': float(tarifa_data.get('valueString', '0').replace('.', '').replace(',', '.')),
-                        'cantidad': 1,  # Se calculará basado en tickets
-                        'subtotal': 0  # Se calculará
-                    })
-            
-            # Procesar ingresos
-            ingresos = []
-            if 'Total Ingreso Ruta' in fields:
-                ingresos.append({
-                    'concepto': 'Total Ingreso Ruta',
-                    'monto': float(fields['Total Ingreso Ruta'].get('valueString', '0').replace('.', '').replace(',', '.')),
-                    'observaciones': 'Ingreso en ruta'
-                })
-            
-            if 'Total Ingreso Oficina' in fields:
-                ingresos.append({
-                    'concepto': 'Total Ingreso Oficina',
-                    'monto': float(fields['Total Ingreso Oficina'].get('valueString', '0').replace('.', '').replace(',', '.')),
-                    'observaciones': 'Ingreso en oficina'
-                })
-            
-            # Procesar egresos
-            egresos = []
-            egreso_fields = ['Losa', 'Cena', 'Viáticos', 'Pensión', 'Otros']
-            for field_name in egreso_fields:
-                if field_name in fields:
-                    field_data = fields[field_name]
-                    monto = field_data.get('valueNumber', 0)
-                    if monto > 0:
-                        egresos.append({
-                            'concepto': field_name,
-                            'monto': float(monto),
-                            'observaciones': f'Egreso: {field_name}'
-                        })
-            
-            # Procesar control de boletos
-            control_boletos = []
-            for i in range(1, 7):
-                inicial_key = f"Ticket Inicial T{i}"
-                final_key = f"Ticket Final T{i}"
-                if inicial_key in fields and final_key in fields:
-                    inicial = int(fields[inicial_key].get('valueString', '0'))
-                    final = int(fields[final_key].get('valueString', '0'))
-                    if final > inicial:
-                        control_boletos.append({
-                            'numero_inicial': inicial,
-                            'numero_final': final,
-                            'cantidad_vendidos': final - inicial + 1,
-                            'cantidad_devueltos': 0,
-                            'cantidad_anulados': 0
-                        })
-            
-            # Agregar datos procesados
-            extracted_data['tarifas'] = tarifas
-            extracted_data['ingresos'] = ingresos
-            extracted_data['egresos'] = egresos
-            extracted_data['control_boletos'] = control_boletos
-            
-            # Información general de la planilla
-            extracted_data['info_general'] = {
-                'ciudad_origen': fields.get('Ciudad Origen', {}).get('valueString', ''),
-                'ciudad_retorno': fields.get('Ciudad Retorno', {}).get('valueString', ''),
-                'fecha': fields.get('Fecha', {}).get('valueDate', ''),
-                'numero_planilla': fields.get('Nro Planilla', {}).get('valueString', ''),
-                'conductor': fields.get('Nom. Conductor', {}).get('valueString', ''),
-                'codigo_conductor': fields.get('Cód. Conductor', {}).get('valueString', ''),
-                'asistente': fields.get('Nom. Asistente', {}).get('valueString', ''),
-                'codigo_asistente': fields.get('Cód. Asistente', {}).get('valueString', ''),
-                'numero_bus': fields.get('Número Bus', {}).get('valueString', ''),
-                'patente_bus': fields.get('Patente Bus', {}).get('valueString', ''),
-                'horario_origen': fields.get('Horario Horigen', {}).get('valueString', ''),
-                'horario_retorno': fields.get('Horario Retorno', {}).get('valueString', '')
-            }
+            # Tarifas, ingresos, egresos, boletos e info_general según el mapa de campos;
+            # un valor ilegible se informa en errores_campos sin descartar el resto
+            datos, errores = normalizar_documento(campos_documento(documents))
+            extracted_data.update(datos)
+            if errores:
+                extracted_data['errores_campos'] = errores
+                logger.warning("Campos no válidos en la planilla: %s", ', '.join(errores))
             
         except Exception as e:
             logger.error("Error processing planilla data: %s", e)
@@ -281,5 +233,180 @@ class AzureFormRecognizerService:
         }
 
 
+class AsyncAzureFormRecognizerService(AzureFormRecognizerService):
+    """
+    Variante asíncrona del servicio, basada en azure.ai.formrecognizer.aio.
+    
+    Pensada para ejecutarse bajo ASGI: el polling del análisis no bloquea un
+    hilo, así un solo proceso mantiene muchos análisis en curso a la vez.
+    El cliente y su sesión HTTP (aiohttp) se crean una vez por event loop y
+    se reutilizan entre peticiones.
+    """
+    
+    def __init__(self, endpoint: Optional[str] = None, key: Optional[str] = None,
+                 model_id: Optional[str] = None):
+        # No se crea el cliente síncrono: el cliente aio se crea dentro del loop
+        self.endpoint = endpoint or settings.AZURE_FORM_RECOGNIZER_ENDPOINT
+        self.key = key or settings.AZURE_FORM_RECOGNIZER_KEY
+        self.model_id = model_id or settings.AZURE_FORM_RECOGNIZER_MODEL_ID
+        self.client = None
+        self._session = None
+        self._loop = None
+        self._lock = None
+    
+    def is_configured(self) -> bool:
+        """Verificar si el servicio está configurado correctamente"""
+        return bool(self.endpoint and self.key)
+    
+    async def _get_client(self) -> AsyncDocumentAnalysisClient:
+        """Obtener el cliente aio del loop actual, creándolo la primera vez"""
+        loop = asyncio.get_running_loop()
+        if self.client is not None and self._loop is loop:
+            return self.client
+        
+        if self._lock is None or self._loop is not loop:
+            anteriores = (self.client, self._session, self._loop)
+            self._lock = asyncio.Lock()
+            self.client = None
+            self._session = None
+            self._loop = loop
+            await self._cerrar_anteriores(*anteriores)
+        
+        async with self._lock:
+            if self.client is None:
+                # Import diferido: aiohttp solo se necesita en el camino asíncrono
+                import aiohttp
+                from azure.core.pipeline.transport import AioHttpTransport
+                
+                self._session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=settings.AZURE_ASYNC_MAX_CONEXIONES)
+                )
+                self.client = AsyncDocumentAnalysisClient(
+                    endpoint=self.endpoint,
+                    credential=AzureKeyCredential(self.key),
+                    transport=AioHttpTransport(session=self._session, session_owner=False)
+                )
+                logger.info("Async Azure Form Recognizer client initialized")
+        return self.client
+    
+    @staticmethod
+    async def _cerrar_anteriores(client, session, loop) -> None:
+        """
+        Cerrar el cliente y la sesión creados en otro event loop.
+        
+        Si ese loop sigue corriendo en otro hilo el cierre se agenda allí;
+        si ya terminó se cierran desde el loop actual. Un fallo al cerrar
+        no debe impedir crear el cliente nuevo.
+        """
+        if client is None and session is None:
+            return
+        
+        async def cerrar():
+            if client is not None:
+                await client.close()
+            if session is not None:
+                await session.close()
+        
+        try:
+            if loop is not None and loop.is_running() and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(cerrar(), loop)
+            else:
+                await cerrar()
+        except Exception as e:
+            logger.warning("No se pudo cerrar el cliente Azure del loop anterior: %s", e)
+    
+    async def close(self) -> None:
+        """Cerrar el cliente y la sesión HTTP compartida"""
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    async def analyze_document(self, image_path: str) -> Dict[str, Any]:
+        """
+        Analizar un documento usando el modelo entrenado personalizado.
+        
+        Args:
+            image_path: Ruta al archivo de imagen
+            
+        Returns:
+            Dict con los datos extraídos del documento
+        """
+        if not self.is_configured():
+            raise ValueError("Azure Form Recognizer not configured")
+        
+        try:
+            # La lectura del archivo se hace fuera del loop
+            document = await asyncio.to_thread(_leer_archivo, image_path)
+            
+            client = await self._get_client()
+            async with limitador_azure.cupo_async():
+                with medir_azure('envio', 'async'):
+                    poller = await limitador_azure.llamar_async(
+                        lambda: client.begin_analyze_document(
+                            self.model_id, document=document,
+                            polling=crear_polling(asincrono=True), retry_total=0
+                        )
+                    )
+                with medir_azure('polling', 'async'):
+                    result = await poller.result()
+            
+            extracted_data = self._extract_data_from_result(result)
+            # Resultado completo para guardarlo comprimido (ver resultado_crudo.py)
+            extracted_data[CLAVE_RESULTADO_CRUDO] = result.to_dict()
+            
+            logger.info("Successfully analyzed document: %s", image_path)
+            return extracted_data
+            
+        except AzureError as e:
+            logger.error("Azure Form Recognizer error: %s", e)
+            raise
+        except FileNotFoundError:
+            logger.error("Image file not found: %s", image_path)
+            raise
+        except Exception as e:
+            logger.error("Unexpected error analyzing document: %s", e)
+            raise
+
+
+def pagina_documento(documento: Dict[str, Any]) -> int:
+    """Primera página (desde 1) donde aparece un documento de to_dict()"""
+    regiones = documento.get('bounding_regions') or []
+    return min((region['page_number'] for region in regiones), default=1)
+
+
+def dividir_resultado(resultado: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Dividir el AnalyzeResult.to_dict() de un lote en un resultado por
+    documento, con solo las páginas que ocupa. Es lo que se guarda en
+    ResultadoCrudo de cada planilla, así reextraer() la mapea igual que
+    a una imagen suelta. El texto completo del lote no se copia.
+    """
+    paginas = {pagina['page_number']: pagina for pagina in resultado.get('pages') or []}
+    parciales = []
+    for documento in resultado.get('documents') or []:
+        numeros = sorted({
+            region['page_number'] for region in documento.get('bounding_regions') or []
+        }) or [pagina_documento(documento)]
+        parciales.append({
+            'api_version': resultado.get('api_version'),
+            'model_id': resultado.get('model_id'),
+            'content': '',
+            'pages': [paginas[numero] for numero in numeros if numero in paginas],
+            'documents': [documento],
+        })
+    return parciales
+
+
+def _leer_archivo(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
 # Instancia global del servicio
 azure_service = AzureFormRecognizerService()
+
+# Instancia global del servicio asíncrono (cliente creado al primer uso)
+azure_service_async = AsyncAzureFormRecognizerService()
@@ -0,0 +1,256 @@
+"""
+Snapshots columnares (Parquet) de planillas y sus líneas para análisis.
+
+Cada ejecución escribe un directorio SNAPSHOTS_ROOT/<marca de tiempo>/ con un
+archivo por entidad (planillas, tarifas, ingresos, egresos, control_boletos),
+planillas_eliminadas y un manifest.json.
+
+El modo incremental exporta las planillas con fecha_actualizacion posterior
+a la marca de agua del snapshot anterior menos SNAPSHOTS_SOLAPE segundos, y
+todas sus líneas, que se reescriben completas al re-procesar. fecha_actualizacion
+se asigna antes del COMMIT, así una transacción lenta puede confirmar una
+fecha anterior a la marca ya exportada; la ventana de solape la vuelve a
+tomar. Las líneas editadas por la API también tocan fecha_actualizacion de
+su planilla. Al cargar, la versión más reciente de cada planilla_id
+reemplaza a las anteriores (las repetidas por el solape son idénticas).
+
+Las planillas borradas no dejan filas que exportar: cada snapshot compara
+los ids vigentes con los del anterior (planillas_ids.parquet junto a
+estado.json) y escribe los que faltan en planillas_eliminadas.
+
+pyarrow está en requirements.txt, pero se importa recién al generar un
+snapshot: si falta en una instalación, solo este módulo responde con
+SnapshotNoDisponible y el resto de la API sigue funcionando.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ControlBoleto, Egreso, Ingreso, Planilla, Tarifa
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_ESTADO = 'estado.json'
+# Ids de planillas al momento del último snapshot, para detectar las borradas
+ARCHIVO_IDS = 'planillas_ids.parquet'
+ELIMINADAS = 'planillas_eliminadas'
+
+# Entidad -> (modelo, columnas y tipo arrow). Los montos se exportan como
+# float64 para que pandas los cargue como columnas numéricas y no de objetos.
+ENTIDADES = {
+    'planillas': (Planilla, [
+        ('id', 'int64'), ('status', 'string'), ('fecha_creacion', 'timestamp'),
+        ('fecha_actualizacion', 'timestamp'), ('numero_planilla', 'string'),
+        ('fecha_planilla', 'date'), ('numero_bus', 'string'), ('patente_bus', 'string'),
+        ('codigo_conductor', 'string'), ('ciudad_origen', 'string'), ('ciudad_retorno', 'string'),
+        ('nombre_archivo', 'string'), ('tamaño_archivo', 'int64'),
+    ]),
+    'tarifas': (Tarifa, [
+        ('id', 'int64'), ('planilla_id', 'int64'), ('concepto', 'string'),
+        ('precio', 'float64'), ('cantidad', 'int64'), ('subtotal', 'float64'),
+    ]),
+    'ingresos': (Ingreso, [
+        ('id', 'int64'), ('planilla_id', 'int64'), ('concepto', 'string'),
+        ('monto', 'float64'), ('observaciones', 'string'),
+    ]),
+    'egresos': (Egreso, [
+        ('id', 'int64'), ('planilla_id', 'int64'), ('concepto', 'string'),
+        ('monto', 'float64'), ('observaciones', 'string'),
+    ]),
+    'control_boletos': (ControlBoleto, [
+        ('id', 'int64'), ('planilla_id', 'int64'), ('numero_inicial', 'int64'),
+        ('numero_final', 'int64'), ('cantidad_vendidos', 'int64'), ('cantidad_devueltos', 'int64'),
+        ('cantidad_anulados', 'int64'), ('total_boletos', 'int64'), ('boletos_faltantes', 'int64'),
+    ]),
+}
+
+
+class SnapshotNoDisponible(Exception):
+    """pyarrow no está instalado"""
+
+
+def _pyarrow():
+    """Importar pyarrow al usarlo, con un error claro si falta"""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError as e:
+        raise SnapshotNoDisponible(
+            'La exportación Parquet requiere pyarrow (pip install pyarrow)'
+        ) from e
+    return pyarrow
+
+
+def _esquema(pa, columnas):
+    tipos = {
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'string': pa.string(),
+        'date': pa.date32(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(nombre, tipos[tipo]) for nombre, tipo in columnas])
+
+
+def leer_estado() -> Dict[str, Any]:
+    """Estado del último snapshot (marca de agua de fecha_actualizacion)"""
+    ruta = os.path.join(settings.SNAPSHOTS_ROOT, ARCHIVO_ESTADO)
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _guardar_estado(estado: Dict[str, Any]) -> None:
+    ruta = os.path.join(settings.SNAPSHOTS_ROOT, ARCHIVO_ESTADO)
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=2)
+    os.replace(temporal, ruta)
+
+
+def _escribir_entidad(pa, ruta: str, queryset, columnas) -> int:
+    """
+    Escribir un queryset a Parquet por lotes de filas (un row group por
+    lote), así la memoria no depende del total exportado.
+    """
+    esquema = _esquema(pa, columnas)
+    nombres = [nombre for nombre, _ in columnas]
+    convertir = [tipo == 'float64' for _, tipo in columnas]
+    lote = settings.SNAPSHOTS_FILAS_POR_LOTE
+    total = 0
+
+    def _tabla(filas):
+        columnas_datos = list(zip(*filas))
+        arrays = [
+            pa.array([float(v) if v is not None else None for v in datos] if es_float else datos,
+                     type=esquema.field(i).type)
+            for i, (datos, es_float) in enumerate(zip(columnas_datos, convertir))
+        ]
+        return pa.Table.from_arrays(arrays, schema=esquema)
+
+    with pa.parquet.ParquetWriter(ruta, esquema, compression='zstd') as escritor:
+        filas: List[tuple] = []
+        for fila in queryset.order_by('id').values_list(*nombres).iterator(chunk_size=lote):
+            filas.append(fila)
+            if len(filas) >= lote:
+                escritor.write_table(_tabla(filas))
+                total += len(filas)
+                filas = []
+        if filas:
+            escritor.write_table(_tabla(filas))
+            total += len(filas)
+        if total == 0:
+            escritor.write_table(esquema.empty_table())
+    return total
+
+
+def _escribir_ids(pa, ruta: str, columna: str, ids: List[int]) -> None:
+    """Escribir una lista de ids como Parquet de una columna, reemplazando el archivo de forma atómica"""
+    temporal = f'{ruta}.tmp'
+    tabla = pa.Table.from_arrays([pa.array(ids, type=pa.int64())], names=[columna])
+    pa.parquet.write_table(tabla, temporal, compression='zstd')
+    os.replace(temporal, ruta)
+
+
+def _ids_anteriores(pa) -> List[int]:
+    """Ids de planillas del snapshot anterior (vacío si es el primero)"""
+    ruta = os.path.join(settings.SNAPSHOTS_ROOT, ARCHIVO_IDS)
+    if not os.path.isfile(ruta):
+        return []
+    return pa.parquet.read_table(ruta).column('id').to_pylist()
+
+
+def generar_snapshot(completo: bool = False) -> Dict[str, Any]:
+    """
+    Generar un snapshot Parquet.
+
+    Args:
+        completo: Exportar todo aunque exista un snapshot anterior
+
+    Returns:
+        Manifest del snapshot: nombre, tipo, rango y filas por entidad
+    """
+    pa = _pyarrow()
+
+    estado = leer_estado()
+    desde = None if completo else estado.get('fecha_actualizacion')
+    inicio = timezone.now()
+    nombre = inicio.strftime('%Y%m%dT%H%M%S%fZ')
+    directorio = os.path.join(settings.SNAPSHOTS_ROOT, nombre)
+    os.makedirs(directorio, exist_ok=True)
+
+    # Antes de leer las planillas: una creada después queda para el próximo snapshot
+    vigentes = list(Planilla.objects.order_by('id').values_list('id', flat=True))
+
+    planillas = Planilla.objects.all()
+    if desde:
+        desde_fecha = datetime.fromisoformat(desde)
+        planillas = planillas.filter(
+            fecha_actualizacion__gt=desde_fecha - timedelta(seconds=settings.SNAPSHOTS_SOLAPE)
+        )
+    # Marca de agua: la mayor fecha_actualizacion efectivamente exportada
+    marca = planillas.order_by('-fecha_actualizacion').values_list('fecha_actualizacion', flat=True).first()
+    ids = planillas.values('id')
+
+    filas = {}
+    for entidad, (modelo, columnas) in ENTIDADES.items():
+        queryset = planillas if modelo is Planilla else modelo.objects.filter(planilla_id__in=ids)
+        if marca is not None:
+            # No exportar filas de planillas actualizadas durante el snapshot
+            campo = 'fecha_actualizacion' if modelo is Planilla else 'planilla__fecha_actualizacion'
+            queryset = queryset.filter(**{f'{campo}__lte': marca})
+        filas[entidad] = _escribir_entidad(pa, os.path.join(directorio, f'{entidad}.parquet'), queryset, columnas)
+
+    eliminadas = sorted(set(_ids_anteriores(pa)) - set(vigentes))
+    _escribir_ids(pa, os.path.join(directorio, f'{ELIMINADAS}.parquet'), 'planilla_id', eliminadas)
+    filas[ELIMINADAS] = len(eliminadas)
+
+    # Las filas del solape no hacen retroceder la marca
+    if desde and (marca is None or marca < desde_fecha):
+        marca = desde_fecha
+    manifest = {
+        'nombre': nombre,
+        'tipo': 'incremental' if desde else 'completo',
+        'desde': desde,
+        'solape_segundos': settings.SNAPSHOTS_SOLAPE if desde else 0,
+        'hasta': marca.isoformat() if marca else None,
+        'generado': inicio.isoformat(),
+        'filas': filas,
+    }
+    with open(os.path.join(directorio, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    _escribir_ids(pa, os.path.join(settings.SNAPSHOTS_ROOT, ARCHIVO_IDS), 'id', vigentes)
+    _guardar_estado({'fecha_actualizacion': manifest['hasta'], 'ultimo_snapshot': nombre})
+    logger.info("Snapshot %s (%s) generado: %s", nombre, manifest['tipo'], filas)
+    return manifest
+
+
+def listar_snapshots() -> List[Dict[str, Any]]:
+    """Manifests de los snapshots existentes, del más reciente al más antiguo"""
+    raiz = settings.SNAPSHOTS_ROOT
+    if not os.path.isdir(raiz):
+        return []
+    manifests = []
+    for nombre in sorted(os.listdir(raiz), reverse=True):
+        ruta = os.path.join(raiz, nombre, 'manifest.json')
+        if os.path.isfile(ruta):
+            with open(ruta, encoding='utf-8') as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def ruta_archivo(nombre: str, entidad: str) -> Optional[str]:
+    """Ruta del Parquet de una entidad en un snapshot, o None si no existe"""
+    if entidad not in (*ENTIDADES, ELIMINADAS) or os.path.basename(nombre) != nombre or nombre.startswith('.'):
+        return None
+    ruta = os.path.join(settings.SNAPSHOTS_ROOT, nombre, f'{entidad}.parquet')
+    return ruta if os.path.isfile(ruta) else None
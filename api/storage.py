@@ -0,0 +1,121 @@
+"""
+Storages para las imágenes de planillas (Planilla.imagen).
+
+El storage se elige con PLANILLAS_STORAGE:
+
+- AlmacenamientoPorContenido (por defecto): guarda cada imagen en
+  planillas/<ab>/<cd>/<sha256>.<ext>. Los directorios quedan repartidos por
+  el hash y una imagen subida dos veces se almacena una sola vez.
+- AlmacenamientoPlanillas: directorio plano planillas/ con nombres únicos
+  (el comportamiento original).
+
+Ambos exponen mover_archivo(), usado por los caminos que ya tienen el
+archivo completo en disco (upload handler, subida reanudable) para dejarlo
+en su ubicación final con un rename, sin copiarlo.
+"""
+
+import hashlib
+import os
+import uuid
+from typing import Tuple
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.module_loading import import_string
+
+# Directorio (relativo a MEDIA_ROOT) de los archivos en escritura
+DIRECTORIO_TEMPORAL = os.path.join('planillas', '.subiendo')
+
+
+class AlmacenamientoPlanillas(FileSystemStorage):
+    """Storage de archivos en un directorio plano con nombres únicos"""
+
+    def ruta_temporal(self) -> str:
+        """Ruta para escribir un archivo antes de moverlo a su lugar final"""
+        directorio = os.path.join(self.location, DIRECTORIO_TEMPORAL)
+        os.makedirs(directorio, exist_ok=True)
+        return os.path.join(directorio, f'{uuid.uuid4().hex}.part')
+
+    def reservar_nombre(self, nombre: str, max_length=None) -> Tuple[str, str]:
+        """
+        Reservar de forma atómica un nombre libre.
+
+        Returns:
+            Tupla (nombre relativo al storage, ruta absoluta)
+        """
+        while True:
+            disponible = self.get_available_name(nombre, max_length=max_length)
+            ruta = self.path(disponible)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            try:
+                # O_EXCL evita que dos subidas simultáneas tomen el mismo nombre
+                os.close(os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return disponible, ruta
+            except FileExistsError:
+                continue
+
+    def mover_archivo(self, ruta_temporal: str, nombre: str, sha256: str, max_length=None) -> Tuple[str, str, bool]:
+        """
+        Mover un archivo ya escrito en disco a su ubicación final.
+
+        Args:
+            ruta_temporal: Archivo completo, en el mismo sistema de archivos
+            nombre: Nombre sugerido relativo al storage (p. ej. planillas/foto.jpg)
+            sha256: Hash del contenido
+
+        Returns:
+            Tupla (nombre almacenado, ruta absoluta, True si el archivo es nuevo)
+        """
+        almacenado, ruta = self.reservar_nombre(nombre, max_length=max_length)
+        os.replace(ruta_temporal, ruta)
+        return almacenado, ruta, True
+
+
+class AlmacenamientoPorContenido(AlmacenamientoPlanillas):
+    """
+    Storage direccionado por contenido: el nombre es el SHA-256 del archivo,
+    repartido en dos niveles de subdirectorios. Archivos idénticos se
+    guardan una sola vez y nunca se sobrescriben.
+    """
+
+    def nombre_por_contenido(self, sha256: str, nombre: str) -> str:
+        extension = os.path.splitext(nombre)[1].lower() or '.bin'
+        directorio = os.path.dirname(nombre) or 'planillas'
+        return '/'.join([directorio, sha256[:2], sha256[2:4], f'{sha256}{extension}'])
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre depende solo del contenido: si ya existe es el mismo archivo
+        return name
+
+    def mover_archivo(self, ruta_temporal: str, nombre: str, sha256: str, max_length=None) -> Tuple[str, str, bool]:
+        almacenado = self.nombre_por_contenido(sha256, nombre)
+        ruta = self.path(almacenado)
+        if os.path.exists(ruta):
+            os.remove(ruta_temporal)
+            return almacenado, ruta, False
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        os.replace(ruta_temporal, ruta)
+        return almacenado, ruta, True
+
+    def _save(self, name, content):
+        """Escribir a un temporal calculando el hash y luego moverlo a su nombre por contenido"""
+        temporal = self.ruta_temporal()
+        sha256 = hashlib.sha256()
+        try:
+            with open(temporal, 'wb') as destino:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    destino.write(chunk)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        almacenado, _, _ = self.mover_archivo(temporal, name, sha256.hexdigest())
+        return almacenado
+
+
+def obtener_storage_planillas():
+    """Storage configurado en PLANILLAS_STORAGE (usado por Planilla.imagen)"""
+    return import_string(settings.PLANILLAS_STORAGE)()
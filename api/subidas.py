@@ -0,0 +1,312 @@
+"""
+Protocolo de subida reanudable de imágenes de planillas.
+
+1. POST /api/subidas/ inicia la sesión (nombre, tamaño total y de chunk).
+2. PUT /api/subidas/{id}/chunks/{n}/ envía el chunk n como cuerpo binario.
+3. GET /api/subidas/{id}/ informa los rangos de bytes recibidos.
+4. POST /api/subidas/{id}/finalizar/ valida el archivo y crea la Planilla.
+
+Los chunks se escriben en su posición dentro de un archivo .part en disco
+sin cargar el archivo completo en memoria. Cada chunk escribe con un flock
+compartido sobre el .part y la finalización lo toma exclusivo, así un chunk
+en vuelo nunca escribe sobre el archivo ya validado o movido al storage.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .imagenes import programar_preprocesamiento
+from .metricas import BYTES_SUBIDOS
+from .models import ChunkSubida, Planilla, SubidaReanudable
+from .uploads import ubicar_archivo, validar_imagen
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de bloque para copiar el cuerpo de la petición a disco
+BLOQUE_LECTURA = 64 * 1024
+
+
+class ErrorSubida(Exception):
+    """Error de validación del protocolo de subida reanudable"""
+
+
+class SubidaEnFinalizacion(ErrorSubida):
+    """Otra petición está finalizando la misma subida"""
+
+
+def ruta_parcial(subida: SubidaReanudable) -> str:
+    """Ruta del archivo .part donde se ensamblan los chunks"""
+    return os.path.join(settings.MEDIA_ROOT, 'subidas', f'{subida.id}.part')
+
+
+def _bloquear(archivo, exclusivo: bool) -> None:
+    """flock sobre el .part abierto (sin fcntl no hay bloqueo)"""
+    if fcntl is not None:
+        fcntl.flock(archivo.fileno(), fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+
+
+def iniciar_subida(nombre_archivo: str, tamaño_total: int, tamaño_chunk: Optional[int] = None,
+                   sha256: str = '') -> SubidaReanudable:
+    """Crear una sesión de subida y reservar su archivo en disco"""
+    tamaño_chunk = tamaño_chunk or settings.SUBIDAS_TAMANO_CHUNK
+    if tamaño_total <= 0 or tamaño_total > settings.PLANILLAS_MAX_TAMANO_ARCHIVO:
+        raise ErrorSubida(
+            f"El tamaño total debe estar entre 1 y {settings.PLANILLAS_MAX_TAMANO_ARCHIVO} bytes"
+        )
+    if not settings.SUBIDAS_TAMANO_CHUNK_MIN <= tamaño_chunk <= settings.SUBIDAS_TAMANO_CHUNK_MAX:
+        raise ErrorSubida(
+            f"El tamaño de chunk debe estar entre {settings.SUBIDAS_TAMANO_CHUNK_MIN} "
+            f"y {settings.SUBIDAS_TAMANO_CHUNK_MAX} bytes"
+        )
+
+    subida = SubidaReanudable.objects.create(
+        nombre_archivo=os.path.basename(nombre_archivo),
+        tamaño_total=tamaño_total,
+        tamaño_chunk=tamaño_chunk,
+        sha256=sha256.lower()
+    )
+
+    ruta = ruta_parcial(subida)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'wb') as f:
+        # Archivo disperso del tamaño final: cada chunk se escribe en su offset
+        f.truncate(tamaño_total)
+
+    logger.info("Subida %s iniciada: %s (%s bytes)", subida.id, nombre_archivo, tamaño_total)
+    return subida
+
+
+def recibir_chunk(subida: SubidaReanudable, numero: int, stream, largo: int) -> bool:
+    """
+    Escribir el chunk `numero` leyendo el cuerpo de la petición por bloques.
+
+    Args:
+        stream: Objeto con read(n) (el cuerpo de la petición)
+        largo: Content-Length informado por el cliente
+
+    Returns:
+        True si el chunk es nuevo, False si ya se había recibido
+    """
+    if subida.estado != 'active':
+        raise ErrorSubida("La subida ya fue finalizada o se está finalizando")
+    if numero >= subida.total_chunks:
+        raise ErrorSubida(f"Chunk fuera de rango (total: {subida.total_chunks})")
+    esperado = subida.largo_chunk(numero)
+    if largo != esperado:
+        raise ErrorSubida(f"El chunk {numero} debe tener {esperado} bytes, se recibieron {largo}")
+
+    ruta = ruta_parcial(subida)
+    finalizada = ErrorSubida("La subida ya fue finalizada o se está finalizando")
+    try:
+        archivo = open(ruta, 'r+b')
+    except FileNotFoundError:
+        # La finalización movió el .part mientras llegaba este chunk
+        raise finalizada from None
+
+    escritos = 0
+    with archivo as f:
+        _bloquear(f, exclusivo=False)
+        # Con el lock tomado: la subida sigue activa y el descriptor sigue siendo el .part
+        try:
+            movido = os.fstat(f.fileno()).st_ino != os.stat(ruta).st_ino
+        except FileNotFoundError:
+            movido = True
+        if movido or not SubidaReanudable.objects.filter(pk=subida.pk, estado='active').exists():
+            raise finalizada
+        f.seek(numero * subida.tamaño_chunk)
+        while escritos < esperado:
+            bloque = stream.read(min(BLOQUE_LECTURA, esperado - escritos))
+            if not bloque:
+                break
+            f.write(bloque)
+            escritos += len(bloque)
+
+    BYTES_SUBIDOS.inc('reanudable', cantidad=escritos)
+    if escritos != esperado:
+        raise ErrorSubida(f"Chunk {numero} incompleto: {escritos} de {esperado} bytes")
+
+    try:
+        with transaction.atomic():
+            ChunkSubida.objects.create(subida=subida, numero=numero)
+    except IntegrityError:
+        # Reenvío de un chunk ya registrado: el contenido se sobrescribió igual
+        return False
+
+    # Tocar la sesión para que la limpieza de subidas abandonadas la respete
+    subida.save(update_fields=['fecha_actualizacion'])
+    return True
+
+
+def rangos_recibidos(subida: SubidaReanudable) -> List[List[int]]:
+    """
+    Rangos de bytes recibidos como lista de [inicio, fin) fusionados.
+    """
+    rangos: List[List[int]] = []
+    for numero in subida.chunks.values_list('numero', flat=True).order_by('numero'):
+        inicio = numero * subida.tamaño_chunk
+        fin = inicio + subida.largo_chunk(numero)
+        if rangos and rangos[-1][1] == inicio:
+            rangos[-1][1] = fin
+        else:
+            rangos.append([inicio, fin])
+    return rangos
+
+
+def chunks_faltantes(subida: SubidaReanudable) -> List[int]:
+    """Números de chunk que aún no se reciben"""
+    recibidos = set(subida.chunks.values_list('numero', flat=True))
+    return [n for n in range(subida.total_chunks) if n not in recibidos]
+
+
+def estado_subida(subida: SubidaReanudable) -> Dict:
+    """Representación del estado de la subida para la API"""
+    faltantes = chunks_faltantes(subida)
+    return {
+        'id': str(subida.id),
+        'nombre_archivo': subida.nombre_archivo,
+        'estado': subida.estado,
+        'tamaño_total': subida.tamaño_total,
+        'tamaño_chunk': subida.tamaño_chunk,
+        'total_chunks': subida.total_chunks,
+        'rangos_recibidos': rangos_recibidos(subida),
+        'chunks_faltantes': faltantes,
+        'planilla_id': subida.planilla_id,
+    }
+
+
+def finalizar_subida(subida: SubidaReanudable) -> Planilla:
+    """
+    Validar el archivo ensamblado, moverlo al storage de las imágenes y crear
+    la Planilla. Es idempotente: si ya se finalizó retorna la misma planilla.
+
+    La subida se reclama con un UPDATE condicional de 'active' a
+    'finalizing': si dos peticiones finalizan a la vez solo una crea la
+    planilla y la otra recibe SubidaEnFinalizacion. Si la validación falla
+    la subida vuelve a 'active' para que el cliente pueda corregirla.
+    """
+    if subida.estado == 'completed' and subida.planilla_id:
+        return subida.planilla
+
+    faltantes = chunks_faltantes(subida)
+    if faltantes:
+        raise ErrorSubida(f"Faltan {len(faltantes)} chunks: {faltantes[:20]}")
+
+    reclamada = SubidaReanudable.objects.filter(pk=subida.pk, estado='active').update(
+        estado='finalizing', fecha_actualizacion=timezone.now()
+    )
+    if not reclamada:
+        subida.refresh_from_db()
+        if subida.estado == 'completed' and subida.planilla_id:
+            return subida.planilla
+        raise SubidaEnFinalizacion("La subida se está finalizando en otra petición")
+    subida.estado = 'finalizing'
+
+    try:
+        with open(ruta_parcial(subida), 'rb') as parcial:
+            # Espera a los chunks en vuelo; los que lleguen después ven 'finalizing'
+            _bloquear(parcial, exclusivo=True)
+            planilla = _crear_planilla(subida)
+    except BaseException:
+        SubidaReanudable.objects.filter(pk=subida.pk, estado='finalizing').update(estado='active')
+        subida.estado = 'active'
+        raise
+
+    transaction.on_commit(lambda: programar_preprocesamiento(planilla))
+    logger.info("Subida %s finalizada: planilla %s", subida.id, planilla.id)
+    return planilla
+
+
+def _crear_planilla(subida: SubidaReanudable) -> Planilla:
+    """Verificar el archivo de una subida ya reclamada y crear su planilla"""
+    ruta = ruta_parcial(subida)
+
+    # Hash en streaming, sin cargar el archivo en memoria
+    sha256 = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(BLOQUE_LECTURA), b''):
+            sha256.update(bloque)
+    digest = sha256.hexdigest()
+    if subida.sha256 and subida.sha256 != digest:
+        raise ErrorSubida("El SHA-256 del archivo no coincide con el informado")
+
+    with open(ruta, 'rb') as f:
+        try:
+            validar_imagen(File(f, name=subida.nombre_archivo))
+        except ValueError as e:
+            raise ErrorSubida(str(e)) from e
+
+    nombre_almacenado, ruta_almacenada, nuevo = ubicar_archivo(ruta, subida.nombre_archivo, digest)
+
+    try:
+        with transaction.atomic():
+            planilla = Planilla.objects.create(
+                imagen=nombre_almacenado,
+                nombre_archivo=subida.nombre_archivo,
+                tamaño_archivo=subida.tamaño_total,
+                hash_contenido=digest
+            )
+            subida.planilla = planilla
+            subida.estado = 'completed'
+            subida.save(update_fields=['planilla', 'estado', 'fecha_actualizacion'])
+            subida.chunks.all().delete()
+    except BaseException:
+        _devolver_parcial(ruta, nombre_almacenado, ruta_almacenada, nuevo)
+        raise
+    return planilla
+
+
+def _devolver_parcial(ruta: str, nombre_almacenado: str, ruta_almacenada: str, nuevo: bool) -> None:
+    """
+    Restaurar el .part de una finalización cuya planilla no se creó, para
+    que el cliente pueda reintentarla sin volver a enviar los chunks.
+
+    El archivo se devuelve con un rename solo si lo movió esta finalización
+    y ninguna planilla lo usa; si no, se copia y el almacenado se conserva.
+    """
+    try:
+        mover = nuevo and not Planilla.objects.filter(imagen=nombre_almacenado).exists()
+    except Exception:
+        mover = False
+    if mover:
+        os.replace(ruta_almacenada, ruta)
+    else:
+        shutil.copyfile(ruta_almacenada, ruta)
+
+
+def limpiar_subidas_abandonadas(horas: int) -> int:
+    """
+    Eliminar las subidas en curso (o cuya finalización se interrumpió) sin
+    actividad en las últimas `horas` junto con su archivo parcial.
+
+    Returns:
+        Cantidad de subidas eliminadas
+    """
+    limite = timezone.now() - timedelta(hours=horas)
+    abandonadas = SubidaReanudable.objects.filter(
+        estado__in=['active', 'finalizing'], fecha_actualizacion__lt=limite
+    )
+    eliminadas = 0
+    for subida in abandonadas.iterator():
+        try:
+            os.remove(ruta_parcial(subida))
+        except FileNotFoundError:
+            pass
+        subida.delete()
+        eliminadas += 1
+    if eliminadas:
+        logger.info("Se eliminaron %s subidas abandonadas", eliminadas)
+    return eliminadas
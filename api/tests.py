@@ -1,3 +1,1474 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from azure.ai.formrecognizer import AnalyzeResult
+from azure.core.exceptions import HttpResponseError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from PIL import Image
+import pyarrow.parquet as pq
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from benchmarks.fake_azure import iniciar_servidor
+
+from . import imagenes, jobs, metricas, polling, snapshots, subidas, uploads, views
+from .archivo import archivar_planillas, restaurar_imagen
+from .cache_resultados import CacheResultados, resultado_cache
+from .materializacion import materializar_planilla
+from .jobs import guardar_resultado
+from .limites import CuboTokens, LimitadorAzure, SemaforoArchivos
+from .normalizacion import normalizar_documento, normalizar_lote
+from .models import (
+    LotePlanillas, Planilla, ProcesamientoJob, ResultadoAnalisisCache, ResultadoCrudo, ResumenDiario,
+    SubidaReanudable, Tarifa
+)
+from .remapeo import descomprimir
+from .resultado_crudo import compactar_planillas, guardar_resultado_crudo, reextraer
+from .resumenes import reconstruir_resumenes
+from .services import (
+    CLAVE_RESULTADO_CRUDO, AsyncAzureFormRecognizerService, AzureFormRecognizerService, azure_service
+)
+
+
+DATOS_EXTRAIDOS = {
+    'tarifas': [{'concepto': 'Tarifa 1', 'precio': 1500.0, 'cantidad': 1}],
+    'ingresos': [{'concepto': 'Total Ingreso Ruta', 'monto': 45000.0, 'observaciones': ''}],
+    'egresos': [{'concepto': 'Cena', 'monto': 3000.0, 'observaciones': ''}],
+    'control_boletos': [{
+        'numero_inicial': 100, 'numero_final': 150, 'cantidad_vendidos': 51,
+        'cantidad_devueltos': 0, 'cantidad_anulados': 0
+    }],
+}
+
+
+def crear_planilla(**kwargs):
+    """Planilla completada con sus filas relacionales materializadas"""
+    planilla = Planilla.objects.create(
+        imagen='planillas/test.jpg',
+        status='completed',
+        datos_extraidos=DATOS_EXTRAIDOS,
+        **kwargs
+    )
+    materializar_planilla(planilla)
+    return planilla
+
+
+class PlanillaQueryCountTests(TestCase):
+    """
+    Fija la cantidad de consultas por endpoint: si un cambio introduce un
+    N+1 o vuelve a leer datos_extraidos en el listado, estos tests fallan.
+    """
+
+    def setUp(self):
+        self.planillas = [crear_planilla() for _ in range(5)]
+
+    def test_listado_no_depende_de_la_cantidad(self):
+        # Paginación por cursor: solo el SELECT de la página, sin COUNT
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/planillas/')
+        self.assertEqual(response.status_code, 200)
+
+        for _ in range(10):
+            crear_planilla()
+        with self.assertNumQueries(1):
+            self.client.get('/api/planillas/')
+
+    def test_listado_por_numero_de_pagina(self):
+        # ?page= usa PageNumberPagination: COUNT + SELECT
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/planillas/?page=1')
+        self.assertEqual(response.json()['count'], 5)
+
+    def test_listado_no_lee_datos_extraidos(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get('/api/planillas/')
+        for consulta in consultas.captured_queries:
+            self.assertNotIn('datos_extraidos', consulta['sql'])
+
+    def test_detalle_precarga_relaciones(self):
+        # Planilla + una consulta por cada una de las 4 relaciones
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/planillas/{self.planillas[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['tarifas']), 1)
+        self.assertEqual(len(response.json()['control_boletos']), 1)
+
+    def test_datos_extraidos(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/planillas/{self.planillas[0].id}/datos_extraidos/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_listado_tarifas(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tarifas/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_listado_jobs(self):
+        for planilla in self.planillas:
+            ProcesamientoJob.objects.create(planilla=planilla)
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get('/api/jobs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(consultas.captured_queries), 1)
+        for consulta in consultas.captured_queries:
+            self.assertNotIn('datos_extraidos', consulta['sql'])
+
+
+class PaginacionCursorTests(TestCase):
+    """El cursor recorre todas las filas sin repetir ni saltar ninguna"""
+
+    def test_recorrer_todas_las_paginas(self):
+        creadas = {crear_planilla().id for _ in range(7)}
+        vistas = []
+        url = '/api/planillas/?page_size=3'
+        while url:
+            with self.assertNumQueries(1):
+                datos = self.client.get(url).json()
+            vistas.extend(p['id'] for p in datos['results'])
+            url = datos['next']
+        self.assertEqual(len(vistas), 7)
+        self.assertEqual(set(vistas), creadas)
+        self.assertEqual(vistas, sorted(vistas, reverse=True))
+
+
+class EncabezadoPlanillaTests(TestCase):
+    """Columnas de encabezado copiadas de info_general y filtros del listado"""
+
+    def setUp(self):
+        self.planilla = Planilla.objects.create(imagen='planillas/test.jpg')
+        guardar_resultado(self.planilla, {
+            **DATOS_EXTRAIDOS,
+            'info_general': {
+                'numero_planilla': '004512', 'fecha': '15/03/2024', 'numero_bus': '210',
+                'patente_bus': 'hk-ls 21', 'codigo_conductor': '77',
+            },
+        })
+        crear_planilla()
+
+    def test_columnas_al_completar(self):
+        self.planilla.refresh_from_db()
+        self.assertEqual(self.planilla.numero_planilla, '004512')
+        self.assertEqual(str(self.planilla.fecha_planilla), '2024-03-15')
+        self.assertEqual(self.planilla.patente_bus, 'HKLS21')
+        self.assertEqual(self.planilla.tarifas.count(), 1)
+
+    def test_filtros(self):
+        for filtro in (
+            'numero_bus=210', 'patente_bus=HK-LS21', 'codigo_conductor=77',
+            'fecha=2024-03-15', 'fecha_desde=2024-03-01&fecha_hasta=2024-03-31',
+            'status=completed&numero_planilla=004512',
+        ):
+            with self.assertNumQueries(1):
+                resultados = self.client.get(f'/api/planillas/?{filtro}').json()['results']
+            self.assertEqual([p['id'] for p in resultados], [self.planilla.id], filtro)
+
+    def test_fecha_invalida(self):
+        self.assertEqual(self.client.get('/api/planillas/?fecha=ayer').status_code, 400)
+
+
+class MaterializacionTests(TestCase):
+    """Ítems mal formados de Azure y errores al guardar el resultado"""
+
+    def test_items_mal_formados_se_omiten(self):
+        planilla = Planilla.objects.create(imagen='planillas/test.jpg')
+        datos = {
+            'tarifas': [
+                {'concepto': None, 'precio': 1500.0, 'cantidad': 'abc'},
+                {'concepto': None, 'precio': 'NaN', 'cantidad': 1},
+                {'concepto': 'Tarifa 2', 'precio': 99999999999, 'cantidad': 1},
+                {'precio': 800, 'cantidad': '2'},
+                'Tarifa suelta',
+            ],
+            'ingresos': [{'concepto': None, 'monto': 45000.0, 'observaciones': None}, None],
+            'egresos': None,
+            'control_boletos': [
+                {'numero_final': 150, 'cantidad_vendidos': 51},
+                {'numero_inicial': 'cien', 'numero_final': 150, 'cantidad_vendidos': 51},
+                {'numero_inicial': -5, 'numero_final': 150, 'cantidad_vendidos': 51},
+                {'numero_inicial': 100, 'numero_final': 150, 'cantidad_vendidos': 51, 'cantidad_anulados': None},
+            ],
+        }
+        with self.assertLogs('api.materializacion', 'WARNING'):
+            conteos = materializar_planilla(planilla, datos)
+
+        self.assertEqual(conteos, {'tarifas': 1, 'ingresos': 1, 'egresos': 0, 'control_boletos': 1})
+        tarifa = planilla.tarifas.get()
+        self.assertEqual((tarifa.concepto, tarifa.cantidad, tarifa.subtotal), ('', 2, Decimal('1600.00')))
+        self.assertEqual(planilla.ingresos.get().observaciones, '')
+
+    def test_error_al_guardar_marca_la_planilla(self):
+        planilla = Planilla.objects.create(imagen='planillas/test.jpg', hash_contenido='ef' * 32)
+        parches = (
+            mock.patch.object(jobs, 'restaurar_imagen'),
+            mock.patch.object(jobs, 'preprocesar_planilla'),
+            mock.patch.object(jobs.resultado_cache, 'obtener', return_value=None),
+            mock.patch.object(jobs.azure_service, 'analyze_document', return_value=dict(DATOS_EXTRAIDOS)),
+            mock.patch.object(jobs, 'materializar_planilla', side_effect=RuntimeError('fila inválida')),
+        )
+        for parche in parches:
+            parche.start()
+            self.addCleanup(parche.stop)
+
+        with self.assertRaises(RuntimeError), self.assertLogs('api.jobs', 'ERROR'):
+            jobs.procesar_planilla(planilla)
+
+        planilla.refresh_from_db()
+        self.assertEqual(planilla.status, 'error')
+        self.assertEqual(planilla.error_procesamiento, 'fila inválida')
+        # El análisis de Azure no se pierde
+        self.assertEqual(planilla.datos_extraidos['tarifas'], DATOS_EXTRAIDOS['tarifas'])
+        self.assertFalse(planilla.tarifas.exists())
+
+
+class ResumenDiarioTests(TestCase):
+    """El resumen se actualiza al completar cada planilla y coincide con una reconstrucción"""
+
+    def completar(self, numero_bus, ingreso, egreso, fecha='2024-03-15'):
+        planilla = Planilla.objects.create(imagen='planillas/test.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            guardar_resultado(planilla, {
+                'ingresos': [{'concepto': 'Total Ingreso Ruta', 'monto': ingreso}],
+                'egresos': [{'concepto': 'Cena', 'monto': egreso}],
+                'info_general': {
+                    'fecha': fecha, 'numero_bus': numero_bus, 'codigo_conductor': '77',
+                    'ciudad_origen': 'Temuco', 'ciudad_retorno': 'Santiago',
+                },
+            })
+        return planilla
+
+    def test_actualizacion_incremental(self):
+        self.completar('210', 40000, 5000)
+        self.completar('210', 10000, 1000)
+        self.completar('305', 20000, 0)
+
+        resumen = ResumenDiario.objects.get(numero_bus='210')
+        self.assertEqual(resumen.planillas, 2)
+        self.assertEqual(resumen.total_ingresos, 50000)
+        self.assertEqual(resumen.total_egresos, 6000)
+
+        incremental = list(ResumenDiario.objects.order_by('numero_bus').values(
+            'numero_bus', 'planillas', 'total_ingresos', 'total_egresos'
+        ))
+        reconstruir_resumenes()
+        reconstruido = list(ResumenDiario.objects.order_by('numero_bus').values(
+            'numero_bus', 'planillas', 'total_ingresos', 'total_egresos'
+        ))
+        self.assertEqual(incremental, reconstruido)
+
+    def test_reporte(self):
+        self.completar('210', 40000, 5000, fecha='2024-03-15')
+        self.completar('210', 10000, 1000, fecha='2024-03-16')
+        self.completar('305', 20000, 0, fecha='2024-03-16')
+
+        with self.assertNumQueries(1):
+            datos = self.client.get('/api/resumenes/reporte/?agrupar=bus').json()
+        por_bus = {r['numero_bus']: r for r in datos['resultados']}
+        self.assertEqual(por_bus['210']['planillas'], 2)
+        self.assertEqual(float(por_bus['210']['balance']), 44000)
+
+        datos = self.client.get('/api/resumenes/reporte/?agrupar=ruta&fecha_desde=2024-03-16').json()
+        self.assertEqual(len(datos['resultados']), 1)
+        self.assertEqual(float(datos['resultados'][0]['total_ingresos']), 30000)
+
+        self.assertEqual(self.client.get('/api/resumenes/reporte/?agrupar=mes').status_code, 400)
+
+    def test_eliminar_planilla(self):
+        planilla = self.completar('210', 40000, 5000)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/planillas/{planilla.id}/')
+        self.assertFalse(ResumenDiario.objects.exists())
+
+    def test_editar_lineas(self):
+        planilla = self.completar('210', 40000, 5000)
+        ingreso, egreso = planilla.ingresos.get(), planilla.egresos.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/ingresos/{ingreso.id}/', {'monto': '60000'}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/egresos/{egreso.id}/')
+
+        fila = self.client.get('/api/resumenes/reporte/?agrupar=bus').json()['resultados'][0]
+        self.assertEqual(float(fila['total_ingresos']), 60000)
+        self.assertEqual(float(fila['balance']), 60000)
+
+    def test_grupo_creado_en_paralelo(self):
+        crear = ResumenDiario.objects.update_or_create
+        intentos = []
+
+        def competir(*args, **kwargs):
+            # El primer INSERT choca con la fila que otro proceso creó para el mismo grupo
+            intentos.append(kwargs['numero_bus'])
+            if len(intentos) == 1:
+                raise IntegrityError('resumen_diario_grupo_unico')
+            return crear(*args, **kwargs)
+
+        with mock.patch.object(ResumenDiario.objects, 'update_or_create', competir), \
+                self.assertLogs('api.resumenes', 'WARNING'):
+            self.completar('210', 40000, 5000)
+
+        self.assertEqual(intentos, ['210', '210'])
+        resumen = ResumenDiario.objects.get()
+        self.assertEqual((resumen.planillas, resumen.total_ingresos), (1, 40000))
+
+
+class ExportacionTests(TestCase):
+    """La exportación hace un número fijo de consultas por bloque, sin N+1"""
+
+    def setUp(self):
+        for _ in range(6):
+            crear_planilla()
+
+    def leer(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        # Planillas + una consulta por cada una de las 4 relaciones
+        with self.assertNumQueries(5):
+            contenido = self.leer('/api/planillas/export/?format=csv')
+        filas = contenido.strip().splitlines()
+        # Cabecera + 4 líneas por planilla
+        self.assertEqual(len(filas), 1 + 6 * 4)
+        self.assertTrue(filas[0].startswith('planilla_id,status'))
+
+    def test_ndjson(self):
+        with self.assertNumQueries(5):
+            contenido = self.leer('/api/planillas/export/?format=ndjson')
+        objetos = [json.loads(linea) for linea in contenido.splitlines()]
+        self.assertEqual(len(objetos), 6)
+        self.assertEqual(objetos[0]['tarifas'][0]['precio'], 1500.0)
+
+    @override_settings(EXPORTACION_CHUNK_SIZE=2)
+    def test_lectura_por_bloques(self):
+        # Un SELECT leído por bloques de 2 planillas + 4 consultas de relaciones por bloque
+        with self.assertNumQueries(1 + 3 * 4):
+            contenido = self.leer('/api/planillas/export/?format=ndjson')
+        self.assertEqual(len(contenido.splitlines()), 6)
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get('/api/planillas/export/?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/planillas/export/?from=ayer').status_code, 400)
+
+
+class MiniaturaTests(TestCase):
+    """Miniaturas generadas al primer pedido y servidas con ETag"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, PREPROCESAMIENTO_ACTIVO=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        contenido = io.BytesIO()
+        Image.new('RGB', (1600, 1200), 'white').save(contenido, 'JPEG')
+        self.planilla = Planilla(hash_contenido='ab' * 32)
+        self.planilla.imagen.save('planilla.jpg', ContentFile(contenido.getvalue()), save=True)
+
+    def test_listado_incluye_miniaturas(self):
+        resultado = self.client.get('/api/planillas/').json()['results'][0]
+        self.assertEqual(set(resultado['miniaturas']), {'160', '480'})
+
+    def test_miniatura_y_etag(self):
+        url = f'/api/planillas/{self.planilla.id}/miniatura/160/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as miniatura:
+            self.assertEqual(max(miniatura.size), 160)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_tamano_no_permitido(self):
+        response = self.client.get(f'/api/planillas/{self.planilla.id}/miniatura/999/')
+        self.assertEqual(response.status_code, 404)
+
+
+class AlmacenamientoTests(TestCase):
+    """Imágenes guardadas por contenido y archivadas en bundles zip"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, PREPROCESAMIENTO_ACTIVO=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        contenido = io.BytesIO()
+        Image.new('RGB', (800, 600), 'white').save(contenido, 'JPEG')
+        self.contenido = contenido.getvalue()
+
+    def subir(self, nombre):
+        archivo = ContentFile(self.contenido, name=nombre)
+        response = self.client.post('/api/planillas/', {'imagen': archivo}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Planilla.objects.get(pk=response.json()['id'])
+
+    def test_subidas_identicas_comparten_archivo(self):
+        primera = self.subir('a.jpg')
+        segunda = self.subir('b.jpg')
+        sha256 = hashlib.sha256(self.contenido).hexdigest()
+        self.assertEqual(primera.imagen.name, f'planillas/{sha256[:2]}/{sha256[2:4]}/{sha256}.jpg')
+        self.assertEqual(segunda.imagen.name, primera.imagen.name)
+        self.assertTrue(os.path.exists(primera.imagen.path))
+
+    def test_archivar_y_servir(self):
+        planilla = self.subir('a.jpg')
+        compartida = self.subir('b.jpg')
+        Planilla.objects.update(status='completed')
+
+        # Las planillas recientes no se archivan
+        self.assertEqual(archivar_planillas(dias=30)['imagenes'], 0)
+
+        totales = archivar_planillas(dias=0)
+        self.assertEqual(totales, {'bundles': 1, 'imagenes': 1, 'planillas': 2})
+        planilla.refresh_from_db()
+        self.assertFalse(os.path.exists(planilla.imagen.path))
+
+        response = self.client.get(f'/api/planillas/{planilla.id}/imagen/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido)
+        response = self.client.get(f'/api/planillas/{planilla.id}/miniatura/160/')
+        self.assertEqual(response.status_code, 200)
+
+        restaurar_imagen(planilla)
+        self.assertTrue(os.path.exists(planilla.imagen.path))
+        self.assertFalse(Planilla.objects.filter(archivo_bundle__isnull=False).exists())
+        compartida.refresh_from_db()
+        self.assertIsNone(compartida.archivo_bundle)
+        self.assertEqual(os.listdir(os.path.join(self.media, 'archivo')), [])
+
+    def test_no_borra_imagen_vuelta_a_usar(self):
+        planilla = self.subir('a.jpg')
+        Planilla.objects.update(status='completed')
+        atomic = transaction.atomic
+
+        @contextlib.contextmanager
+        def marcar_y_subir():
+            with atomic():
+                yield
+            # Una subida idéntica llega entre el UPDATE y el borrado
+            Planilla.objects.create(imagen=planilla.imagen.name)
+
+        with mock.patch('api.archivo.transaction', mock.Mock(atomic=marcar_y_subir)):
+            self.assertEqual(archivar_planillas(dias=0)['planillas'], 1)
+        self.assertTrue(os.path.exists(planilla.imagen.path))
+
+
+class UploadHandlerTests(TestCase):
+    """PlanillaUploadHandler escribe por chunks al storage y corta los archivos inválidos"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(
+            MEDIA_ROOT=self.media, PREPROCESAMIENTO_ACTIVO=False, PLANILLAS_MAX_TAMANO_ARCHIVO=400_000
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def imagen(self, lado):
+        contenido = io.BytesIO()
+        Image.effect_noise((lado, lado), 40).save(contenido, 'JPEG', quality=95)
+        return contenido.getvalue()
+
+    def subir(self, contenido, nombre='a.jpg'):
+        return self.client.post('/api/planillas/', {'imagen': ContentFile(contenido, name=nombre)})
+
+    def archivos(self):
+        return [nombre for _, _, nombres in os.walk(self.media) for nombre in nombres]
+
+    def test_escribe_por_chunks_en_el_storage(self):
+        contenido = self.imagen(500)
+        self.assertGreater(len(contenido), 3 * uploads.PlanillaUploadHandler.chunk_size)
+        recibir = uploads.PlanillaUploadHandler.receive_data_chunk
+        with mock.patch.object(
+            uploads.PlanillaUploadHandler, 'receive_data_chunk', autospec=True, side_effect=recibir
+        ) as chunks:
+            response = self.subir(contenido)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(chunks.call_count, 3)
+        tamaños = [len(llamada.args[1]) for llamada in chunks.call_args_list]
+        self.assertLessEqual(max(tamaños), uploads.PlanillaUploadHandler.chunk_size)
+        planilla = Planilla.objects.get(pk=response.json()['id'])
+        sha256 = hashlib.sha256(contenido).hexdigest()
+        self.assertEqual(planilla.imagen.name, f'planillas/{sha256[:2]}/{sha256[2:4]}/{sha256}.jpg')
+        # Sin temporales: el archivo escrito por chunks se movió a su nombre final
+        self.assertEqual(self.archivos(), [f'{sha256}.jpg'])
+
+    def test_rechaza_archivo_excedido(self):
+        with self.assertLogs('api.uploads', 'WARNING'):
+            response = self.subir(self.imagen(800))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tamaño máximo de 400000 bytes', response.json()['imagen'][0]['error'])
+        self.assertFalse(Planilla.objects.exists())
+        self.assertEqual(self.archivos(), [])
+
+    def test_rechaza_archivo_que_no_es_imagen(self):
+        with self.assertLogs('api.uploads', 'WARNING'):
+            response = self.subir(b'MZ' + b'\x00' * 5000, nombre='factura.jpg')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()['imagen'], [{'archivo': 'factura.jpg', 'error': 'El archivo no es una imagen válida'}]
+        )
+        self.assertFalse(Planilla.objects.exists())
+        self.assertEqual(self.archivos(), [])
+
+
+class SubidaReanudableTests(TestCase):
+    """Finalización de una subida reanudable pedida dos veces a la vez"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, PREPROCESAMIENTO_ACTIVO=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        contenido = io.BytesIO()
+        Image.new('RGB', (800, 600), 'white').save(contenido, 'JPEG')
+        self.contenido = contenido.getvalue()
+        self.subida = subidas.iniciar_subida('a.jpg', len(self.contenido))
+        subidas.recibir_chunk(self.subida, 0, io.BytesIO(self.contenido), len(self.contenido))
+
+    def test_finalizacion_concurrente_crea_una_planilla(self):
+        url = f'/api/subidas/{self.subida.id}/finalizar/'
+        validar = subidas.validar_imagen
+        respuestas = []
+
+        def validar_con_otra_peticion(archivo):
+            # Mientras esta petición valida el archivo llega la segunda
+            respuestas.append(self.client.post(url))
+            return validar(archivo)
+
+        with mock.patch.object(subidas, 'validar_imagen', validar_con_otra_peticion):
+            response = self.client.post(url)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(respuestas[0].status_code, 409)
+        self.assertEqual(Planilla.objects.count(), 1)
+        # Ya finalizada, repetir la petición retorna la misma planilla
+        self.assertEqual(self.client.post(url).json()['id'], response.json()['id'])
+
+    def test_validacion_fallida_vuelve_a_active(self):
+        with mock.patch.object(subidas, 'validar_imagen', side_effect=ValueError('Imagen demasiado pequeña')):
+            response = self.client.post(f'/api/subidas/{self.subida.id}/finalizar/')
+        self.assertEqual(response.status_code, 400)
+        self.subida.refresh_from_db()
+        self.assertEqual(self.subida.estado, 'active')
+        self.assertEqual(subidas.finalizar_subida(self.subida).nombre_archivo, 'a.jpg')
+
+    def test_chunk_tras_finalizar(self):
+        # La petición del chunk leyó la subida antes de que otra la finalizara
+        leida = SubidaReanudable.objects.get(pk=self.subida.pk)
+        subidas.finalizar_subida(self.subida)
+        with self.assertRaises(subidas.ErrorSubida):
+            subidas.recibir_chunk(leida, 0, io.BytesIO(self.contenido), len(self.contenido))
+
+    def test_error_al_crear_planilla_restaura_el_parcial(self):
+        with mock.patch.object(Planilla.objects, 'create', side_effect=IntegrityError('sin conexión')):
+            with self.assertRaises(IntegrityError):
+                subidas.finalizar_subida(self.subida)
+        self.assertEqual(self.subida.estado, 'active')
+        self.assertTrue(os.path.exists(subidas.ruta_parcial(self.subida)))
+
+        planilla = subidas.finalizar_subida(self.subida)
+        with planilla.imagen.open('rb') as imagen:
+            self.assertEqual(imagen.read(), self.contenido)
+
+
+class MediosTests(TestCase):
+    """Imágenes servidas con Range, condicionales y delegación al proxy"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, PREPROCESAMIENTO_ACTIVO=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        contenido = io.BytesIO()
+        Image.new('RGB', (400, 300), 'white').save(contenido, 'JPEG')
+        self.contenido = contenido.getvalue()
+        self.planilla = Planilla()
+        self.planilla.imagen.save('planilla.jpg', ContentFile(self.contenido), save=True)
+        self.url = f'/api/planillas/{self.planilla.id}/imagen/'
+
+    def test_completa_y_condicional(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.contenido)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_rangos(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.contenido)}')
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.contenido)}-')
+        self.assertEqual(response.status_code, 416)
+
+        # If-Range con otra versión: archivo completo
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"otra"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_rango_de_imagen_archivada(self):
+        Planilla.objects.update(status='completed')
+        archivar_planillas(dias=0)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[100:200])
+
+    def test_delegacion_al_proxy(self):
+        with self.settings(MEDIA_SERVIDOR_PROXY='x-accel-redirect', MEDIA_PREFIJO_INTERNO='/interno/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/interno/{self.planilla.imagen.name}')
+        self.assertEqual(response.content, b'')
+
+        with self.settings(MEDIA_SERVIDOR_PROXY='x-sendfile'):
+            response = self.client.get(f'/media/{self.planilla.imagen.name}')
+        self.assertEqual(response['X-Sendfile'], self.planilla.imagen.path)
+
+    def test_media_solo_sirve_imagenes_de_planillas(self):
+        response = self.client.get('/media/planillas/no-existe.jpg')
+        self.assertEqual(response.status_code, 404)
+
+
+class CargaMasivaZipTests(TestCase):
+    """Carga masiva de varias imágenes y límites aplicados a cada miembro de un zip"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(
+            MEDIA_ROOT=self.media, PREPROCESAMIENTO_ACTIVO=False,
+            PLANILLAS_MAX_TAMANO_ARCHIVO=20_000, PLANILLAS_MAX_PIXELES=1_000_000
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def imagen(self, lado, formato='PNG', ruido=False):
+        imagen = Image.effect_noise((lado, lado), 40) if ruido else Image.new('L', (lado, lado), 'white')
+        contenido = io.BytesIO()
+        imagen.save(contenido, formato)
+        return contenido.getvalue()
+
+    def test_varias_imagenes(self):
+        contenidos = {'a.png': self.imagen(200), 'b.jpg': self.imagen(300, 'JPEG'), 'c.png': self.imagen(200)}
+        response = self.client.post(
+            '/api/planillas/bulk/',
+            {'imagenes': [ContentFile(contenido, name=nombre) for nombre, contenido in contenidos.items()]}
+        )
+
+        self.assertEqual(response.status_code, 201)
+        datos = response.json()
+        self.assertEqual((datos['creadas'], datos['errores']), (3, 0))
+        self.assertEqual([r['archivo'] for r in datos['resultados']], list(contenidos))
+        for resultado in datos['resultados']:
+            self.assertEqual(set(resultado), {'archivo', 'id'})
+            planilla = Planilla.objects.get(pk=resultado['id'])
+            contenido = contenidos[resultado['archivo']]
+            self.assertEqual(
+                (planilla.nombre_archivo, planilla.status, planilla.tamaño_archivo),
+                (resultado['archivo'], 'pending', len(contenido))
+            )
+            self.assertEqual(planilla.hash_contenido, hashlib.sha256(contenido).hexdigest())
+            with planilla.imagen.open('rb') as imagen:
+                self.assertEqual(imagen.read(), contenido)
+        # a.png y c.png tienen el mismo contenido: comparten el archivo
+        nombres = dict(Planilla.objects.values_list('nombre_archivo', 'imagen'))
+        self.assertEqual(nombres['a.png'], nombres['c.png'])
+
+    def test_miembros_fuera_de_limite(self):
+        comprimido = io.BytesIO()
+        with zipfile.ZipFile(comprimido, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('valida.png', self.imagen(300))
+            zf.writestr('pesada.png', self.imagen(300, ruido=True))
+            # Pocos bytes, pero 1200x1200 píxeles
+            zf.writestr('enorme.png', self.imagen(1200))
+            zf.writestr('falsa.jpg', b'MZ' + b'\x00' * 500)
+        response = self.client.post(
+            '/api/planillas/bulk/', {'imagenes': ContentFile(comprimido.getvalue(), name='dia.zip')}
+        )
+
+        self.assertEqual(response.status_code, 201)
+        errores = {r['archivo']: r.get('error') for r in response.json()['resultados']}
+        self.assertIsNone(errores['valida.png'])
+        self.assertIn('tamaño máximo', errores['pesada.png'])
+        self.assertIn('demasiado grande', errores['enorme.png'])
+        self.assertIn('no es una imagen', errores['falsa.jpg'])
+        self.assertEqual(Planilla.objects.count(), 1)
+
+    def test_miembro_con_tamano_declarado_falso(self):
+        # El tamaño del zip no se respeta: la lectura se corta igual en el límite
+        miembro = uploads.MiembroZip(io.BytesIO(b'x' * 50), 'a.png', limite=20)
+        self.assertEqual(miembro.read(20), b'x' * 20)
+        with self.assertRaisesMessage(ValueError, 'tamaño máximo de 20 bytes'):
+            miembro.read(10)
+        miembro.seek(0)
+        with self.assertRaises(ValueError):
+            list(miembro.chunks(8))
+
+
+class NormalizacionTests(SimpleTestCase):
+    """Mapa de campos del modelo rendibus con errores por campo"""
+
+    def test_forma_rest(self):
+        datos, errores = normalizar_documento({
+            'Tarifa 1': {'type': 'string', 'valueString': '$ 1.500'},
+            'Total Ingreso Ruta': {'type': 'string', 'valueString': '45.000'},
+            'Cena': {'type': 'number', 'valueNumber': 3000},
+            'Ticket Inicial T1': {'type': 'string', 'valueString': '000.100'},
+            'Ticket Final T1': {'type': 'string', 'valueString': '150'},
+            'Fecha': {'type': 'date', 'valueDate': '2024-01-15'},
+            'Patente Bus': {'type': 'string', 'valueString': 'ab-cd 12'},
+            'Horario Horigen': {'type': 'string', 'valueString': '8.30'},
+        })
+        self.assertEqual(errores, {})
+        self.assertEqual(datos['tarifas'][0]['precio'], 1500.0)
+        self.assertEqual(datos['ingresos'][0]['monto'], 45000.0)
+        self.assertEqual(datos['egresos'][0]['monto'], 3000.0)
+        self.assertEqual(datos['control_boletos'][0]['cantidad_vendidos'], 51)
+        self.assertEqual(datos['info_general']['fecha'], '2024-01-15')
+        self.assertEqual(datos['info_general']['patente_bus'], 'ABCD12')
+        self.assertEqual(datos['info_general']['horario_origen'], '08:30')
+
+    def test_forma_to_dict_y_errores_por_campo(self):
+        datos, errores = normalizar_documento({
+            'Tarifa 1': {'value_type': 'string', 'value': '1,500', 'content': '1,500'},
+            'Tarifa 2': {'value_type': 'string', 'value': 'l.5OO', 'content': 'l.5OO'},
+            'Fecha': {'value_type': 'date', 'value': date(2024, 1, 15)},
+            'Ticket Inicial T1': {'value_type': 'string', 'value': '1O0'},
+            'Ticket Final T1': {'value_type': 'string', 'value': '150'},
+        })
+        self.assertEqual([t['precio'] for t in datos['tarifas']], [1500.0])
+        self.assertEqual(set(errores), {'Tarifa 2', 'Ticket Inicial T1'})
+        self.assertEqual(datos['control_boletos'], [])
+        self.assertEqual(datos['info_general']['fecha'], '2024-01-15')
+
+    def test_lote(self):
+        lote = [{'Tarifa 1': {'valueString': precio}} for precio in ('1.000', '2.000', '1.000', 'x')]
+        resultados = normalizar_lote(lote)
+        self.assertEqual(
+            [datos['tarifas'][0]['precio'] if datos['tarifas'] else None for datos, _ in resultados],
+            [1000.0, 2000.0, 1000.0, None]
+        )
+        self.assertIn('Tarifa 1', resultados[3][1])
+
+
+def resultado_azure(precio):
+    """AnalyzeResult.to_dict() mínimo del modelo rendibus"""
+    return {
+        'model_id': 'rendibus.v1',
+        'content': 'PLANILLA',
+        'documents': [{
+            'doc_type': 'rendibus.v1',
+            'fields': {
+                'Tarifa 1': {'value_type': 'string', 'value': precio, 'content': precio},
+                'Total Ingreso Ruta': {'value_type': 'string', 'value': '45.000', 'content': '45.000'},
+                'Número Bus': {'value_type': 'string', 'value': '12', 'content': '12'},
+            },
+        }],
+    }
+
+
+class ResultadoCrudoTests(TestCase):
+    """Resultado completo comprimido y re-extracción sin llamar a Azure"""
+
+    def test_guardar_resultado_comprime_y_quita_la_clave(self):
+        planilla = Planilla.objects.create(imagen='planillas/a.jpg', hash_contenido='cd' * 32)
+        datos = {**DATOS_EXTRAIDOS, CLAVE_RESULTADO_CRUDO: resultado_azure('1.500')}
+        guardar_resultado(planilla, datos)
+
+        planilla.refresh_from_db()
+        self.assertNotIn(CLAVE_RESULTADO_CRUDO, planilla.datos_extraidos)
+        crudo = ResultadoCrudo.objects.get(planilla=planilla)
+        self.assertEqual(crudo.model_id, 'rendibus.v1')
+        self.assertEqual(descomprimir(crudo.contenido), resultado_azure('1.500'))
+
+        # Otra planilla con la misma imagen completada desde la cache copia el resultado
+        copia = Planilla.objects.create(imagen='planillas/a.jpg', hash_contenido='cd' * 32)
+        guardar_resultado(copia, dict(DATOS_EXTRAIDOS))
+        self.assertTrue(ResultadoCrudo.objects.filter(planilla=copia).exists())
+
+    def test_reextraer(self):
+        planilla = crear_planilla(numero_bus='99', hash_contenido='ab' * 32)
+        guardar_resultado_crudo(planilla, resultado_azure('2.500'))
+        for model_id in ('rendibus.v1', 'rendibus.v0'):
+            ResultadoAnalisisCache.objects.create(
+                hash_contenido='ab' * 32, model_id=model_id, datos_extraidos=DATOS_EXTRAIDOS
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            totales = reextraer(procesos=0, lote=10)
+        self.assertEqual((totales['planillas'], totales['errores']), (1, 0))
+
+        planilla.refresh_from_db()
+        self.assertEqual(planilla.datos_extraidos['tarifas'][0]['precio'], 2500.0)
+        self.assertEqual(planilla.numero_bus, '12')
+        self.assertEqual(list(planilla.tarifas.values_list('precio', flat=True)), [Decimal('2500.00')])
+        self.assertTrue(ResumenDiario.objects.filter(numero_bus='12').exists())
+        self.assertFalse(ResumenDiario.objects.filter(numero_bus='99').exists())
+        # La cache de la imagen queda con los datos re-extraídos; la de otro modelo se descarta
+        entrada = ResultadoAnalisisCache.objects.get(hash_contenido='ab' * 32)
+        self.assertEqual((entrada.model_id, entrada.datos_extraidos), ('rendibus.v1', planilla.datos_extraidos))
+
+    def test_reextraer_con_pool(self):
+        planillas = [crear_planilla(numero_bus='99') for _ in range(3)]
+        for planilla in planillas:
+            guardar_resultado_crudo(planilla, resultado_azure('2.500'))
+
+        # Un proceso hijo creado con spawn y lotes de una planilla: varios lotes en vuelo
+        with self.captureOnCommitCallbacks(execute=True):
+            totales = reextraer(procesos=1, lote=1)
+        self.assertEqual((totales['planillas'], totales['errores'], totales['total']), (3, 0, 3))
+        self.assertEqual(
+            list(Planilla.objects.order_by('id').values_list('numero_bus', flat=True)), ['12', '12', '12']
+        )
+        self.assertEqual(set(Tarifa.objects.values_list('precio', flat=True)), {Decimal('2500.00')})
+
+    def test_datos_extraidos_compactos(self):
+        resultado = AnalyzeResult.from_dict(resultado_azure('1.500'))
+        datos = azure_service._extract_data_from_result(resultado)  # pylint: disable=protected-access
+        self.assertEqual(
+            set(datos), {'tarifas', 'ingresos', 'egresos', 'control_boletos', 'info_general', 'paginas'}
+        )
+
+        planilla = crear_planilla()
+        guardar_resultado_crudo(planilla, resultado_azure('1.500'))
+        response = self.client.get(f'/api/planillas/{planilla.id}/resultado_crudo/')
+        self.assertEqual(response.json()['content'], 'PLANILLA')
+
+    def test_compactar_formato_anterior(self):
+        anterior = {
+            **DATOS_EXTRAIDOS,
+            'texto_completo': 'PLANILLA',
+            'tablas': [{'row_count': 1, 'column_count': 1, 'cells': []}],
+            'campos_detectados': {},
+            'raw_result': {'pages': 1, 'documents': resultado_azure('1.500')['documents']},
+        }
+        planilla = Planilla.objects.create(imagen='planillas/a.jpg', status='completed', datos_extraidos=anterior)
+
+        totales = compactar_planillas()
+        self.assertEqual((totales['planillas'], totales['resultados']), (1, 1))
+        planilla.refresh_from_db()
+        self.assertEqual(set(planilla.datos_extraidos), set(DATOS_EXTRAIDOS) | {'paginas'})
+        self.assertEqual(descomprimir(planilla.resultado_crudo.contenido)['content'], 'PLANILLA')
+
+
+class CacheResultadosTests(TestCase):
+    """Aciertos y fallos de la cache contados en la base de datos"""
+
+    def test_estadisticas_suman_todos_los_procesos(self):
+        hash_contenido = 'aa' * 32
+        self.assertIsNone(resultado_cache.obtener(hash_contenido, 'rendibus.v1'))
+        resultado_cache.guardar(hash_contenido, 'rendibus.v1', dict(DATOS_EXTRAIDOS))
+        # Otra instancia hace de otro proceso (por ejemplo un worker de la cola)
+        otro_proceso = CacheResultados()
+        for _ in range(3):
+            self.assertEqual(otro_proceso.obtener(hash_contenido, 'rendibus.v1'), DATOS_EXTRAIDOS)
+
+        estadisticas = self.client.get('/api/planillas/estadisticas_cache/').json()
+        self.assertEqual(
+            {clave: estadisticas[clave] for clave in ('hits', 'misses', 'hit_ratio', 'entradas')},
+            {'hits': 3, 'misses': 1, 'hit_ratio': 0.75, 'entradas': 1}
+        )
+        self.assertEqual(ResultadoAnalisisCache.objects.get().hits, 3)
+
+    def estadisticas(self):
+        estadisticas = resultado_cache.estadisticas()
+        return estadisticas['hits'], estadisticas['misses']
+
+    def test_acierto_y_fallo_desde_procesar_con_azure(self):
+        resultado_cache.guardar('aa' * 32, azure_service.model_id, dict(DATOS_EXTRAIDOS))
+        repetida = Planilla.objects.create(imagen='planillas/a.jpg', hash_contenido='aa' * 32)
+        nueva = Planilla.objects.create(imagen='planillas/b.jpg', hash_contenido='bb' * 32)
+
+        response = self.client.post(f'/api/planillas/{repetida.id}/procesar_con_azure/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['message'], 'Planilla procesada desde cache')
+        repetida.refresh_from_db()
+        self.assertEqual(repetida.status, 'completed')
+        self.assertFalse(ProcesamientoJob.objects.filter(planilla=repetida).exists())
+
+        # El fallo de la API no se cuenta: el worker vuelve a consultar la cache
+        with mock.patch.object(views.azure_service, 'is_configured', return_value=True):
+            response = self.client.post(f'/api/planillas/{nueva.id}/procesar_con_azure/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.estadisticas(), (1, 0))
+
+    def test_expulsion_por_antiguedad(self):
+        ajustes = override_settings(CACHE_RESULTADOS_MAX_DIAS=30)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        for hash_contenido in ('aa' * 32, 'bb' * 32):
+            resultado_cache.guardar(hash_contenido, 'rendibus.v1', dict(DATOS_EXTRAIDOS))
+        ResultadoAnalisisCache.objects.filter(hash_contenido='aa' * 32).update(
+            fecha_creacion=timezone.now() - timedelta(days=31)
+        )
+
+        self.assertIsNone(resultado_cache.obtener('aa' * 32, 'rendibus.v1'))
+        self.assertEqual(resultado_cache.purgar(), 1)
+        self.assertEqual(
+            list(ResultadoAnalisisCache.objects.values_list('hash_contenido', flat=True)), ['bb' * 32]
+        )
+        self.assertEqual(resultado_cache.obtener('bb' * 32, 'rendibus.v1'), DATOS_EXTRAIDOS)
+
+
+class FakeAzureTests(SimpleTestCase):
+    """El servidor falso de los benchmarks produce documentos que se normalizan sin errores"""
+
+    def test_analisis_contra_servidor_falso(self):
+        servidor, endpoint = iniciar_servidor(latencia=0, semilla=1)
+        self.addCleanup(servidor.shutdown)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as imagen:
+            imagen.write(b'\xff\xd8\xff' + b'0' * 100)
+            imagen.flush()
+            servicio = AzureFormRecognizerService(endpoint=endpoint, key='clave', model_id='rendibus.v1')
+            datos = servicio.analyze_document(imagen.name)
+
+        self.assertNotIn('errores_campos', datos)
+        self.assertEqual(len(datos['tarifas']), 6)
+        self.assertEqual(len(datos['control_boletos']), 6)
+        self.assertRegex(datos['info_general']['patente_bus'], r'^[A-Z]{4}\d{2}$')
+        self.assertEqual(servidor.contadores['analisis'], 1)
+
+
+class MetricasTests(TestCase):
+    """Endpoint /metrics y registro de métricas por petición"""
+
+    def test_metricas_de_peticiones_y_cola(self):
+        crear_planilla()
+        ProcesamientoJob.objects.create(planilla=Planilla.objects.create(imagen='planillas/a.jpg'))
+        antes = metricas.HTTP_SEGUNDOS.total('GET', 'planilla-list', '200')
+
+        self.assertEqual(self.client.get('/api/planillas/').status_code, 200)
+        self.assertEqual(metricas.HTTP_SEGUNDOS.total('GET', 'planilla-list', '200'), antes + 1)
+        self.assertGreaterEqual(metricas.HTTP_CONSULTAS.total('planilla-list'), 1)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metricas.CONTENT_TYPE)
+        texto = response.content.decode()
+        self.assertIn('# TYPE planilla_http_peticion_segundos histogram', texto)
+        self.assertIn(
+            'planilla_http_peticion_segundos_bucket{metodo="GET",vista="planilla-list",estado="200",le="+Inf"}',
+            texto
+        )
+        self.assertIn('planilla_cola_trabajos{estado="queued"} 1', texto)
+        self.assertIn('planilla_planillas{estado="completed"} 1', texto)
+
+    def test_transiciones_de_estado(self):
+        planilla = Planilla.objects.create(imagen='planillas/a.jpg')
+        antes = metricas.TRANSICIONES.valor('pending', 'completed')
+        guardar_resultado(planilla, dict(DATOS_EXTRAIDOS))
+        self.assertEqual(metricas.TRANSICIONES.valor('pending', 'completed'), antes + 1)
+
+
+class PollingTests(TestCase):
+    """Polling adaptativo y plazo máximo de los análisis contra el Azure falso"""
+
+    def setUp(self):
+        ajustes = override_settings(
+            AZURE_POLLING_INTERVALO_INICIAL=0.02, AZURE_POLLING_INTERVALO_MAXIMO=0.5,
+            AZURE_ANALISIS_PLAZO=5, PREPROCESAMIENTO_ACTIVO=False
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        valor = polling.estimador_analisis.valor
+        polling.estimador_analisis.valor = None
+        self.addCleanup(setattr, polling.estimador_analisis, 'valor', valor)
+
+        self.servidor, endpoint = iniciar_servidor(latencia=0.3, intervalo_polling=1, semilla=1)
+        self.addCleanup(self.servidor.shutdown)
+        self.servicio = AzureFormRecognizerService(endpoint=endpoint, key='clave', model_id='rendibus.v1')
+        imagen = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
+        imagen.write(b'\xff\xd8\xff' + b'0' * 100)
+        imagen.close()
+        self.addCleanup(os.unlink, imagen.name)
+        self.imagen = imagen.name
+
+    def test_la_espera_se_adapta_a_la_duracion(self):
+        self.servicio.analyze_document(self.imagen)
+        self.assertAlmostEqual(polling.estimador_analisis.valor, 0.3, delta=0.15)
+
+        # Con la duración conocida: una consulta inmediata y otra cuando debería estar listo
+        consultas = self.servidor.contadores['polling']
+        self.servicio.analyze_document(self.imagen)
+        self.assertLessEqual(self.servidor.contadores['polling'] - consultas, 3)
+
+    def test_plazo_agotado_marca_la_planilla_con_error(self):
+        self.servidor.latencia = 5
+        media = os.path.dirname(self.imagen)
+        planilla = Planilla.objects.create(imagen=os.path.basename(self.imagen))
+
+        with override_settings(AZURE_ANALISIS_PLAZO=0.2, MEDIA_ROOT=media), \
+                mock.patch.object(jobs, 'azure_service', self.servicio):
+            with self.assertRaises(polling.PlazoAnalisisAgotado):
+                jobs.procesar_planilla(planilla)
+
+        planilla.refresh_from_db()
+        self.assertEqual(planilla.status, 'error')
+        self.assertIn('no terminó', planilla.error_procesamiento)
+
+
+class ProcesamientoAsyncTests(TestCase):
+    """Vista ASGI de procesamiento: reclamo de la planilla y cliente aio por event loop"""
+
+    def setUp(self):
+        servicio = mock.Mock(model_id='rendibus.v1')
+        servicio.analyze_document = mock.AsyncMock(return_value=dict(DATOS_EXTRAIDOS))
+        for modulo in (jobs, views):
+            parche = mock.patch.object(modulo, 'azure_service_async', servicio)
+            parche.start()
+            self.addCleanup(parche.stop)
+        for nombre in ('restaurar_imagen', 'preprocesar_planilla'):
+            parche = mock.patch.object(jobs, nombre)
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.servicio = servicio
+
+    def procesar(self, planilla):
+        return self.client.post(f'/api/planillas/{planilla.id}/procesar_con_azure_async/')
+
+    def test_procesa_la_planilla(self):
+        planilla = Planilla.objects.create(imagen='planillas/a.jpg')
+        response = self.procesar(planilla)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'completed')
+        planilla.refresh_from_db()
+        self.assertEqual(planilla.status, 'completed')
+        self.assertEqual(planilla.tarifas.count(), 1)
+        self.assertEqual(self.procesar(planilla).status_code, 400)
+        self.servicio.analyze_document.assert_awaited_once()
+
+    def test_rechaza_planilla_encolada_o_reclamada(self):
+        encolada = Planilla.objects.create(imagen='planillas/a.jpg')
+        jobs.encolar_planilla(encolada)
+        self.assertEqual(self.procesar(encolada).status_code, 409)
+        encolada.refresh_from_db()
+        self.assertEqual(encolada.status, 'pending')
+
+        # Otra petición la reclama entre la lectura de la vista y el UPDATE
+        reclamada = Planilla.objects.create(imagen='planillas/b.jpg')
+        reclamar = jobs.reclamar_planilla
+
+        def reclamo_concurrente(planilla):
+            reclamar(Planilla.objects.get(pk=planilla.pk))
+            return reclamar(planilla)
+
+        with mock.patch.object(views, 'reclamar_planilla', reclamo_concurrente):
+            self.assertEqual(self.procesar(reclamada).status_code, 409)
+        self.servicio.analyze_document.assert_not_awaited()
+
+    def test_cierra_el_cliente_del_loop_anterior(self):
+        servicio = AsyncAzureFormRecognizerService(
+            endpoint='https://azure.invalid/', key='clave', model_id='rendibus.v1'
+        )
+
+        async def cliente():
+            return await servicio._get_client(), servicio._session  # pylint: disable=protected-access
+
+        primero, sesion = asyncio.run(cliente())
+        segundo, _ = asyncio.run(cliente())
+        self.addCleanup(asyncio.run, servicio.close())
+
+        self.assertIsNot(primero, segundo)
+        self.assertTrue(sesion.closed)
+
+
+class LimitesAzureTests(SimpleTestCase):
+    """Token bucket y semáforo en archivos compartidos, y reintentos de 429"""
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+
+    def test_cubo_compartido_espacia_los_turnos(self):
+        ruta = os.path.join(self.directorio, 'tasa.bucket')
+        # Dos instancias sobre el mismo archivo, como dos procesos
+        uno, otro = CuboTokens(ruta, tasa=10, capacidad=1), CuboTokens(ruta, tasa=10, capacidad=1)
+        esperas = [uno.reservar(), otro.reservar(), uno.reservar()]
+        self.assertEqual(esperas[0], 0)
+        self.assertAlmostEqual(esperas[1], 0.1, delta=0.02)
+        self.assertAlmostEqual(esperas[2], 0.2, delta=0.02)
+
+        otro.pausar(2)
+        self.assertGreater(uno.reservar(), 1.9)
+
+    def test_semaforo_entre_instancias(self):
+        uno, otro = SemaforoArchivos(self.directorio, 1), SemaforoArchivos(self.directorio, 1)
+        cupo = uno.intentar()
+        self.assertIsNotNone(cupo)
+        self.assertIsNone(otro.intentar())
+        uno.liberar(cupo)
+        otro.liberar(otro.intentar())
+
+    def test_limitador_reutiliza_el_semaforo(self):
+        limitador = LimitadorAzure()
+        ajustes = override_settings(AZURE_LIMITE_DIRECTORIO=self.directorio, AZURE_LIMITE_CONCURRENCIA=1)
+        # Sin fcntl el cupo es un BoundedSemaphore del proceso: debe ser el mismo en cada envío
+        with ajustes, mock.patch('api.limites.fcntl', None):
+            self.assertIs(limitador._semaforo(), limitador._semaforo())  # pylint: disable=protected-access
+            with limitador.cupo():
+                self.assertIsNone(limitador._semaforo().intentar())  # pylint: disable=protected-access
+
+    def test_reintenta_429_respetando_retry_after(self):
+        servidor, endpoint = iniciar_servidor(latencia=0, tasa_429=1.0, retry_after=0.05)
+        self.addCleanup(servidor.shutdown)
+        servicio = AzureFormRecognizerService(endpoint=endpoint, key='clave', model_id='rendibus.v1')
+        imagen = os.path.join(self.directorio, 'a.jpg')
+        with open(imagen, 'wb') as f:
+            f.write(b'\xff\xd8\xff' + b'0' * 100)
+        antes = metricas.AZURE_REINTENTOS.valor('429')
+
+        with override_settings(AZURE_LIMITE_DIRECTORIO=self.directorio, AZURE_REINTENTOS=2):
+            with self.assertRaises(HttpResponseError) as error:
+                servicio.analyze_document(imagen)
+            self.assertEqual(error.exception.status_code, 429)
+            self.assertEqual(servidor.contadores['429'], 3)
+            self.assertEqual(metricas.AZURE_REINTENTOS.valor('429'), antes + 2)
+
+            servidor.tasa_429 = 0
+            self.assertIn('tarifas', servicio.analyze_document(imagen))
+
+
+class LotesTests(TestCase):
+    """Un TIFF de varias páginas se analiza con una llamada y se divide en planillas"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, AZURE_LIMITE_DIRECTORIO=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.servidor, endpoint = iniciar_servidor(latencia=0, semilla=1)
+        self.addCleanup(self.servidor.shutdown)
+        servicio = AzureFormRecognizerService(endpoint=endpoint, key='clave', model_id='rendibus.v1')
+        for modulo in (jobs, views):
+            parche = mock.patch.object(modulo, 'azure_service', servicio)
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def subir(self, contenido, nombre):
+        return self.client.post('/api/lotes/', {'archivo': ContentFile(contenido, name=nombre)})
+
+    def test_lote_tiff_crea_una_planilla_por_pagina(self):
+        # Dos páginas carta a 100 DPI; la región de cada planilla deja fuera el borde
+        paginas = [Image.new('L', (850, 1100), 'white') for _ in range(2)]
+        contenido = io.BytesIO()
+        paginas[0].save(contenido, 'TIFF', save_all=True, append_images=paginas[1:])
+
+        response = self.subir(contenido.getvalue(), 'dia.tif')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['paginas'], 2)
+        self.assertTrue(jobs.ejecutar_job(jobs.reclamar_job('test')))
+
+        lote = LotePlanillas.objects.get(pk=response.json()['lote_id'])
+        self.assertEqual(lote.status, 'completed')
+        planillas = list(lote.planillas.order_by('pagina'))
+        self.assertEqual([p.pagina for p in planillas], [1, 2])
+        self.assertEqual(self.servidor.contadores['analisis'], 1)
+        for planilla in planillas:
+            self.assertEqual(planilla.status, 'completed')
+            self.assertEqual(len(planilla.datos_extraidos['tarifas']), 6)
+            self.assertEqual(planilla.datos_extraidos['paginas'], 1)
+            with Image.open(planilla.imagen.path) as recorte:
+                self.assertLess(recorte.size[0], 850)
+                self.assertLess(recorte.size[1], 1100)
+            crudo = descomprimir(planilla.resultado_crudo.contenido)
+            self.assertEqual(crudo['pages'][0]['page_number'], planilla.pagina)
+        self.assertNotEqual(planillas[0].numero_planilla, planillas[1].numero_planilla)
+        self.assertEqual(self.client.get(f'/api/lotes/{lote.id}/').json()['planillas'], [p.id for p in planillas])
+
+    def test_rechaza_pdf_sin_pypdfium2_y_otros_formatos(self):
+        with mock.patch.dict('sys.modules', {'pypdfium2': None}):
+            self.assertEqual(self.subir(b'%PDF-1.7\n', 'dia.pdf').status_code, 503)
+        self.assertEqual(self.subir(b'\xff\xd8\xff' + b'0' * 100, 'dia.jpg').status_code, 400)
+        self.assertFalse(LotePlanillas.objects.exists())
+
+
+class PreprocesamientoTests(TransactionTestCase):
+    """El pre-procesamiento de la subida y el del worker no corren a la vez sobre la misma imagen"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, PREPROCESAMIENTO_ACTIVO=True, PREPROCESAMIENTO_ESPERA=60)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_worker_espera_el_preprocesamiento_de_la_subida(self):
+        imagen = Image.effect_noise((2400, 1800), 40).convert('RGB')
+        contenido = io.BytesIO()
+        imagen.save(contenido, 'JPEG', quality=95)
+        envios = mock.patch.object(imagenes, 'enviar_preprocesamiento', wraps=imagenes.enviar_preprocesamiento)
+        with envios as enviar:
+            response = self.client.post('/api/planillas/', {'imagen': ContentFile(contenido.getvalue(), name='a.jpg')})
+            self.assertEqual(response.status_code, 201)
+            planilla = Planilla.objects.get(pk=response.json()['id'])
+            # Justo después de la subida, con su pre-procesamiento en curso
+            imagenes.preprocesar_planilla(planilla)
+
+        self.assertEqual(enviar.call_count, 1)
+        self.assertEqual(planilla.tamaño_original, len(contenido.getvalue()))
+        self.assertLess(planilla.tamaño_procesado, planilla.tamaño_original)
+        self.assertTrue(os.path.exists(planilla.imagen.path))
+        temporales = [n for _, _, nombres in os.walk(self.media) for n in nombres if n.endswith(('.tmp', '.part'))]
+        self.assertEqual(temporales, [])
+
+    def test_imagen_procesada_con_su_propio_hash(self):
+        imagen = Image.effect_noise((2400, 1800), 40).convert('RGB')
+        contenido = io.BytesIO()
+        imagen.save(contenido, 'JPEG', quality=95)
+        contenido = contenido.getvalue()
+        sha256 = hashlib.sha256(contenido).hexdigest()
+
+        def subir(nombre):
+            response = self.client.post('/api/planillas/', {'imagen': ContentFile(contenido, name=nombre)})
+            planilla = Planilla.objects.get(pk=response.json()['id'])
+            imagenes.preprocesar_planilla(planilla)
+            return planilla
+
+        envios = mock.patch.object(imagenes, 'enviar_preprocesamiento', wraps=imagenes.enviar_preprocesamiento)
+        with envios as enviar:
+            primera = subir('a.jpg')
+            segunda = subir('b.jpg')
+
+        # El nombre sigue siendo el hash del contenido y el original ya no se usa
+        with open(primera.imagen.path, 'rb') as f:
+            procesado = hashlib.sha256(f.read()).hexdigest()
+        self.assertIn(procesado, primera.imagen.name)
+        self.assertFalse(os.path.exists(os.path.join(self.media, f'planillas/{sha256[:2]}/{sha256[2:4]}/{sha256}.jpg')))
+        # La re-subida idéntica registra el tamaño real y reutiliza la imagen procesada
+        self.assertEqual(enviar.call_count, 1)
+        self.assertEqual(segunda.imagen.name, primera.imagen.name)
+        self.assertEqual(segunda.tamaño_original, len(contenido))
+        self.assertEqual(segunda.tamaño_procesado, primera.tamaño_procesado)
+
+    def test_reclamo_liberado_si_falla(self):
+        planilla = Planilla.objects.create(imagen='planillas/a.jpg')
+        os.makedirs(os.path.join(self.media, 'planillas'))
+        with open(planilla.imagen.path, 'wb') as f:
+            f.write(b'no es una imagen')
+        with self.assertRaises(Exception):
+            imagenes.preprocesar_planilla(planilla)
+        planilla.refresh_from_db()
+        self.assertIsNone(planilla.preprocesamiento_reclamado)
+        self.assertTrue(imagenes.reclamar_preprocesamiento(planilla))
+        self.assertFalse(imagenes.reclamar_preprocesamiento(planilla))
+
+    def test_reclamo_vence(self):
+        planilla = Planilla.objects.create(imagen='planillas/a.jpg')
+        self.assertTrue(imagenes.reclamar_preprocesamiento(planilla))
+        self.assertFalse(imagenes.reclamar_preprocesamiento(planilla))
+        # El reclamo no inventa un tamaño original
+        self.assertIsNone(Planilla.objects.get(pk=planilla.pk).tamaño_original)
+
+        # El proceso que lo reclamó murió sin liberarlo
+        Planilla.objects.filter(pk=planilla.pk).update(
+            preprocesamiento_reclamado=timezone.now() - timedelta(seconds=61)
+        )
+        self.assertTrue(imagenes.reclamar_preprocesamiento(planilla))
+
+
+class ColaTrabajosTests(TransactionTestCase):
+    """Encolado y reclamo concurrentes, liberación de vencidos y estado final del trabajo"""
+
+    def test_procesar_con_azure_encola_una_vez(self):
+        planilla = Planilla.objects.create(imagen='planillas/a.jpg')
+        url = f'/api/planillas/{planilla.id}/procesar_con_azure/'
+        with mock.patch.object(views.azure_service, 'is_configured', return_value=True):
+            primera = self.client.post(url)
+            segunda = self.client.post(url)
+
+        self.assertEqual(primera.status_code, 202)
+        self.assertEqual(primera.json()['estado_job'], 'queued')
+        job = ProcesamientoJob.objects.get(planilla=planilla)
+        self.assertEqual(primera.json()['job_id'], job.id)
+        # El reintento del cliente recibe el mismo trabajo
+        self.assertEqual(segunda.status_code, 202)
+        self.assertEqual(segunda.json()['job_id'], job.id)
+        self.assertEqual(ProcesamientoJob.objects.count(), 1)
+
+    def test_encolado_concurrente_crea_un_solo_trabajo(self):
+        planilla = Planilla.objects.create(imagen='planillas/a.jpg')
+        primero = QuerySet.first
+        otro = []
+
+        def first(consulta):
+            # Otro encolado crea el trabajo justo después de esta búsqueda
+            if not otro:
+                otro.append(ProcesamientoJob.objects.create(planilla=planilla))
+                return None
+            return primero(consulta)
+
+        with mock.patch.object(QuerySet, 'first', first):
+            job = jobs.encolar_planilla(planilla)
+
+        self.assertEqual(job.id, otro[0].id)
+        self.assertEqual(ProcesamientoJob.objects.filter(planilla=planilla).count(), 1)
+        ProcesamientoJob.objects.update(estado='done')
+        self.assertNotEqual(jobs.encolar_planilla(planilla).id, job.id)
+
+    def test_reclamo_concurrente_no_repite_trabajos(self):
+        primero, segundo = [
+            jobs.encolar_planilla(Planilla.objects.create(imagen=f'planillas/{i}.jpg')) for i in range(2)
+        ]
+        otro = []
+
+        def leer_candidatos(consulta):
+            # Otro worker reclama el primer candidato entre la lectura y el UPDATE
+            candidatos = [*consulta]
+            if not otro:
+                otro.append(None)
+                otro[0] = jobs.reclamar_job('b')
+            return candidatos
+
+        with mock.patch.object(jobs, 'list', leer_candidatos, create=True):
+            reclamado = jobs.reclamar_job('a')
+
+        self.assertEqual((otro[0].id, otro[0].worker), (primero.id, 'b'))
+        self.assertEqual((reclamado.id, reclamado.worker), (segundo.id, 'a'))
+        self.assertEqual(set(ProcesamientoJob.objects.values_list('intentos', flat=True)), {1})
+        self.assertIsNone(jobs.reclamar_job('c'))
+
+    def test_worker_libera_vencidos_mientras_corre(self):
+        job = jobs.encolar_planilla(Planilla.objects.create(imagen='planillas/a.jpg'))
+        ProcesamientoJob.objects.filter(pk=job.pk).update(
+            estado='running', worker='muerto', fecha_inicio=timezone.now() - timedelta(hours=1)
+        )
+        ajustes = override_settings(PROCESAMIENTO_LIBERAR_CADA=0, PROCESAMIENTO_TIMEOUT_JOB=15)
+        with ajustes, mock.patch.object(jobs, 'procesar_planilla'), self.assertLogs('api.jobs', 'WARNING'):
+            bucle = jobs._bucle_worker  # pylint: disable=protected-access
+            procesados = bucle('vivo', 0, True, threading.Event(), liberar=True)
+
+        self.assertEqual(procesados, 1)
+        job.refresh_from_db()
+        self.assertEqual((job.estado, job.worker, job.intentos), ('done', 'vivo', 1))
+
+    def test_estado_final_solo_del_worker_dueno(self):
+        job = jobs.encolar_planilla(Planilla.objects.create(imagen='planillas/a.jpg'))
+        lento = jobs.reclamar_job('lento')
+        # Se liberó por vencido y otro worker lo tomó mientras el primero seguía
+        ProcesamientoJob.objects.filter(pk=job.pk).update(fecha_inicio=timezone.now() - timedelta(hours=1))
+        jobs.liberar_jobs_vencidos(15)
+        self.assertEqual(jobs.reclamar_job('rapido').id, job.id)
+
+        with mock.patch.object(jobs, 'procesar_planilla', side_effect=RuntimeError('falló')), \
+                self.assertLogs('api.jobs', 'WARNING'):
+            self.assertFalse(jobs.ejecutar_job(lento))
+
+        job.refresh_from_db()
+        self.assertEqual((job.estado, job.worker, job.error), ('running', 'rapido', None))
+
+
+class SnapshotsTests(TestCase):
+    """Snapshots completos, incrementales con solape, vacíos y planillas borradas"""
+
+    def setUp(self):
+        self.raiz = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.raiz, ignore_errors=True)
+        ajustes = override_settings(SNAPSHOTS_ROOT=self.raiz, SNAPSHOTS_SOLAPE=300)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def leer(self, manifest, entidad, columna='id'):
+        ruta = snapshots.ruta_archivo(manifest['nombre'], entidad)
+        return sorted(pq.read_table(ruta).column(columna).to_pylist())
+
+    def actualizar(self, planilla, **delta):
+        Planilla.objects.filter(pk=planilla.pk).update(fecha_actualizacion=timezone.now() + timedelta(**delta))
+
+    def test_completo_e_incremental(self):
+        primera, segunda = crear_planilla(), crear_planilla()
+        self.actualizar(primera, hours=-2)
+        self.actualizar(segunda, hours=-1)
+        completo = snapshots.generar_snapshot()
+        self.assertEqual(completo['tipo'], 'completo')
+        self.assertEqual(self.leer(completo, 'planillas'), [primera.id, segunda.id])
+        self.assertEqual(completo['filas']['tarifas'], 2)
+
+        # La segunda se re-procesó; una tercera se confirmó tarde con una fecha anterior a la marca
+        self.actualizar(segunda, minutes=1)
+        tardia = crear_planilla()
+        self.actualizar(tardia, hours=-1, minutes=-2)
+        incremental = snapshots.generar_snapshot()
+
+        self.assertEqual(incremental['tipo'], 'incremental')
+        self.assertEqual(self.leer(incremental, 'planillas'), [segunda.id, tardia.id])
+        self.assertEqual(self.leer(incremental, 'tarifas', 'planilla_id'), [segunda.id, tardia.id])
+        self.assertGreater(incremental['hasta'], completo['hasta'])
+
+    def test_incremental_vacio_no_retrocede_la_marca(self):
+        planilla = crear_planilla()
+        self.actualizar(planilla, hours=-1)
+        anterior = snapshots.generar_snapshot()
+        # Dentro del solape: se vuelve a exportar, pero la marca no cambia
+        self.actualizar(planilla, hours=-1, minutes=-1)
+        vacio = snapshots.generar_snapshot()
+
+        self.assertEqual(vacio['hasta'], anterior['hasta'])
+        self.assertEqual(self.leer(vacio, 'planillas'), [planilla.id])
+        self.actualizar(planilla, hours=-2)
+        vacio = snapshots.generar_snapshot()
+        self.assertEqual(vacio['filas'], {entidad: 0 for entidad in vacio['filas']})
+        self.assertEqual(self.leer(vacio, 'tarifas'), [])
+        self.assertEqual(snapshots.leer_estado()['fecha_actualizacion'], anterior['hasta'])
+
+    def test_lineas_editadas_por_la_api(self):
+        planilla, otra = crear_planilla(), crear_planilla()
+        self.actualizar(planilla, hours=-2)
+        self.actualizar(otra, hours=-3)
+        snapshots.generar_snapshot()
+
+        tarifa = planilla.tarifas.get()
+        response = self.client.patch(f'/api/tarifas/{tarifa.id}/', {'precio': '1800'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.client.delete(f'/api/control-boletos/{planilla.control_boletos.get().id}/')
+
+        incremental = snapshots.generar_snapshot()
+        self.assertEqual(self.leer(incremental, 'planillas'), [planilla.id])
+        self.assertEqual(self.leer(incremental, 'tarifas', 'precio'), [Decimal('1800')])
+        self.assertEqual(self.leer(incremental, 'control_boletos'), [])
+
+    def test_planillas_borradas(self):
+        borrada, vigente = crear_planilla(), crear_planilla()
+        snapshots.generar_snapshot()
+        borrada_id = borrada.id
+        borrada.delete()
+
+        manifest = snapshots.generar_snapshot()
+        self.assertEqual(self.leer(manifest, snapshots.ELIMINADAS, 'planilla_id'), [borrada_id])
+        self.assertEqual(manifest['filas'][snapshots.ELIMINADAS], 1)
+        self.assertNotIn(borrada_id, self.leer(manifest, 'planillas'))
+        self.assertIn(vigente.id, self.leer(snapshots.generar_snapshot(completo=True), 'planillas'))
+        # Ya informada: el snapshot siguiente no la repite
+        self.assertEqual(self.leer(snapshots.generar_snapshot(), snapshots.ELIMINADAS, 'planilla_id'), [])
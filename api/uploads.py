@@ -0,0 +1,456 @@
+"""
+Utilidades para la recepción de imágenes de planillas.
+
+Incluye el upload handler que escribe los archivos directamente en el
+storage de Planilla.imagen validando y calculando el hash en una sola pasada,
+y la carga masiva (varias imágenes o un archivo zip en una sola petición
+multipart) usada por el endpoint /api/planillas/bulk/.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.db import transaction
+from PIL import Image
+
+from .imagenes import programar_preprocesamiento
+from .metricas import BYTES_SUBIDOS
+from .models import Planilla
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES_IMAGEN = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+
+# Firmas (magic bytes) de los formatos de imagen aceptados
+FIRMAS_IMAGEN = (
+    b'\xff\xd8\xff',         # JPEG
+    b'\x89PNG\r\n\x1a\n',     # PNG
+    b'II*\x00',              # TIFF little-endian
+    b'MM\x00*',              # TIFF big-endian
+    b'BM',                   # BMP
+)
+
+# Campos multipart que maneja PlanillaUploadHandler
+CAMPOS_IMAGEN = ('imagen', 'imagenes')
+
+# Bytes máximos de cabecera que se acumulan para leer las dimensiones
+MAX_BYTES_CABECERA = 256 * 1024
+
+
+class ArchivoConHash(File):
+    """
+    Envoltorio de archivo que calcula el SHA-256 mientras el storage copia
+    el contenido por chunks, sin una lectura adicional del archivo.
+    """
+
+    def __init__(self, file, name=None):
+        super().__init__(file, name or getattr(file, 'name', None))
+        self._sha256 = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        self._sha256 = hashlib.sha256()
+        for chunk in super().chunks(chunk_size):
+            self._sha256.update(chunk)
+            yield chunk
+
+    @property
+    def sha256(self) -> str:
+        """Hash hexadecimal del contenido leído"""
+        return self._sha256.hexdigest()
+
+
+def es_firma_imagen(cabecera: bytes) -> bool:
+    """Verificar los magic bytes del inicio de un archivo"""
+    if cabecera[:4] == b'RIFF' and cabecera[8:12] == b'WEBP':
+        return True
+    return cabecera.startswith(FIRMAS_IMAGEN)
+
+
+def validar_dimensiones(ancho: int, alto: int) -> None:
+    """
+    Validar las dimensiones de una imagen.
+
+    Raises:
+        ValueError: Si la imagen es demasiado pequeña o demasiado grande
+    """
+    if min(ancho, alto) < settings.PLANILLAS_MIN_LADO:
+        raise ValueError(f"Imagen demasiado pequeña: {ancho}x{alto}")
+    if ancho * alto > settings.PLANILLAS_MAX_PIXELES:
+        raise ValueError(f"Imagen demasiado grande: {ancho}x{alto}")
+
+
+class ArchivoSubido(UploadedFile):
+    """
+    Archivo ya escrito en su ubicación final de MEDIA_ROOT por
+    PlanillaUploadHandler. Lleva el nombre en el storage y el SHA-256
+    calculado durante la subida, así no hace falta copiarlo ni releerlo.
+    """
+
+    def __init__(self, ruta, nombre_almacenado, sha256, name, content_type, size, charset,
+                 content_type_extra=None, nuevo=True):
+        super().__init__(open(ruta, 'rb'), name, content_type, size, charset, content_type_extra)
+        self.ruta = ruta
+        self.nombre_almacenado = nombre_almacenado
+        self.sha256 = sha256
+        # False si el storage ya tenía el mismo contenido (storage por contenido)
+        self.nuevo = nuevo
+
+    def temporary_file_path(self):
+        """Ruta en disco; permite a Pillow y al storage usar el archivo sin copiarlo"""
+        return self.ruta
+
+    def descartar(self) -> None:
+        """
+        Eliminar el archivo almacenado (por ejemplo, si la petición no es
+        válida). Si el contenido ya existía y es compartido, se conserva.
+        """
+        self.close()
+        if self.nuevo and os.path.exists(self.ruta):
+            os.remove(self.ruta)
+
+
+class PlanillaUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler que escribe las imágenes de planillas por chunks
+    directamente en el storage de Planilla.imagen.
+
+    En la misma pasada valida los magic bytes, lee las dimensiones de la
+    cabecera, calcula el SHA-256 y corta los archivos que exceden el tamaño
+    máximo. Los archivos rechazados se omiten y el motivo queda en
+    request.errores_subida. Los zip y otros campos se vuelcan a un archivo
+    temporal como en TemporaryFileUploadHandler, nunca a memoria.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.activo = False
+        self.destino = None
+        self.ruta_temporal = None
+        self.sha256 = None
+        self.cabecera = b''
+        self.dimensiones_ok = False
+        if request is not None and not hasattr(request, 'errores_subida'):
+            request.errores_subida = []
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None,
+                 content_type_extra=None):
+        self.activo = (
+            field_name in CAMPOS_IMAGEN
+            and os.path.splitext(file_name)[1].lower() in EXTENSIONES_IMAGEN
+        )
+        if not self.activo:
+            super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+            return
+
+        # Solo se registran los datos del archivo; no se crea el temporal del padre
+        self.field_name = field_name
+        self.file_name = file_name
+        self.content_type = content_type
+        self.content_length = content_length
+        self.charset = charset
+        self.content_type_extra = content_type_extra
+
+        # Escribir en el mismo sistema de archivos del storage para terminar con un rename
+        self.ruta_temporal = storage_imagenes().ruta_temporal()
+        self.destino = open(self.ruta_temporal, 'wb')
+        # El parser de Django cierra handler.file si un archivo se omite
+        self.file = self.destino
+        self.sha256 = hashlib.sha256()
+        self.cabecera = b''
+        self.dimensiones_ok = False
+
+    def _rechazar(self, motivo: str):
+        """Descartar el archivo en curso y registrar el motivo"""
+        self.destino.close()
+        os.remove(self.ruta_temporal)
+        self.activo = False
+        self.request.errores_subida.append({'archivo': self.file_name, 'error': motivo})
+        logger.warning("Subida rechazada (%s): %s", self.file_name, motivo)
+        raise SkipFile(motivo)
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activo:
+            return super().receive_data_chunk(raw_data, start)
+
+        if start + len(raw_data) > settings.PLANILLAS_MAX_TAMANO_ARCHIVO:
+            self._rechazar(
+                f"El archivo excede el tamaño máximo de {settings.PLANILLAS_MAX_TAMANO_ARCHIVO} bytes"
+            )
+
+        if start == 0 and not es_firma_imagen(raw_data[:12]):
+            self._rechazar("El archivo no es una imagen válida")
+
+        if not self.dimensiones_ok and len(self.cabecera) < MAX_BYTES_CABECERA:
+            self.cabecera += raw_data
+            self._validar_cabecera()
+
+        self.sha256.update(raw_data)
+        self.destino.write(raw_data)
+        return None
+
+    def _validar_cabecera(self):
+        """Leer las dimensiones con lo recibido hasta ahora (Image.open solo lee la cabecera)"""
+        try:
+            with Image.open(io.BytesIO(self.cabecera)) as imagen:
+                ancho, alto = imagen.size
+        except Exception:
+            # Cabecera incompleta: se reintenta con el siguiente chunk
+            return
+
+        try:
+            validar_dimensiones(ancho, alto)
+        except ValueError as e:
+            self._rechazar(str(e))
+        self.dimensiones_ok = True
+        self.cabecera = b''
+
+    def file_complete(self, file_size):
+        BYTES_SUBIDOS.inc('multipart', cantidad=file_size)
+        if not self.activo:
+            return super().file_complete(file_size)
+
+        self.destino.close()
+        self.activo = False
+
+        if not self.dimensiones_ok:
+            # Formatos con la cabecera al final (algunos TIFF): validar sobre el archivo
+            try:
+                with Image.open(self.ruta_temporal) as imagen:
+                    validar_dimensiones(*imagen.size)
+            except Exception as e:
+                os.remove(self.ruta_temporal)
+                self.request.errores_subida.append({'archivo': self.file_name, 'error': str(e)})
+                return None
+
+        sha256 = self.sha256.hexdigest()
+        nombre_almacenado, ruta, nuevo = ubicar_archivo(self.ruta_temporal, self.file_name, sha256)
+
+        return ArchivoSubido(
+            ruta=ruta,
+            nombre_almacenado=nombre_almacenado,
+            sha256=sha256,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            nuevo=nuevo
+        )
+
+    def upload_interrupted(self):
+        if not self.activo:
+            super().upload_interrupted()
+            return
+        self.destino.close()
+        if os.path.exists(self.ruta_temporal):
+            os.remove(self.ruta_temporal)
+        self.activo = False
+
+
+def storage_imagenes():
+    """Storage configurado para Planilla.imagen"""
+    return Planilla._meta.get_field('imagen').storage
+
+
+def ubicar_archivo(ruta_temporal: str, nombre: str, sha256: str) -> Tuple[str, str, bool]:
+    """
+    Mover un archivo completo en disco a su ubicación final en el storage
+    de Planilla.imagen (un rename, sin copiar).
+
+    Returns:
+        Tupla (nombre relativo a MEDIA_ROOT, ruta absoluta, True si el archivo es nuevo)
+    """
+    campo = Planilla._meta.get_field('imagen')
+    return campo.storage.mover_archivo(
+        ruta_temporal, campo.generate_filename(None, nombre), sha256, max_length=campo.max_length
+    )
+
+
+def errores_subida(request) -> List[Dict[str, str]]:
+    """Archivos rechazados por PlanillaUploadHandler durante la petición"""
+    return list(getattr(request, 'errores_subida', []))
+
+
+def descartar_archivos_subidos(archivos) -> None:
+    """Eliminar los archivos ya almacenados de una petición que no prosperó"""
+    for archivo in archivos:
+        if isinstance(archivo, ArchivoSubido):
+            archivo.descartar()
+
+
+def es_zip(archivo) -> bool:
+    """Verificar si un archivo subido es un zip"""
+    return (
+        archivo.name.lower().endswith('.zip')
+        or getattr(archivo, 'content_type', '') in ('application/zip', 'application/x-zip-compressed')
+    )
+
+
+def validar_imagen(archivo, tamaño: Optional[int] = None) -> None:
+    """
+    Validar que el archivo sea una imagen legible por Pillow.
+
+    Las dimensiones se validan con la cabecera antes de verificar el resto
+    del archivo, así una imagen enorme se rechaza sin leerla completa.
+
+    Args:
+        archivo: Archivo a validar
+        tamaño: Tamaño declarado (por ejemplo, el de un miembro de zip)
+
+    Raises:
+        ValueError: Si el archivo no es una imagen válida o excede los límites
+    """
+    extension = os.path.splitext(archivo.name)[1].lower()
+    if extension not in EXTENSIONES_IMAGEN:
+        raise ValueError(f"Extensión no permitida: {extension or '(sin extensión)'}")
+    if tamaño is not None and tamaño > settings.PLANILLAS_MAX_TAMANO_ARCHIVO:
+        raise ValueError(f"El archivo excede el tamaño máximo de {settings.PLANILLAS_MAX_TAMANO_ARCHIVO} bytes")
+
+    try:
+        if not es_firma_imagen(archivo.read(12)):
+            raise ValueError("El archivo no es una imagen válida")
+        archivo.seek(0)
+        try:
+            imagen = Image.open(archivo)
+        except Exception as e:
+            raise ValueError(f"El archivo no es una imagen válida: {e}") from e
+        with imagen:
+            validar_dimensiones(*imagen.size)
+            try:
+                imagen.verify()
+            except Exception as e:
+                raise ValueError(f"El archivo no es una imagen válida: {e}") from e
+    finally:
+        archivo.seek(0)
+
+
+class MiembroZip(File):
+    """
+    Miembro de un zip leído como stream que no entrega más de `limite`
+    bytes: el tamaño declarado en el zip puede no coincidir con el
+    contenido comprimido.
+    """
+
+    def __init__(self, file, name, limite: int):
+        super().__init__(file, name)
+        self.limite = limite
+        self._posicion = 0
+
+    def read(self, size=-1):
+        restante = self.limite + 1 - self._posicion
+        datos = self.file.read(restante if size is None or size < 0 else min(size, restante))
+        self._posicion += len(datos)
+        if self._posicion > self.limite:
+            raise ValueError(f"El archivo excede el tamaño máximo de {self.limite} bytes")
+        return datos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        posicion = self.file.seek(offset, whence)
+        self._posicion = self.file.tell()
+        return posicion
+
+
+def iterar_archivos_bulk(archivos) -> Iterator[Tuple[str, Any, int]]:
+    """
+    Recorrer los archivos de una carga masiva.
+
+    Los zip se expanden miembro a miembro sin descomprimirlos completos en
+    memoria: cada miembro se entrega como un stream (MiembroZip) que se
+    copia por chunks al almacenamiento y no lee más de
+    PLANILLAS_MAX_TAMANO_ARCHIVO bytes. El tamaño entregado es el declarado
+    en el zip; crear_planillas_bulk lo valida antes de leer el miembro.
+
+    Yields:
+        Tuplas (nombre, archivo, tamaño en bytes)
+    """
+    for archivo in archivos:
+        if not es_zip(archivo):
+            yield archivo.name, archivo, archivo.size
+            continue
+
+        with zipfile.ZipFile(archivo) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                nombre = os.path.basename(info.filename)
+                with zf.open(info) as miembro:
+                    yield nombre, MiembroZip(miembro, nombre, settings.PLANILLAS_MAX_TAMANO_ARCHIVO), info.file_size
+
+
+def guardar_imagen(archivo, nombre: str) -> Tuple[str, str]:
+    """
+    Guardar un archivo usando el storage del campo Planilla.imagen. El
+    storage copia el contenido por chunks y el SHA-256 se calcula en la
+    misma pasada.
+
+    Returns:
+        Tupla (nombre en el storage relativo a MEDIA_ROOT, SHA-256)
+    """
+    campo = Planilla._meta.get_field('imagen')
+    destino = campo.generate_filename(None, nombre)
+    contenido = ArchivoConHash(archivo, nombre)
+    almacenado = campo.storage.save(destino, contenido, max_length=campo.max_length)
+    return almacenado, contenido.sha256
+
+
+def crear_planillas_bulk(archivos) -> List[Dict[str, Any]]:
+    """
+    Crear planillas a partir de muchos archivos con un solo bulk_create.
+
+    Los archivos inválidos no interrumpen la carga: se reportan en la lista
+    de resultados con su error.
+
+    Returns:
+        Lista de resultados por archivo, en el orden recibido
+    """
+    resultados = []
+    planillas = []
+
+    for nombre, archivo, tamaño in iterar_archivos_bulk(archivos):
+        if len(resultados) >= settings.PLANILLAS_BULK_MAX_ARCHIVOS:
+            descartar_archivos_subidos([archivo])
+            resultados.append({'archivo': nombre, 'error': 'Límite de archivos excedido'})
+            continue
+
+        try:
+            if isinstance(archivo, ArchivoSubido):
+                # Ya validado, almacenado y hasheado por PlanillaUploadHandler
+                almacenado, sha256 = archivo.nombre_almacenado, archivo.sha256
+                archivo.close()
+            else:
+                validar_imagen(archivo, tamaño)
+                almacenado, sha256 = guardar_imagen(archivo, nombre)
+        except Exception as e:
+            resultados.append({'archivo': nombre, 'error': str(e)})
+            continue
+
+        planilla = Planilla(
+            imagen=almacenado,
+            nombre_archivo=nombre,
+            tamaño_archivo=tamaño,
+            hash_contenido=sha256
+        )
+        planillas.append(planilla)
+        resultados.append({'archivo': nombre, 'planilla': planilla})
+
+    with transaction.atomic():
+        Planilla.objects.bulk_create(planillas)
+
+    for planilla in planillas:
+        programar_preprocesamiento(planilla)
+
+    for resultado in resultados:
+        planilla = resultado.pop('planilla', None)
+        if planilla is not None:
+            resultado['id'] = planilla.id
+
+    logger.info("Carga masiva: %s planillas creadas de %s archivos", len(planillas), len(resultados))
+    return resultados
@@ -2,7 +2,9 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     PlanillaViewSet, TarifaViewSet, IngresoViewSet,
-    EgresoViewSet, ControlBoletoViewSet
+    EgresoViewSet, ControlBoletoViewSet, ProcesamientoJobViewSet,
+    SubidaReanudableViewSet, ResumenDiarioViewSet, procesar_con_azure_async,
+    SnapshotViewSet, LotePlanillasViewSet, exportar_planillas
 )
 
 # Crear router para los ViewSets
@@ -12,7 +14,19 @@ router.register(r'tarifas', TarifaViewSet, basename='tarifa')
 router.register(r'ingresos', IngresoViewSet, basename='ingreso')
 router.register(r'egresos', EgresoViewSet, basename='egreso')
 router.register(r'control-boletos', ControlBoletoViewSet, basename='control-boleto')
+router.register(r'jobs', ProcesamientoJobViewSet, basename='job')
+router.register(r'subidas', SubidaReanudableViewSet, basename='subida')
+router.register(r'lotes', LotePlanillasViewSet, basename='lote')
+router.register(r'resumenes', ResumenDiarioViewSet, basename='resumen')
+router.register(r'snapshots', SnapshotViewSet, basename='snapshot')
 
 urlpatterns = [
+    # Antes del router: si no, 'export' se interpretaría como el pk de una planilla
+    path('planillas/export/', exportar_planillas, name='planilla-export'),
+    path(
+        'planillas/<int:pk>/procesar_con_azure_async/',
+        procesar_con_azure_async,
+        name='planilla-procesar-con-azure-async'
+    ),
     path('', include(router.urls)),
 ]
@@ -1,17 +1,48 @@
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.conf import settings
-import os
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+)
+from django.utils import timezone
+from django.views.decorators.http import require_GET
 import logging
-from .models import Planilla, Tarifa, Ingreso, Egreso, ControlBoleto
+import mimetypes
+from .models import (
+    Planilla, Tarifa, Ingreso, Egreso, ControlBoleto, ProcesamientoJob, SubidaReanudable,
+    ResumenDiario, ResultadoCrudo, LotePlanillas
+)
 from .serializers import (
     PlanillaListSerializer, PlanillaDetailSerializer, PlanillaCreateSerializer,
     PlanillaUpdateSerializer, TarifaSerializer, IngresoSerializer,
-    EgresoSerializer, ControlBoletoSerializer
+    EgresoSerializer, ControlBoletoSerializer, ProcesamientoJobSerializer,
+    SubidaReanudableCreateSerializer, ResumenDiarioSerializer, LotePlanillasSerializer
+)
+from .services import azure_service, azure_service_async
+from .jobs import encolar_lote, encolar_planilla, guardar_resultado, procesar_planilla_async, reclamar_planilla
+from .cache_resultados import resultado_cache
+from .normalizacion import normalizar_patente, parsear_fecha
+from .resumenes import AGRUPACIONES, programar_actualizacion, reporte
+from .pagination import PaginacionMixtaResumen
+from .exportacion import FORMATOS, exportar_csv, exportar_ndjson
+from .medios import servir_archivo, servir_imagen
+from .metricas import CONTENT_TYPE as CONTENT_TYPE_METRICAS, exponer, registrar_transicion
+from .remapeo import descomprimir
+from .miniaturas import etag_miniatura, obtener_miniatura, tamaños_miniatura
+from .lotes import LoteNoDisponible, crear_lote
+from .snapshots import SnapshotNoDisponible, generar_snapshot, listar_snapshots, ruta_archivo
+from .uploads import (
+    PlanillaUploadHandler, crear_planillas_bulk, descartar_archivos_subidos, errores_subida
+)
+from .subidas import (
+    ErrorSubida, SubidaEnFinalizacion, estado_subida, finalizar_subida, iniciar_subida, recibir_chunk
 )
-from .services import azure_service
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +56,68 @@ class PlanillaViewSet(viewsets.ModelViewSet):
     queryset = Planilla.objects.all()
     parser_classes = [MultiPartParser, FormParser]
     
+    def initialize_request(self, request, *args, **kwargs):
+        """
+        Configurar los upload handlers antes de que se lea el cuerpo: las
+        imágenes se escriben por chunks directamente en el storage de imágenes
+        y el resto (zip) se vuelca a archivos temporales, nunca a memoria.
+        """
+        request.upload_handlers = [PlanillaUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+    
+    def get_queryset(self):
+        """
+        Ajustar la consulta a la acción para evitar N+1 y no leer
+        datos_extraidos donde no se muestra.
+        """
+        queryset = Planilla.objects.all()
+        if self.action == 'list':
+            # El listado nunca carga la columna JSON
+            return self.filtrar(queryset).only(*PlanillaListSerializer.CAMPOS_CONSULTA)
+        if self.action == 'retrieve':
+            return queryset.con_relaciones()
+        if self.action in ('miniatura', 'imagen'):
+            return queryset.only('id', 'imagen', 'hash_contenido', 'archivo_bundle')
+        if self.action == 'datos_extraidos':
+            return queryset.only('id', 'status', 'datos_extraidos', 'fecha_actualizacion')
+        if self.action == 'resultado_crudo':
+            return queryset.only('id')
+        if self.action in ('procesar_con_azure', 'destroy'):
+            return queryset.sin_datos_extraidos()
+        return queryset
+    
+    def filtrar(self, queryset):
+        """
+        Filtros del listado sobre columnas indexadas: status, numero_planilla,
+        numero_bus, patente_bus, codigo_conductor, fecha (exacta) y
+        fecha_desde/fecha_hasta sobre la fecha de la planilla.
+        """
+        params = self.request.query_params
+        
+        for campo in ('status', 'numero_planilla', 'numero_bus', 'codigo_conductor'):
+            valor = params.get(campo)
+            if valor:
+                queryset = queryset.filter(**{campo: valor.strip()})
+        
+        patente = normalizar_patente(params.get('patente_bus'))
+        if patente:
+            queryset = queryset.filter(patente_bus=patente)
+        
+        for parametro, lookup in (
+            ('fecha', 'fecha_planilla'),
+            ('fecha_desde', 'fecha_planilla__gte'),
+            ('fecha_hasta', 'fecha_planilla__lte'),
+        ):
+            valor = params.get(parametro)
+            if not valor:
+                continue
+            fecha = parsear_fecha(valor)
+            if fecha is None:
+                raise ValidationError({parametro: 'Fecha inválida, use AAAA-MM-DD'})
+            queryset = queryset.filter(**{lookup: fecha})
+        
+        return queryset
+    
     def get_serializer_class(self):
         """Retornar el serializer apropiado según la acción"""
         if self.action == 'list':
@@ -40,22 +133,74 @@ class PlanillaViewSet(viewsets.ModelViewSet):
         Crear una nueva planilla con imagen.
         La imagen se sube y se marca como 'pending' para procesamiento posterior.
         """
-        serializer = self.get_serializer(data=request.data)
+        datos = request.data
+        rechazados = errores_subida(request)
+        if rechazados:
+            return Response({'imagen': rechazados}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = self.get_serializer(data=datos)
         if serializer.is_valid():
             planilla = serializer.save()
             return Response(
                 PlanillaDetailSerializer(planilla).data,
                 status=status.HTTP_201_CREATED
             )
+        descartar_archivos_subidos(request.FILES.getlist('imagen'))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    def perform_update(self, serializer):
+        """Actualizar el resumen diario si la planilla entra o sale de 'completed'"""
+        anterior = serializer.instance.status
+        planilla = serializer.save()
+        registrar_transicion(anterior, planilla.status)
+        if 'completed' in (anterior, planilla.status):
+            programar_actualizacion(planilla)
+    
+    def perform_destroy(self, instance):
+        """Quitar la planilla de su resumen diario al eliminarla"""
+        completada = instance.status == 'completed'
+        instance.delete()
+        if completada:
+            # Los campos del grupo siguen en memoria tras el delete
+            programar_actualizacion(instance)
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Carga masiva de planillas en una sola petición multipart.
+        
+        Acepta varios archivos en el campo 'imagenes' y/o archivos zip con
+        imágenes. Todas las planillas se crean con un solo bulk_create y se
+        responde una lista compacta de resultados por archivo.
+        """
+        archivos = request.FILES.getlist('imagenes')
+        rechazados = errores_subida(request)
+        if not archivos and not rechazados:
+            return Response(
+                {'error': "Debe enviar al menos un archivo en el campo 'imagenes'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        resultados = crear_planillas_bulk(archivos) + rechazados
+        creadas = sum(1 for r in resultados if 'id' in r)
+        
+        return Response(
+            {
+                'creadas': creadas,
+                'errores': len(resultados) - creadas,
+                'resultados': resultados
+            },
+            status=status.HTTP_201_CREATED if creadas else status.HTTP_400_BAD_REQUEST
+        )
+    
     @action(detail=True, methods=['post'])
     def procesar_con_azure(self, request, pk=None):  # pylint: disable=unused-argument
         """
         Endpoint para procesar una planilla con Azure Form Recognizer.
         
         Usa el modelo entrenado personalizado configurado en settings.
-        Extrae datos y los mapea a los modelos Django.
+        El análisis se ejecuta en segundo plano: la planilla se encola y se
+        responde 202 con el id del trabajo, que se consulta en /api/jobs/{id}/.
         """
         planilla = self.get_object()
         
@@ -65,51 +210,72 @@ class PlanillaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Verificar si Azure está configurado
-        if not azure_service.is_configured():
-            return Response(
-                {'error': 'Azure Form Recognizer no está configurado'},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
-        
-        try:
-            # Marcar como procesando
-            planilla.status = 'processing'
-            planilla.save()
-            
-            # Obtener ruta completa de la imagen
-            image_path = os.path.join(settings.MEDIA_ROOT, planilla.imagen.name)
-            
-            # Procesar con Azure Form Recognizer
-            logger.info(f"Procesando planilla {planilla.id} con Azure Form Recognizer")
-            datos_extraidos = azure_service.analyze_document(image_path)
-            
-            # Actualizar planilla con los datos extraídos
-            planilla.datos_extraidos = datos_extraidos
-            planilla.status = 'completed'
-            planilla.save()
-            
-            logger.info(f"Planilla {planilla.id} procesada exitosamente")
-            
+        # Reutilizar el resultado si la misma imagen ya fue analizada (el fallo lo cuenta el worker)
+        datos_extraidos = resultado_cache.obtener(planilla.hash_contenido, azure_service.model_id, contar=False)
+        if datos_extraidos is not None:
+            guardar_resultado(planilla, datos_extraidos)
+            logger.info(f"Planilla {planilla.id} completada desde cache")
             return Response({
-                'message': 'Planilla procesada exitosamente',
+                'message': 'Planilla procesada desde cache',
                 'planilla_id': planilla.id,
                 'status': planilla.status,
                 'datos_extraidos': datos_extraidos
             })
-            
-        except Exception as e:
-            # Marcar como error
-            planilla.status = 'error'
-            planilla.error_procesamiento = str(e)
-            planilla.save()
-            
-            logger.error(f"Error procesando planilla {planilla.id}: {e}")
-            
+        
+        # Verificar si Azure está configurado
+        if not azure_service.is_configured():
             return Response(
-                {'error': f'Error procesando planilla: {str(e)}'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': 'Azure Form Recognizer no está configurado'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
+        
+        # Encolar para que un worker lo procese (manage.py procesar_planillas)
+        job = encolar_planilla(planilla)
+        logger.info(f"Planilla {planilla.id} encolada para procesamiento (job {job.id})")
+        
+        return Response({
+            'message': 'Planilla encolada para procesamiento',
+            'planilla_id': planilla.id,
+            'job_id': job.id,
+            'estado_job': job.estado,
+            'status': planilla.status
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'], url_path=r'miniatura/(?P<lado>\d+)')
+    def miniatura(self, request, pk=None, lado=None):  # pylint: disable=unused-argument
+        """
+        Miniatura JPEG de la imagen de la planilla (lado mayor en píxeles).
+        Se genera al primer pedido y luego se sirve desde disco con ETag y
+        Cache-Control de larga duración.
+        """
+        lado = int(lado)
+        if lado not in tamaños_miniatura():
+            raise Http404('Tamaño de miniatura no disponible')
+        
+        planilla = self.get_object()
+        etag = etag_miniatura(planilla, lado)
+        cache_control = f'public, max-age={settings.MINIATURAS_MAX_AGE}, immutable'
+        
+        # Responder 304 antes de generar la miniatura si el cliente ya la tiene
+        if etag in request.headers.get('If-None-Match', ''):
+            respuesta = HttpResponseNotModified()
+            respuesta['ETag'] = etag
+            respuesta['Cache-Control'] = cache_control
+            return respuesta
+        
+        ruta = obtener_miniatura(planilla, lado)
+        if ruta is None:
+            raise Http404('La planilla no tiene imagen disponible')
+        return servir_archivo(request, ruta, 'image/jpeg', etag=etag, cache_control=cache_control)
+    
+    @action(detail=True, methods=['get'])
+    def imagen(self, request, pk=None):  # pylint: disable=unused-argument
+        """
+        Imagen original de la planilla, desde disco o desde su bundle
+        archivado. Con MEDIA_SERVIDOR_PROXY la transferencia la hace el proxy.
+        """
+        planilla = self.get_object()
+        return servir_imagen(request, planilla, tipo_imagen(planilla))
     
     @action(detail=True, methods=['get'])
     def datos_extraidos(self, request, pk=None):
@@ -130,6 +296,31 @@ class PlanillaViewSet(viewsets.ModelViewSet):
             'fecha_procesamiento': planilla.fecha_actualizacion
         })
     
+    @action(detail=True, methods=['get'])
+    def resultado_crudo(self, request, pk=None):  # pylint: disable=unused-argument
+        """
+        Resultado completo de Azure (AnalyzeResult.to_dict()): texto, tablas y
+        documentos con sus confianzas. Se guarda comprimido aparte y solo se
+        lee aquí.
+        """
+        planilla = self.get_object()
+        contenido = (
+            ResultadoCrudo.objects
+            .filter(planilla=planilla)
+            .values_list('contenido', flat=True)
+            .first()
+        )
+        if contenido is None:
+            raise Http404('La planilla no tiene resultado crudo')
+        return Response(descomprimir(contenido))
+    
+    @action(detail=False, methods=['get'])
+    def estadisticas_cache(self, request):
+        """
+        Obtener los contadores de la cache de resultados de Azure.
+        """
+        return Response(resultado_cache.estadisticas())
+    
     @action(detail=False, methods=['get'])
     def test_azure_connection(self, request):
         """
@@ -143,7 +334,138 @@ class PlanillaViewSet(viewsets.ModelViewSet):
             return Response(result, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
 
-class TarifaViewSet(viewsets.ModelViewSet):
+async def procesar_con_azure_async(request, pk):
+    """
+    Procesar una planilla con Azure Form Recognizer sin bloquear un hilo.
+    
+    Vista asíncrona para despliegues ASGI (uvicorn/daphne): la petición
+    espera el resultado del análisis, pero mientras Azure procesa el event
+    loop atiende otras peticiones.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    try:
+        planilla = await Planilla.objects.sin_datos_extraidos().aget(pk=pk)
+    except Planilla.DoesNotExist:
+        return JsonResponse({'error': 'Planilla no encontrada'}, status=404)
+    
+    if planilla.status != 'pending':
+        return JsonResponse({'error': 'La planilla ya ha sido procesada'}, status=400)
+    
+    if not azure_service_async.is_configured():
+        return JsonResponse({'error': 'Azure Form Recognizer no está configurado'}, status=503)
+    
+    if not await sync_to_async(reclamar_planilla)(planilla):
+        return JsonResponse(
+            {'error': 'La planilla ya está siendo procesada o tiene un trabajo en cola'}, status=409
+        )
+    
+    try:
+        datos_extraidos = await procesar_planilla_async(planilla)
+    except Exception as e:
+        return JsonResponse({'error': f'Error procesando planilla: {str(e)}'}, status=500)
+    
+    return JsonResponse({
+        'message': 'Planilla procesada exitosamente',
+        'planilla_id': planilla.id,
+        'status': planilla.status,
+        'datos_extraidos': datos_extraidos
+    })
+
+
+# Los decoradores de Django 4.2 no soportan vistas async; se marca directamente
+procesar_con_azure_async.csrf_exempt = True
+
+
+def tipo_imagen(planilla):
+    tipo, _ = mimetypes.guess_type(planilla.imagen.name)
+    return tipo or 'application/octet-stream'
+
+
+@api_view(['GET'])
+def imagen_protegida(request, nombre):
+    """
+    Imagen de planilla en su URL de MEDIA_URL (la que expone el campo
+    'imagen'). Aplica los permisos de DRF y solo sirve archivos que
+    pertenecen a una planilla; el resto de MEDIA_ROOT no es accesible.
+    """
+    planilla = (
+        Planilla.objects
+        .filter(imagen=nombre)
+        .only('id', 'imagen', 'archivo_bundle')
+        .first()
+    )
+    if planilla is None:
+        raise Http404('Imagen no encontrada')
+    return servir_imagen(request, planilla, tipo_imagen(planilla))
+
+
+@require_GET
+def exportar_planillas(request):
+    """
+    Exportar planillas y sus líneas en streaming.
+    
+    Parámetros: format=csv|ndjson, from y to (AAAA-MM-DD, opcionales).
+    Es una vista de Django y no de DRF porque DRF reserva ?format= para
+    elegir el renderer.
+    """
+    formato = request.GET.get('format', 'csv')
+    if formato not in FORMATOS:
+        return JsonResponse({'error': f"format debe ser uno de: {', '.join(FORMATOS)}"}, status=400)
+    
+    fechas = {}
+    for parametro, argumento in (('from', 'desde'), ('to', 'hasta')):
+        valor = request.GET.get(parametro)
+        if valor:
+            fechas[argumento] = parsear_fecha(valor)
+            if fechas[argumento] is None:
+                return JsonResponse({'error': f'{parametro}: fecha inválida, use AAAA-MM-DD'}, status=400)
+    
+    if formato == 'csv':
+        response = StreamingHttpResponse(exportar_csv(**fechas), content_type='text/csv; charset=utf-8')
+    else:
+        response = StreamingHttpResponse(exportar_ndjson(**fechas), content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="planillas.{formato}"'
+    logger.info(f"Exportación {formato} iniciada ({fechas or 'sin filtro de fechas'})")
+    return response
+
+
+class LineasPlanillaMixin:
+    """
+    Escrituras por la API de las líneas de una planilla (tarifas, ingresos,
+    egresos y controles de boletos).
+    
+    Cada escritura toca fecha_actualizacion de la planilla para que el
+    snapshot incremental vuelva a exportar sus líneas; las de ingresos y
+    egresos además actualizan el resumen diario.
+    """
+    
+    actualiza_resumen = False
+    
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            self.linea_modificada(serializer.save().planilla)
+    
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            self.linea_modificada(serializer.save().planilla)
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            planilla = instance.planilla
+            instance.delete()
+            self.linea_modificada(planilla)
+    
+    def linea_modificada(self, planilla):
+        planilla.fecha_actualizacion = timezone.now()
+        Planilla.objects.filter(pk=planilla.pk).update(fecha_actualizacion=planilla.fecha_actualizacion)
+        # Solo las planillas completadas cuentan en el resumen
+        if self.actualiza_resumen and planilla.status == 'completed':
+            programar_actualizacion(planilla)
+
+
+class TarifaViewSet(LineasPlanillaMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar tarifas"""
     
     queryset = Tarifa.objects.all()
@@ -158,11 +480,12 @@ class TarifaViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class IngresoViewSet(viewsets.ModelViewSet):
+class IngresoViewSet(LineasPlanillaMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar ingresos"""
     
     queryset = Ingreso.objects.all()
     serializer_class = IngresoSerializer
+    actualiza_resumen = True
     
     def get_queryset(self):
         """Filtrar ingresos por planilla si se especifica"""
@@ -173,11 +496,12 @@ class IngresoViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class EgresoViewSet(viewsets.ModelViewSet):
+class EgresoViewSet(LineasPlanillaMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar egresos"""
     
     queryset = Egreso.objects.all()
     serializer_class = EgresoSerializer
+    actualiza_resumen = True
     
     def get_queryset(self):
         """Filtrar egresos por planilla si se especifica"""
@@ -188,7 +512,7 @@ class EgresoViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class ControlBoletoViewSet(viewsets.ModelViewSet):
+class ControlBoletoViewSet(LineasPlanillaMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar controles de boletos"""
     
     queryset = ControlBoleto.objects.all()
@@ -201,3 +525,244 @@ class ControlBoletoViewSet(viewsets.ModelViewSet):
         if planilla_id:
             queryset = queryset.filter(planilla_id=planilla_id)
         return queryset
+
+
+class ProcesamientoJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """ViewSet de solo lectura para consultar trabajos de procesamiento"""
+    
+    queryset = ProcesamientoJob.objects.select_related('planilla')
+    serializer_class = ProcesamientoJobSerializer
+    
+    def get_queryset(self):
+        """Filtrar trabajos por planilla o estado si se especifica"""
+        # Del join con la planilla solo se usa el status
+        queryset = ProcesamientoJob.objects.select_related('planilla').defer(
+            'planilla__datos_extraidos', 'planilla__error_procesamiento'
+        )
+        planilla_id = self.request.query_params.get('planilla_id')
+        if planilla_id:
+            queryset = queryset.filter(planilla_id=planilla_id)
+        estado = self.request.query_params.get('estado')
+        if estado:
+            queryset = queryset.filter(estado=estado)
+        return queryset
+
+
+class LotePlanillasViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Lotes de planillas: un PDF o TIFF de varias páginas que se analiza con
+    una sola llamada a Azure y se divide en una planilla por documento.
+    """
+    
+    serializer_class = LotePlanillasSerializer
+    parser_classes = [MultiPartParser, FormParser]
+    
+    def get_queryset(self):
+        """Lotes con los ids de sus planillas (sin cargar las planillas completas)"""
+        planillas = Planilla.objects.only('id', 'lote_id').order_by('pagina', 'id')
+        queryset = LotePlanillas.objects.prefetch_related(Prefetch('planillas', queryset=planillas))
+        estado = self.request.query_params.get('status')
+        if estado:
+            queryset = queryset.filter(status=estado)
+        return queryset
+    
+    def create(self, request):
+        """
+        Subir un lote (campo multipart 'archivo') y encolarlo. Se responde 202
+        con el id del lote; las planillas aparecen en /api/lotes/{id}/ cuando
+        un worker termina el análisis.
+        """
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response(
+                {'archivo': 'Se requiere un archivo PDF o TIFF'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not azure_service.is_configured():
+            return Response(
+                {'error': 'Azure Form Recognizer no está configurado'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        try:
+            lote = crear_lote(archivo)
+        except LoteNoDisponible as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except ValueError as e:
+            return Response({'archivo': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        job = encolar_lote(lote)
+        logger.info(f"Lote {lote.id} encolado para procesamiento (job {job.id})")
+        
+        return Response({
+            'message': 'Lote encolado para procesamiento',
+            'lote_id': lote.id,
+            'paginas': lote.paginas,
+            'job_id': job.id,
+            'estado_job': job.estado,
+            'status': lote.status
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class SubidaReanudableViewSet(viewsets.GenericViewSet):
+    """
+    Subida reanudable de imágenes de planillas en chunks numerados.
+    Pensada para conexiones móviles inestables: si la conexión se corta
+    el cliente consulta los rangos recibidos y reenvía solo lo que falta.
+    """
+    
+    queryset = SubidaReanudable.objects.all()
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+    
+    def create(self, request):
+        """Iniciar una subida: nombre_archivo, tamaño_total, tamaño_chunk y sha256 opcionales"""
+        serializer = SubidaReanudableCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            subida = iniciar_subida(**serializer.validated_data)
+        except ErrorSubida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(estado_subida(subida), status=status.HTTP_201_CREATED)
+    
+    def retrieve(self, request, pk=None):  # pylint: disable=unused-argument
+        """Estado de la subida con los rangos de bytes recibidos y los chunks faltantes"""
+        return Response(estado_subida(self.get_object()))
+    
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<numero>\d+)')
+    def chunk(self, request, pk=None, numero=None):  # pylint: disable=unused-argument
+        """
+        Recibir un chunk como cuerpo binario (application/octet-stream).
+        El cuerpo se copia a disco por bloques sin pasar por los parsers.
+        """
+        subida = self.get_object()
+        try:
+            largo = int(request.META.get('CONTENT_LENGTH') or 0)
+            nuevo = recibir_chunk(subida, int(numero), request.stream, largo)
+        except ErrorSubida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'numero': int(numero),
+            'nuevo': nuevo,
+            'chunks_recibidos': subida.chunks.count(),
+            'total_chunks': subida.total_chunks,
+        })
+    
+    @action(detail=True, methods=['post'])
+    def finalizar(self, request, pk=None):  # pylint: disable=unused-argument
+        """Ensamblar la subida y crear la planilla"""
+        subida = self.get_object()
+        try:
+            planilla = finalizar_subida(subida)
+        except SubidaEnFinalizacion as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except ErrorSubida as e:
+            return Response(
+                {'error': str(e), **estado_subida(subida)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        logger.info(f"Subida {subida.id} finalizada como planilla {planilla.id}")
+        return Response(PlanillaDetailSerializer(planilla).data, status=status.HTTP_201_CREATED)
+
+
+class ResumenDiarioViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Resúmenes diarios de ingresos y egresos por bus, conductor y ruta,
+    más un endpoint de reporte que agrupa en SQL.
+    """
+    
+    queryset = ResumenDiario.objects.all()
+    serializer_class = ResumenDiarioSerializer
+    pagination_class = PaginacionMixtaResumen
+    
+    # Filtros de consulta -> lookup sobre ResumenDiario
+    FILTROS = {
+        'numero_bus': 'numero_bus',
+        'codigo_conductor': 'codigo_conductor',
+        'ciudad_origen': 'ciudad_origen',
+        'ciudad_retorno': 'ciudad_retorno',
+    }
+    
+    def filtros(self):
+        """Filtros comunes del listado y el reporte: rango de fechas, bus, conductor y ruta"""
+        params = self.request.query_params
+        filtros = {}
+        for parametro, lookup in (('fecha_desde', 'fecha__gte'), ('fecha_hasta', 'fecha__lte')):
+            valor = params.get(parametro)
+            if valor:
+                fecha = parsear_fecha(valor)
+                if fecha is None:
+                    raise ValidationError({parametro: 'Fecha inválida, use AAAA-MM-DD'})
+                filtros[lookup] = fecha
+        for parametro, lookup in self.FILTROS.items():
+            valor = params.get(parametro)
+            if valor:
+                filtros[lookup] = valor.strip()
+        return filtros
+    
+    def get_queryset(self):
+        """Filtrar resúmenes por fechas, bus, conductor o ruta"""
+        return ResumenDiario.objects.filter(**self.filtros())
+    
+    @action(detail=False, methods=['get'])
+    def reporte(self, request):
+        """
+        Totales de ingresos, egresos y balance agrupados por
+        ?agrupar=dia,bus,conductor,ruta (una o varias, separadas por coma).
+        """
+        agrupar = [a.strip() for a in request.query_params.get('agrupar', 'dia').split(',') if a.strip()]
+        invalidas = [a for a in agrupar if a not in AGRUPACIONES]
+        if invalidas or not agrupar:
+            return Response(
+                {'error': f"agrupar debe ser una o más de: {', '.join(AGRUPACIONES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'agrupar': agrupar,
+            'resultados': reporte(agrupar, self.filtros())
+        })
+
+
+class SnapshotViewSet(viewsets.ViewSet):
+    """
+    Snapshots Parquet para análisis: listar, generar y descargar el archivo
+    de cada entidad.
+    """
+    
+    def list(self, request):
+        """Listar los snapshots generados (manifest de cada uno)"""
+        return Response(listar_snapshots())
+    
+    def create(self, request):
+        """Generar un snapshot; incremental salvo que se envíe completo=true"""
+        completo = str(request.data.get('completo', '')).lower() in ('1', 'true', 'si', 'sí')
+        try:
+            manifest = generar_snapshot(completo=completo)
+        except SnapshotNoDisponible as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(manifest, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['get'], url_path=r'(?P<entidad>[a-z_]+)')
+    def archivo(self, request, pk=None, entidad=None):  # pylint: disable=unused-argument
+        """Descargar el Parquet de una entidad del snapshot"""
+        ruta = ruta_archivo(pk, entidad)
+        if ruta is None:
+            raise Http404('Snapshot o entidad no encontrada')
+        return FileResponse(
+            open(ruta, 'rb'),
+            as_attachment=True,
+            filename=f'{entidad}-{pk}.parquet',
+            content_type='application/vnd.apache.parquet'
+        )
+
+
+@require_GET
+def metricas_prometheus(request):  # pylint: disable=unused-argument
+    """
+    Métricas del proceso en formato de texto de Prometheus (ver api/metricas.py).
+    Vista de Django y no de DRF: el scraper no negocia un renderer JSON.
+    """
+    return HttpResponse(exponer(), content_type=CONTENT_TYPE_METRICAS)
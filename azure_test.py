@@ -15,7 +15,7 @@ sys.path.append(str(BASE_DIR))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'planilla_api.settings')
 django.setup()
 
-from api.services import AzureFormRecognizerService
+from api.services import CLAVE_RESULTADO_CRUDO, AzureFormRecognizerService
 from django.conf import settings
 
 
@@ -85,15 +85,19 @@ def test_document_analysis(image_path: str):
         result = service.analyze_document(image_path)
         
         print("✅ ANÁLISIS COMPLETADO")
-        print(f"   Texto extraído: {len(result.get('texto_completo', ''))} caracteres")
-        print(f"   Tablas detectadas: {len(result.get('tablas', []))}")
-        print(f"   Campos detectados: {len(result.get('campos_detectados', {}))}")
+        crudo = result.get(CLAVE_RESULTADO_CRUDO, {})
+        print(f"   Texto extraído: {len(crudo.get('content') or '')} caracteres")
+        print(f"   Tablas detectadas: {len(crudo.get('tables') or [])}")
+        print(f"   Tarifas: {len(result.get('tarifas', []))}, ingresos: {len(result.get('ingresos', []))}, "
+              f"egresos: {len(result.get('egresos', []))}")
         
-        # Mostrar campos detectados
-        if result.get('campos_detectados'):
-            print("\n📋 CAMPOS DETECTADOS:")
-            for key, value in result['campos_detectados'].items():
-                print(f"   {key}: {value['value']} (confianza: {value['confidence']:.2f})")
+        # Mostrar encabezado y campos no válidos
+        if result.get('info_general'):
+            print("\n📋 ENCABEZADO:")
+            for key, value in result['info_general'].items():
+                print(f"   {key}: {value}")
+        for key, error in result.get('errores_campos', {}).items():
+            print(f"   ⚠️  {key}: {error}")
         
         return True
         
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Benchmark: análisis concurrentes con el cliente síncrono vs el cliente aio.
+
+Levanta el servidor falso de Azure (benchmarks/fake_azure.py) y mide el
+throughput de N análisis usando:
+  - AzureFormRecognizerService en un pool de hilos (un hilo por análisis)
+  - AsyncAzureFormRecognizerService en un solo hilo con asyncio
+
+Uso:
+    python benchmarks/bench_async_azure.py --analisis 200 --concurrencia 50 --latencia 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'planilla_api.settings')
+django.setup()
+
+from api.services import AzureFormRecognizerService, AsyncAzureFormRecognizerService  # noqa: E402
+from benchmarks.fake_azure import iniciar_servidor  # noqa: E402
+
+MODEL_ID = 'rendibus-benchmark'
+CLAVE = 'clave-falsa'
+
+
+def medir_sync(endpoint, imagen, analisis, concurrencia):
+    """Throughput del cliente síncrono con un hilo por análisis en curso"""
+    servicio = AzureFormRecognizerService(endpoint=endpoint, key=CLAVE, model_id=MODEL_ID)
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(lambda _: servicio.analyze_document(imagen), range(analisis)))
+    return time.perf_counter() - inicio
+
+
+async def _medir_async(endpoint, imagen, analisis, concurrencia):
+    servicio = AsyncAzureFormRecognizerService(endpoint=endpoint, key=CLAVE, model_id=MODEL_ID)
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def analizar():
+        async with semaforo:
+            await servicio.analyze_document(imagen)
+
+    try:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(analizar() for _ in range(analisis)))
+        return time.perf_counter() - inicio
+    finally:
+        await servicio.close()
+
+
+def medir_async(endpoint, imagen, analisis, concurrencia):
+    """Throughput del cliente aio con todos los análisis en un solo hilo"""
+    return asyncio.run(_medir_async(endpoint, imagen, analisis, concurrencia))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cliente síncrono vs asíncrono de Azure')
+    parser.add_argument('--analisis', type=int, default=200, help='Cantidad total de análisis')
+    parser.add_argument('--concurrencia', type=int, nargs='+', default=[1, 10, 50],
+                        help='Análisis en curso simultáneos')
+    parser.add_argument('--latencia', type=float, default=1.0, help='Latencia del análisis falso (s)')
+    args = parser.parse_args()
+
+    servidor, endpoint = iniciar_servidor(latencia=args.latencia)
+
+    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+        f.write(b'\xff\xd8\xff' + os.urandom(200 * 1024))
+        imagen = f.name
+
+    print(f"Servidor falso: {endpoint} (latencia {args.latencia}s), {args.analisis} análisis")
+    print(f"{'concurrencia':>12} {'sync (an/s)':>12} {'async (an/s)':>13}")
+    try:
+        for concurrencia in args.concurrencia:
+            t_sync = medir_sync(endpoint, imagen, args.analisis, concurrencia)
+            t_async = medir_async(endpoint, imagen, args.analisis, concurrencia)
+            print(
+                f"{concurrencia:>12} {args.analisis / t_sync:>12.1f} {args.analisis / t_async:>13.1f}"
+            )
+    finally:
+        servidor.shutdown()
+        os.unlink(imagen)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Benchmark de punta a punta: subida, encolado y procesamiento de planillas.
+
+Levanta el servidor falso de Azure (benchmarks/fake_azure.py), crea una
+base de datos SQLite temporal con las migraciones y un MEDIA_ROOT
+temporal, y para cada nivel de concurrencia:
+
+  1. Sube N imágenes distintas con POST /api/planillas/ desde C hilos
+  2. Las encola con POST /api/planillas/{id}/procesar_con_azure/
+  3. Las procesa con C hilos worker (reclamar_job + ejecutar_job, igual
+     que manage.py procesar_planillas)
+
+Reporta subidas por segundo, p50/p95/p99 de la subida y del
+procesamiento, planillas procesadas por segundo y consultas a la base de
+datos por petición. Con --json se guardan los resultados para comparar
+corridas y detectar regresiones.
+
+Uso:
+    python benchmarks/bench_throughput.py --planillas 100 --concurrencia 1 4 8
+    python benchmarks/bench_throughput.py --latencia 2 --jitter 0.5 --tasa-429 0.05 --json resultados.json
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import django
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'planilla_api.settings')
+
+from benchmarks.fake_azure import iniciar_servidor  # noqa: E402
+
+MODEL_ID = 'rendibus-benchmark'
+
+
+def percentiles(valores):
+    """p50, p95 y p99 de una lista de valores (0 si no hay suficientes)"""
+    if len(valores) < 2:
+        valor = valores[0] if valores else 0.0
+        return valor, valor, valor
+    cortes = statistics.quantiles(valores, n=100, method='inclusive')
+    return cortes[49], cortes[94], cortes[98]
+
+
+def imagen_planilla(azar):
+    """JPEG de tamaño carta con trazos al azar: cada imagen tiene otro hash"""
+    from PIL import Image, ImageDraw
+
+    imagen = Image.new('RGB', (1240, 1754), 'white')
+    dibujo = ImageDraw.Draw(imagen)
+    for _ in range(60):
+        x, y = azar.randrange(1240), azar.randrange(1754)
+        dibujo.line((x, y, x + azar.randrange(20, 400), y), fill='black', width=2)
+    contenido = io.BytesIO()
+    imagen.save(contenido, 'JPEG', quality=85)
+    return contenido.getvalue()
+
+
+def en_hilos(funcion, elementos, concurrencia):
+    """
+    Ejecutar funcion(elemento) desde `concurrencia` hilos, midiendo cada
+    llamada y las consultas SQL que hace.
+
+    Returns:
+        Lista de tuplas (segundos, consultas, resultado) y el tiempo total;
+        si la llamada lanza una excepción el resultado es la excepción
+    """
+    from django.db import connection
+
+    pendientes = queue.Queue()
+    for elemento in elementos:
+        pendientes.put(elemento)
+    mediciones = []
+    lock = threading.Lock()
+
+    def trabajar():
+        consultas = [0]
+
+        def contar(execute, sql, params, many, context):
+            consultas[0] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            with connection.execute_wrapper(contar):
+                while True:
+                    try:
+                        elemento = pendientes.get_nowait()
+                    except queue.Empty:
+                        return
+                    consultas[0] = 0
+                    inicio = time.perf_counter()
+                    try:
+                        resultado = funcion(elemento)
+                    except Exception as e:  # pylint: disable=broad-except
+                        # Con SQLite varios escritores chocan ("database is locked")
+                        resultado = e
+                    medicion = (time.perf_counter() - inicio, consultas[0], resultado)
+                    with lock:
+                        mediciones.append(medicion)
+        finally:
+            connection.close()
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=trabajar) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return mediciones, time.perf_counter() - inicio
+
+
+def medir_nivel(concurrencia, imagenes):
+    """Subir, encolar y procesar las imágenes con `concurrencia` hilos"""
+    from django.core.files.base import ContentFile
+    from django.test import Client
+
+    from api.jobs import ejecutar_job, reclamar_job
+
+    def subir(indice):
+        archivo = ContentFile(imagenes[indice], name=f'planilla-{indice}.jpg')
+        response = Client().post('/api/planillas/', {'imagen': archivo})
+        return response.json()['id'] if response.status_code == 201 else None
+
+    def encolar(planilla_id):
+        response = Client().post(f'/api/planillas/{planilla_id}/procesar_con_azure/')
+        return response.status_code == 202
+
+    def procesar(_):
+        job = reclamar_job(f'bench:{threading.get_ident()}')
+        return None if job is None else ejecutar_job(job)
+
+    subidas, t_subidas = en_hilos(subir, range(len(imagenes)), concurrencia)
+    ids = [planilla_id for _, _, planilla_id in subidas if isinstance(planilla_id, int)]
+    encolados, _ = en_hilos(encolar, ids, concurrencia)
+    procesados, t_procesamiento = en_hilos(procesar, range(len(ids)), concurrencia)
+    # Sin resultado: el hilo no encontró trabajo en la cola
+    procesados = [medicion for medicion in procesados if medicion[2] is not None]
+
+    tiempos_subida = [segundos for segundos, _, _ in subidas]
+    tiempos_proceso = [segundos for segundos, _, _ in procesados]
+    errores = (
+        len(imagenes) - len(ids)
+        + sum(1 for _, _, ok in encolados if ok is not True)
+        + sum(1 for _, _, ok in procesados if ok is not True)
+    )
+    return {
+        'concurrencia': concurrencia,
+        'subidas': len(ids),
+        'subidas_por_segundo': len(ids) / t_subidas,
+        'subida_ms': [round(p * 1000, 1) for p in percentiles(tiempos_subida)],
+        'consultas_subida': statistics.mean(c for _, c, _ in subidas),
+        'consultas_encolado': statistics.mean(c for _, c, _ in encolados) if encolados else 0,
+        'procesadas_por_segundo': len(procesados) / t_procesamiento if t_procesamiento else 0,
+        'procesamiento_ms': [round(p * 1000, 1) for p in percentiles(tiempos_proceso)],
+        'consultas_procesamiento': statistics.mean(c for _, c, _ in procesados) if procesados else 0,
+        'errores': errores,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de subida y procesamiento de planillas')
+    parser.add_argument('--planillas', type=int, default=50, help='Planillas por nivel de concurrencia')
+    parser.add_argument('--concurrencia', type=int, nargs='+', default=[1, 4, 8],
+                        help='Hilos de subida y de procesamiento')
+    parser.add_argument('--latencia', type=float, default=1.0, help='Latencia del análisis falso (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Variación +/- de la latencia (s)')
+    parser.add_argument('--tasa-429', type=float, default=0.0, help='Fracción de análisis rechazados con 429')
+    parser.add_argument('--tasa-500', type=float, default=0.0, help='Fracción de análisis rechazados con 500')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--json', help='Guardar los resultados en este archivo')
+    args = parser.parse_args()
+
+    servidor, endpoint = iniciar_servidor(
+        latencia=args.latencia, jitter=args.jitter, tasa_429=args.tasa_429,
+        tasa_500=args.tasa_500, retry_after=0.2, semilla=args.semilla
+    )
+    # El servicio de Azure se crea al importar api.services con estas variables
+    os.environ['AZURE_FORM_RECOGNIZER_ENDPOINT'] = endpoint
+    os.environ['AZURE_FORM_RECOGNIZER_KEY'] = 'clave-falsa'
+    os.environ['AZURE_FORM_RECOGNIZER_MODEL_ID'] = MODEL_ID
+    django.setup()
+
+    from django.db import connection, connections
+    from django.test.utils import override_settings, setup_test_environment
+
+    directorio = tempfile.mkdtemp(prefix='bench-planillas-')
+    base = connections.settings['default']
+    base.setdefault('TEST', {})['NAME'] = os.path.join(directorio, 'bench.sqlite3')
+    # Varios hilos escriben a la vez: esperar el lock de SQLite en vez de fallar
+    base.setdefault('OPTIONS', {})['timeout'] = 30
+    setup_test_environment()
+    # Los errores se cuentan en la tabla; sus trazas solo ensucian la salida
+    logging.disable(logging.ERROR)
+    nombre_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    ajustes = override_settings(MEDIA_ROOT=os.path.join(directorio, 'media'))
+    ajustes.enable()
+
+    azar = random.Random(args.semilla)
+    print(f"Servidor falso: {endpoint} (latencia {args.latencia}s +/- {args.jitter}s, "
+          f"429 {args.tasa_429:.0%}, 500 {args.tasa_500:.0%}), {args.planillas} planillas por nivel")
+    print(f"{'conc':>4} {'sub/s':>7} {'sub p50/p95/p99 ms':>22} {'q/sub':>6} {'q/enc':>6} "
+          f"{'proc/s':>7} {'proc p50/p95/p99 ms':>24} {'q/proc':>7} {'errores':>7}")
+    resultados = []
+    try:
+        for concurrencia in args.concurrencia:
+            imagenes = [imagen_planilla(azar) for _ in range(args.planillas)]
+            r = medir_nivel(concurrencia, imagenes)
+            resultados.append(r)
+            print(
+                f"{concurrencia:>4} {r['subidas_por_segundo']:>7.1f} "
+                f"{'/'.join(f'{p:.0f}' for p in r['subida_ms']):>22} "
+                f"{r['consultas_subida']:>6.1f} {r['consultas_encolado']:>6.1f} "
+                f"{r['procesadas_por_segundo']:>7.1f} "
+                f"{'/'.join(f'{p:.0f}' for p in r['procesamiento_ms']):>24} "
+                f"{r['consultas_procesamiento']:>7.1f} {r['errores']:>7}"
+            )
+        print(f"Azure falso: {servidor.contadores}")
+    finally:
+        servidor.shutdown()
+        ajustes.disable()
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as archivo:
+            json.dump({'parametros': vars(args), 'resultados': resultados, 'azure': servidor.contadores},
+                      archivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+Servidor local que imita la API REST de Azure Form Recognizer.
+
+Implementa el POST de análisis (responde 202 con Operation-Location) y el
+GET de polling del resultado, con una latencia configurable. El resultado
+es un documento rendibus con todos los campos del modelo (tarifas,
+ingresos, egresos, tickets y encabezado) y valores distintos en cada
+análisis; un TIFF o PDF de varias páginas produce un documento por página,
+como un lote de planillas escaneadas. Se puede inyectar una fracción de respuestas 429 (con
+Retry-After) y 500 al POST para ver cómo se comportan los reintentos.
+Sirve para medir el rendimiento sin consumir cuota de Azure.
+
+Uso:
+    python benchmarks/fake_azure.py --puerto 8765 --latencia 1.5
+    python benchmarks/fake_azure.py --latencia 2 --jitter 0.5 --tasa-429 0.05 --tasa-500 0.01
+"""
+
+import argparse
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_VERSION = '2023-07-31'
+
+RUTA_ANALISIS = re.compile(r'^/formrecognizer/documentModels/(?P<modelo>[^/:]+):analyze')
+RUTA_RESULTADO = re.compile(
+    r'^/formrecognizer/documentModels/(?P<modelo>[^/:]+)/analyzeResults/(?P<id>[^/?]+)'
+)
+
+
+def _campo(valor):
+    """Campo string con la forma del JSON REST"""
+    return {'type': 'string', 'valueString': valor, 'content': valor, 'confidence': 0.95}
+
+
+def _monto(monto):
+    return f'{monto:,}'.replace(',', '.')
+
+
+def paginas_documento(cuerpo):
+    """Páginas del archivo enviado: TIFF por sus cuadros, PDF por sus objetos /Page"""
+    if cuerpo.startswith((b'II*\x00', b'MM\x00*')):
+        from PIL import Image  # pylint: disable=import-outside-toplevel
+
+        with Image.open(io.BytesIO(cuerpo)) as imagen:
+            return getattr(imagen, 'n_frames', 1)
+    if cuerpo.startswith(b'%PDF-'):
+        return max(1, len(re.findall(rb'/Type\s*/Page(?!s)', cuerpo)))
+    return 1
+
+
+def _campos_rendibus(azar):
+    campos = {
+        'Nro Planilla': _campo(f'{azar.randint(1, 99999):05d}'),
+        'Fecha': _campo((date(2025, 1, 1) + timedelta(days=azar.randint(0, 364))).strftime('%d/%m/%Y')),
+        'Ciudad Origen': _campo('Santiago'),
+        'Ciudad Retorno': _campo(azar.choice(['Rancagua', 'Talca', 'Chillán'])),
+        'Nom. Conductor': _campo('Juan Pérez'),
+        'Cód. Conductor': _campo(str(azar.randint(100, 999))),
+        'Nom. Asistente': _campo('Pedro Soto'),
+        'Cód. Asistente': _campo(str(azar.randint(100, 999))),
+        'Número Bus': _campo(str(azar.randint(1, 60))),
+        'Patente Bus': _campo(f'{azar.choice(["AB", "CD", "GH"])}-{azar.choice(["XY", "KL"])} {azar.randint(10, 99)}'),
+        'Horario Horigen': _campo(f'{azar.randint(6, 11):02d}:{azar.choice(["00", "30"])}'),
+        'Horario Retorno': _campo(f'{azar.randint(14, 21):02d}:{azar.choice(["00", "30"])}'),
+        'Total Ingreso Ruta': _campo(_monto(azar.randint(20, 90) * 1000)),
+        'Total Ingreso Oficina': _campo(_monto(azar.randint(50, 300) * 1000)),
+    }
+    for i in range(1, 7):
+        inicial = azar.randint(1000, 90000)
+        campos[f'Tarifa {i}'] = _campo(f'$ {_monto(500 * (i + 1))}')
+        campos[f'Ticket Inicial T{i}'] = _campo(str(inicial))
+        campos[f'Ticket Final T{i}'] = _campo(str(inicial + azar.randint(0, 80)))
+    for concepto in ('Losa', 'Cena', 'Viáticos', 'Pensión', 'Otros'):
+        campos[concepto] = _campo(_monto(azar.randint(0, 12) * 500))
+    return campos
+
+
+def documento_rendibus(model_id, azar=random, paginas=1):
+    """
+    Resultado del modelo rendibus con valores plausibles: cada llamada
+    genera otra planilla (número, fecha, bus) para que los resultados no
+    se agrupen todos en el mismo resumen. Con varias páginas hay una
+    planilla por página, con su región dentro de la página.
+    """
+    contenido = ''
+    hojas = []
+    documentos = []
+    for pagina in range(1, paginas + 1):
+        campos = _campos_rendibus(azar)
+        texto = 'PLANILLA DE RECAUDACION\n' + '\n'.join(
+            f"{nombre}: {campo['content']}" for nombre, campo in campos.items()
+        )
+        span = {'offset': len(contenido), 'length': len(texto)}
+        contenido += texto + '\n'
+        hojas.append({
+            'pageNumber': pagina, 'angle': 0, 'width': 8.5, 'height': 11, 'unit': 'inch',
+            'spans': [span], 'words': [], 'lines': [],
+        })
+        documentos.append({
+            'docType': f'{model_id}:{model_id}',
+            'boundingRegions': [{'pageNumber': pagina, 'polygon': [0.5, 1, 8, 1, 8, 10, 0.5, 10]}],
+            'confidence': 0.99,
+            'spans': [span],
+            'fields': campos,
+        })
+    return {
+        'apiVersion': API_VERSION,
+        'modelId': model_id,
+        'stringIndexType': 'unicodeCodePoint',
+        'content': contenido,
+        'pages': hojas,
+        'tables': [],
+        'documents': documentos,
+    }
+
+
+class FakeAzureHandler(BaseHTTPRequestHandler):
+    """Handler HTTP con el protocolo de operaciones largas de Form Recognizer"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _responder(self, codigo, cuerpo=None, cabeceras=None):
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else b''
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        coincidencia = RUTA_ANALISIS.match(self.path)
+        longitud = int(self.headers.get('Content-Length') or 0)
+        cuerpo = self.rfile.read(longitud)
+
+        if not coincidencia:
+            self._responder(404, {'error': {'code': 'NotFound', 'message': self.path}})
+            return
+
+        with self.server.lock:
+            sorteo = self.server.azar.random()
+            if sorteo < self.server.tasa_429:
+                self.server.contadores['429'] += 1
+            elif sorteo < self.server.tasa_429 + self.server.tasa_500:
+                self.server.contadores['500'] += 1
+        if sorteo < self.server.tasa_429:
+            espera_ms = int(self.server.retry_after * 1000)
+            self._responder(429, {'error': {'code': '429', 'message': 'Rate limit exceeded'}}, {
+                'Retry-After': str(max(1, round(self.server.retry_after))),
+                'retry-after-ms': str(espera_ms),
+            })
+            return
+        if sorteo < self.server.tasa_429 + self.server.tasa_500:
+            self._responder(500, {'error': {'code': 'InternalServerError', 'message': 'Error simulado'}})
+            return
+
+        modelo = coincidencia.group('modelo')
+        operacion = str(uuid.uuid4())
+        paginas = paginas_documento(cuerpo)
+        with self.server.lock:
+            latencia = max(0.0, self.server.latencia + self.server.azar.uniform(-1, 1) * self.server.jitter)
+            self.server.operaciones[operacion] = {
+                'modelo': modelo, 'listo': time.monotonic() + latencia,
+                'paginas': paginas
+            }
+            self.server.contadores['analisis'] += 1
+
+        host = self.headers.get('Host')
+        self._responder(202, cabeceras={
+            'Operation-Location': (
+                f'http://{host}/formrecognizer/documentModels/{modelo}'
+                f'/analyzeResults/{operacion}?api-version={API_VERSION}'
+            ),
+            'apim-request-id': operacion,
+        })
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        coincidencia = RUTA_RESULTADO.match(self.path)
+        if not coincidencia:
+            self._responder(404, {'error': {'code': 'NotFound', 'message': self.path}})
+            return
+
+        with self.server.lock:
+            operacion = self.server.operaciones.get(coincidencia.group('id'))
+            self.server.contadores['polling'] += 1
+        if operacion is None:
+            self._responder(404, {'error': {'code': 'NotFound', 'message': 'Operación desconocida'}})
+            return
+
+        if time.monotonic() < operacion['listo']:
+            self._responder(200, {'status': 'running'}, {
+                'retry-after-ms': str(int(self.server.intervalo_polling * 1000))
+            })
+            return
+
+        with self.server.lock:
+            # Cada operación se entrega una vez; el cliente no vuelve a consultarla
+            self.server.operaciones.pop(coincidencia.group('id'), None)
+            documento = documento_rendibus(operacion['modelo'], self.server.azar, operacion['paginas'])
+        self._responder(200, {
+            'status': 'succeeded',
+            'createdDateTime': '2025-01-01T00:00:00Z',
+            'lastUpdatedDateTime': '2025-01-01T00:00:00Z',
+            'analyzeResult': documento,
+        })
+
+
+def iniciar_servidor(host='127.0.0.1', puerto=0, latencia=1.0, intervalo_polling=0.1,
+                     jitter=0.0, tasa_429=0.0, tasa_500=0.0, retry_after=0.5, semilla=None):
+    """
+    Iniciar el servidor falso en un hilo de fondo.
+
+    Args:
+        latencia: Segundos promedio hasta que el análisis termina
+        jitter: Variación uniforme (+/-) de la latencia, en segundos
+        tasa_429: Fracción de POST de análisis respondidos con 429
+        tasa_500: Fracción de POST de análisis respondidos con 500
+        retry_after: Espera sugerida en las respuestas 429 (s)
+        semilla: Semilla del generador, para corridas reproducibles
+
+    Returns:
+        Tupla (servidor, endpoint) con el endpoint listo para el cliente de Azure.
+        servidor.contadores lleva los análisis aceptados, las consultas de
+        polling y los errores inyectados.
+    """
+    servidor = ThreadingHTTPServer((host, puerto), FakeAzureHandler)
+    servidor.daemon_threads = True
+    servidor.lock = threading.Lock()
+    servidor.operaciones = {}
+    servidor.latencia = latencia
+    servidor.intervalo_polling = intervalo_polling
+    servidor.jitter = jitter
+    servidor.tasa_429 = tasa_429
+    servidor.tasa_500 = tasa_500
+    servidor.retry_after = retry_after
+    servidor.azar = random.Random(semilla)
+    servidor.contadores = {'analisis': 0, 'polling': 0, '429': 0, '500': 0}
+
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+
+    endpoint = f'http://{servidor.server_address[0]}:{servidor.server_address[1]}/'
+    return servidor, endpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor falso de Azure Form Recognizer')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--latencia', type=float, default=1.0, help='Segundos hasta que el análisis termina')
+    parser.add_argument('--intervalo-polling', type=float, default=0.1, help='retry-after sugerido (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Variación +/- de la latencia (s)')
+    parser.add_argument('--tasa-429', type=float, default=0.0, help='Fracción de análisis rechazados con 429')
+    parser.add_argument('--tasa-500', type=float, default=0.0, help='Fracción de análisis rechazados con 500')
+    parser.add_argument('--retry-after', type=float, default=0.5, help='Retry-After de las respuestas 429 (s)')
+    parser.add_argument('--semilla', type=int, default=None)
+    args = parser.parse_args()
+
+    servidor, endpoint = iniciar_servidor(
+        args.host, args.puerto, args.latencia, args.intervalo_polling,
+        jitter=args.jitter, tasa_429=args.tasa_429, tasa_500=args.tasa_500,
+        retry_after=args.retry_after, semilla=args.semilla
+    )
+    print(f"Fake Azure Form Recognizer escuchando en {endpoint}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 from decouple import config
 
@@ -44,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero: mide la petición completa, incluido el resto del middleware
+    'api.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -146,12 +150,126 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Cursor sobre (fecha_creacion, id); ?page= usa paginación por número de página
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PaginacionMixta',
     'PAGE_SIZE': 20,
 }
+PAGINACION_MAX_PAGE_SIZE = config('PAGINACION_MAX_PAGE_SIZE', default=200, cast=int)
 
 # Azure Form Recognizer configuration
 # Configurado para: https://azure-rendibus.cognitiveservices.azure.com/
 AZURE_FORM_RECOGNIZER_ENDPOINT = config('AZURE_FORM_RECOGNIZER_ENDPOINT', default='')
 AZURE_FORM_RECOGNIZER_KEY = config('AZURE_FORM_RECOGNIZER_KEY', default='')
 AZURE_FORM_RECOGNIZER_MODEL_ID = config('AZURE_FORM_RECOGNIZER_MODEL_ID', default='f99444d7-6fb9-459b-94c2-b6759350bc7c')
+
+# Cola de procesamiento (manage.py procesar_planillas)
+PROCESAMIENTO_HILOS = config('PROCESAMIENTO_HILOS', default=4, cast=int)
+PROCESAMIENTO_INTERVALO = config('PROCESAMIENTO_INTERVALO', default=2.0, cast=float)
+# Minutos tras los cuales un trabajo 'running' se considera abandonado
+PROCESAMIENTO_TIMEOUT_JOB = config('PROCESAMIENTO_TIMEOUT_JOB', default=15, cast=int)
+# Cada cuántos segundos un worker en marcha vuelve a liberar los trabajos vencidos
+PROCESAMIENTO_LIBERAR_CADA = config('PROCESAMIENTO_LIBERAR_CADA', default=60.0, cast=float)
+
+# Carga masiva (POST /api/planillas/bulk/)
+PLANILLAS_BULK_MAX_ARCHIVOS = config('PLANILLAS_BULK_MAX_ARCHIVOS', default=500, cast=int)
+
+# Cache de resultados de Azure por contenido de imagen (SHA-256 + model_id)
+CACHE_RESULTADOS_MAX_ENTRADAS = config('CACHE_RESULTADOS_MAX_ENTRADAS', default=10000, cast=int)
+CACHE_RESULTADOS_MAX_DIAS = config('CACHE_RESULTADOS_MAX_DIAS', default=90, cast=int)
+
+# Cliente asíncrono de Azure (vista procesar_con_azure_async bajo ASGI)
+AZURE_ASYNC_MAX_CONEXIONES = config('AZURE_ASYNC_MAX_CONEXIONES', default=100, cast=int)
+
+# Polling de los análisis (api/polling.py): esperas entre consultas en segundos,
+# la primera espera adaptativa según la duración reciente de los análisis
+AZURE_POLLING_INTERVALO_INICIAL = config('AZURE_POLLING_INTERVALO_INICIAL', default=0.25, cast=float)
+AZURE_POLLING_INTERVALO_MAXIMO = config('AZURE_POLLING_INTERVALO_MAXIMO', default=5.0, cast=float)
+AZURE_POLLING_ADAPTATIVO = config('AZURE_POLLING_ADAPTATIVO', default=True, cast=bool)
+# Peso de la última duración en el promedio móvil exponencial
+AZURE_POLLING_ALFA = config('AZURE_POLLING_ALFA', default=0.2, cast=float)
+# Segundos máximos de un análisis; pasado el plazo la planilla queda con error
+AZURE_ANALISIS_PLAZO = config('AZURE_ANALISIS_PLAZO', default=120.0, cast=float)
+
+# Límites compartidos por los procesos de la máquina (api/limites.py); 0 desactiva cada límite.
+# Envíos de análisis por segundo (dejar algo bajo la cuota del recurso) y ráfaga permitida
+AZURE_LIMITE_TPS = config('AZURE_LIMITE_TPS', default=12.0, cast=float)
+AZURE_LIMITE_RAFAGA = config('AZURE_LIMITE_RAFAGA', default=3.0, cast=float)
+# Análisis en curso simultáneos (envío + polling)
+AZURE_LIMITE_CONCURRENCIA = config('AZURE_LIMITE_CONCURRENCIA', default=20, cast=int)
+AZURE_LIMITE_DIRECTORIO = config(
+    'AZURE_LIMITE_DIRECTORIO', default=os.path.join(tempfile.gettempdir(), 'planilla_api_azure')
+)
+# Reintentos de envíos rechazados (429/5xx): espera base sin Retry-After y jitter agregado a Retry-After
+AZURE_REINTENTOS = config('AZURE_REINTENTOS', default=5, cast=int)
+AZURE_REINTENTO_BASE = config('AZURE_REINTENTO_BASE', default=1.0, cast=float)
+AZURE_REINTENTO_JITTER = config('AZURE_REINTENTO_JITTER', default=0.25, cast=float)
+
+# Pre-procesamiento de imágenes antes del OCR (pool de procesos)
+PREPROCESAMIENTO_ACTIVO = config('PREPROCESAMIENTO_ACTIVO', default=True, cast=bool)
+PREPROCESAMIENTO_PROCESOS = config('PREPROCESAMIENTO_PROCESOS', default=2, cast=int)
+PREPROCESAMIENTO_LADO_MAXIMO = config('PREPROCESAMIENTO_LADO_MAXIMO', default=2000, cast=int)
+PREPROCESAMIENTO_DPI = config('PREPROCESAMIENTO_DPI', default=200, cast=int)
+PREPROCESAMIENTO_CALIDAD_JPEG = config('PREPROCESAMIENTO_CALIDAD_JPEG', default=80, cast=int)
+# Segundos que el worker espera al pre-procesamiento en curso de la subida antes de repetirlo;
+# pasado ese plazo el reclamo se da por perdido y otra corrida puede tomarlo
+PREPROCESAMIENTO_ESPERA = config('PREPROCESAMIENTO_ESPERA', default=60.0, cast=float)
+
+# Validación de imágenes durante la subida (PlanillaUploadHandler)
+PLANILLAS_MAX_TAMANO_ARCHIVO = config('PLANILLAS_MAX_TAMANO_ARCHIVO', default=20 * 1024 * 1024, cast=int)
+PLANILLAS_MAX_PIXELES = config('PLANILLAS_MAX_PIXELES', default=50_000_000, cast=int)
+PLANILLAS_MIN_LADO = config('PLANILLAS_MIN_LADO', default=200, cast=int)
+
+# Lotes de planillas en un PDF o TIFF de varias páginas (/api/lotes/)
+LOTES_MAX_TAMANO_ARCHIVO = config('LOTES_MAX_TAMANO_ARCHIVO', default=200 * 1024 * 1024, cast=int)
+LOTES_MAX_PAGINAS = config('LOTES_MAX_PAGINAS', default=100, cast=int)
+# Segundos de plazo del análisis agregados por cada página del lote
+LOTES_PLAZO_POR_PAGINA = config('LOTES_PLAZO_POR_PAGINA', default=5.0, cast=float)
+# Resolución con que se rasterizan las páginas de los PDF (requiere pypdfium2)
+LOTES_DPI = config('LOTES_DPI', default=200, cast=int)
+# Margen agregado alrededor de cada planilla al recortarla, en fracción de la página
+LOTES_MARGEN_RECORTE = config('LOTES_MARGEN_RECORTE', default=0.01, cast=float)
+
+# Subida reanudable por chunks (/api/subidas/)
+SUBIDAS_TAMANO_CHUNK = config('SUBIDAS_TAMANO_CHUNK', default=256 * 1024, cast=int)
+SUBIDAS_TAMANO_CHUNK_MIN = 64 * 1024
+SUBIDAS_TAMANO_CHUNK_MAX = 8 * 1024 * 1024
+# Horas sin actividad tras las cuales una subida se considera abandonada
+SUBIDAS_EXPIRACION_HORAS = config('SUBIDAS_EXPIRACION_HORAS', default=48, cast=int)
+
+# Exportación en streaming (/api/planillas/export/): planillas leídas por consulta
+EXPORTACION_CHUNK_SIZE = config('EXPORTACION_CHUNK_SIZE', default=500, cast=int)
+
+# Snapshots Parquet para análisis (manage.py exportar_snapshot, /api/snapshots/)
+SNAPSHOTS_ROOT = config('SNAPSHOTS_ROOT', default=str(BASE_DIR / 'snapshots'))
+SNAPSHOTS_FILAS_POR_LOTE = config('SNAPSHOTS_FILAS_POR_LOTE', default=50000, cast=int)
+# Segundos antes de la marca de agua que un snapshot incremental vuelve a exportar,
+# para incluir planillas confirmadas tarde con una fecha_actualizacion anterior
+SNAPSHOTS_SOLAPE = config('SNAPSHOTS_SOLAPE', default=300, cast=int)
+
+# Miniaturas de planillas (MEDIA_ROOT/miniaturas/<lado>/), generadas al primer pedido
+MINIATURAS_TAMANOS = config(
+    'MINIATURAS_TAMANOS', default='160,480', cast=lambda v: [int(x) for x in v.split(',') if x.strip()]
+)
+MINIATURAS_CALIDAD_JPEG = config('MINIATURAS_CALIDAD_JPEG', default=75, cast=int)
+# Segundos de Cache-Control para miniaturas (su URL cambia si cambia el contenido)
+MINIATURAS_MAX_AGE = config('MINIATURAS_MAX_AGE', default=365 * 24 * 3600, cast=int)
+
+# Storage de Planilla.imagen: por contenido (planillas/ab/cd/<sha256>.jpg, sin duplicados)
+# o 'api.storage.AlmacenamientoPlanillas' para el directorio plano original
+PLANILLAS_STORAGE = config('PLANILLAS_STORAGE', default='api.storage.AlmacenamientoPorContenido')
+
+# Archivo en frío (manage.py archivar_planillas): imágenes de planillas completadas
+ARCHIVO_DIAS = config('ARCHIVO_DIAS', default=90, cast=int)
+ARCHIVO_MAX_POR_BUNDLE = config('ARCHIVO_MAX_POR_BUNDLE', default=1000, cast=int)
+
+# Entrega de media (api/medios.py): '' sirve desde Django (FileResponse con Range),
+# 'x-accel-redirect' (nginx) o 'x-sendfile' (Apache/lighttpd) delegan al proxy
+MEDIA_SERVIDOR_PROXY = config('MEDIA_SERVIDOR_PROXY', default='')
+# Prefijo de la location interna de nginx que apunta a MEDIA_ROOT
+MEDIA_PREFIJO_INTERNO = config('MEDIA_PREFIJO_INTERNO', default='/media-interno/')
+# Segundos de Cache-Control privado para imágenes de planillas
+MEDIA_MAX_AGE = config('MEDIA_MAX_AGE', default=3600, cast=int)
+
+# Re-extracción desde resultados crudos (manage.py reextraer)
+REEXTRAER_PROCESOS = config('REEXTRAER_PROCESOS', default=4, cast=int)
+REEXTRAER_LOTE = config('REEXTRAER_LOTE', default=200, cast=int)
@@ -15,15 +15,20 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from api.views import imagen_protegida, metricas_prometheus
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metricas_prometheus, name='metricas'),
+    # Imágenes de planillas: vista protegida también en producción (ver api/medios.py)
+    re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<nombre>planillas/.+)$", imagen_protegida, name='imagen-protegida'),
 ]
 
-# Servir archivos media en desarrollo
+# Servir el resto de los archivos media en desarrollo
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)